@@ -0,0 +1,297 @@
+import os
+import re
+import argparse
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from can_message_processor import CANMessageProcessor, SERVO
+from can_stream_writer import StreamingCSVWriter
+
+# Summary tiers
+WINDOWS = (0.01, 0.1, 1.0)  # Seconds; every window must be a whole multiple of the previous one
+FIELDS = ('current', 'velocity', 'position')
+OUTPUT_DIR = 'summary_output'
+BATCH_SIZE = 10000  # Frames decoded per batch when summarizing a recorded log
+SUMMARY_PATTERN = re.compile(r'_summary_(\d+(?:\.\d+)?)(ms|s)\.csv$')
+
+# Mergeable aggregate of one module over one window; window is the index floor(timestamp / length)
+AGGREGATE_DTYPE = np.dtype(
+    [('module_id', '<u2'), ('window', '<i8'), ('count', '<u4')]
+    + [(f'{field}_{stat}', dtype) for field in FIELDS
+       for stat, dtype in (('min', '<i4'), ('max', '<i4'), ('mean', '<f8'), ('m2', '<f8'))]
+    + [('error_count', '<u4'), ('error_bits', '<u2')]
+)
+# Columns of the summary CSV files: the window start time and the standard deviation instead of the index and M2
+CSV_DTYPE = np.dtype(
+    [('module_id', '<u2'), ('start', '<f8'), ('count', '<u4')]
+    + [(f'{field}_{stat}', dtype) for field in FIELDS
+       for stat, dtype in (('min', '<i4'), ('max', '<i4'), ('mean', '<f8'), ('std', '<f8'))]
+    + [('error_count', '<u4'), ('error_bits', '<u2')]
+)
+CSV_FORMAT = ','.join(['%d', '%.6f', '%d'] + ['%d', '%d', '%.10g', '%.10g'] * len(FIELDS) + ['%d', '%d'])
+
+def format_window(window: float) -> str:
+    """File label of a window length: 0.01 -> '10ms', 1.0 -> '1s'."""
+    return f'{window * 1000:g}ms' if window < 1 else f'{window:g}s'
+
+def parse_window(label: str) -> float:
+    value, unit = re.fullmatch(r'(\d+(?:\.\d+)?)(ms|s)', label).groups()
+    return float(value) / 1000 if unit == 'ms' else float(value)
+
+def aggregate_records(module_id: int, rows: np.ndarray, window: float) -> np.ndarray:
+    """Aggregate servo rows (SERVO_DTYPE) of one module into one row per window, vectorized."""
+    if not len(rows):
+        return np.empty(0, dtype=AGGREGATE_DTYPE)
+    windows = np.floor_divide(rows['timestamp'], window).astype(np.int64)
+    if np.any(windows[1:] < windows[:-1]):
+        order = np.argsort(windows, kind='stable')
+        rows, windows = rows[order], windows[order]
+    starts = np.flatnonzero(np.diff(windows, prepend=windows[0] - 1))
+    counts = np.diff(np.append(starts, len(windows)))
+    aggregates = np.zeros(len(starts), dtype=AGGREGATE_DTYPE)
+    aggregates['module_id'] = module_id
+    aggregates['window'] = windows[starts]
+    aggregates['count'] = counts
+    for field in FIELDS:
+        values = rows[field]
+        aggregates[f'{field}_min'] = np.minimum.reduceat(values, starts)
+        aggregates[f'{field}_max'] = np.maximum.reduceat(values, starts)
+        values = values.astype(np.float64)
+        mean = np.add.reduceat(values, starts) / counts
+        aggregates[f'{field}_mean'] = mean
+        aggregates[f'{field}_m2'] = np.add.reduceat((values - np.repeat(mean, counts)) ** 2, starts)
+    errors = rows['error']
+    aggregates['error_count'] = np.add.reduceat((errors != 0).astype(np.uint32), starts)
+    aggregates['error_bits'] = np.bitwise_or.reduceat(errors, starts)
+    return aggregates
+
+def merge_aggregates(aggregates: np.ndarray, ratio: int = 1) -> np.ndarray:
+    """
+    Combine aggregates into windows ratio times longer, one row per module and window.
+
+    Means and M2 are combined with the parallel form of Welford's algorithm (Chan et al.),
+    so the result equals aggregating the raw rows over the longer windows.
+    """
+    if not len(aggregates):
+        return aggregates
+    windows = aggregates['window'] // ratio
+    order = np.lexsort((windows, aggregates['module_id']))
+    aggregates, windows = aggregates[order], windows[order]
+    modules = aggregates['module_id']
+    starts = np.flatnonzero((np.diff(windows, prepend=windows[0] - 1) != 0)
+                            | (np.diff(modules.astype(np.int64), prepend=-1) != 0))
+    counts = aggregates['count'].astype(np.float64)
+    total = np.add.reduceat(counts, starts)
+    merged = np.zeros(len(starts), dtype=AGGREGATE_DTYPE)
+    merged['module_id'] = modules[starts]
+    merged['window'] = windows[starts]
+    merged['count'] = total
+    lengths = np.diff(np.append(starts, len(aggregates)))
+    for field in FIELDS:
+        merged[f'{field}_min'] = np.minimum.reduceat(aggregates[f'{field}_min'], starts)
+        merged[f'{field}_max'] = np.maximum.reduceat(aggregates[f'{field}_max'], starts)
+        means = aggregates[f'{field}_mean']
+        mean = np.add.reduceat(counts * means, starts) / total
+        merged[f'{field}_mean'] = mean
+        merged[f'{field}_m2'] = np.add.reduceat(
+            aggregates[f'{field}_m2'] + counts * (means - np.repeat(mean, lengths)) ** 2, starts)
+    merged['error_count'] = np.add.reduceat(aggregates['error_count'], starts)
+    merged['error_bits'] = np.bitwise_or.reduceat(aggregates['error_bits'], starts)
+    return merged
+
+class WindowAggregator:
+    """
+    One summary tier: merges incoming aggregates into its window length and returns the
+    windows that are complete.
+
+    The newest window of each module stays open until a later window of any module shows
+    that no more records can fall into it (records arrive in time order).
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self.open = np.empty(0, dtype=AGGREGATE_DTYPE)
+        self.latest: Optional[int] = None  # Newest window index seen
+
+    def add(self, aggregates: np.ndarray, ratio: int = 1) -> np.ndarray:
+        """
+        :param aggregates: Rows with windows ratio times shorter than this tier's
+        :return: Closed windows of this tier, ordered by module and window
+        """
+        if not len(aggregates):
+            return aggregates[:0]
+        if ratio != 1:
+            aggregates = aggregates.copy()
+            aggregates['window'] //= ratio
+        merged = merge_aggregates(np.concatenate((self.open, aggregates)))
+        modules = merged['module_id']
+        newest = int(merged['window'].max())
+        self.latest = newest if self.latest is None else max(self.latest, newest)
+        last_of_module = np.append(modules[1:] != modules[:-1], True)
+        still_open = last_of_module & (merged['window'] >= self.latest - 1)
+        self.open = merged[still_open]
+        return merged[~still_open]
+
+    def finish(self) -> np.ndarray:
+        """Close and return the open windows."""
+        closed, self.open = self.open, np.empty(0, dtype=AGGREGATE_DTYPE)
+        return closed
+
+def to_csv_rows(aggregates: np.ndarray, window: float) -> np.ndarray:
+    rows = np.zeros(len(aggregates), dtype=CSV_DTYPE)
+    for name in CSV_DTYPE.names:
+        if name in AGGREGATE_DTYPE.names:
+            rows[name] = aggregates[name]
+    rows['start'] = aggregates['window'] * window
+    for field in FIELDS:
+        rows[f'{field}_std'] = np.sqrt(aggregates[f'{field}_m2'] / np.maximum(aggregates['count'] - 1.0, 1))
+    return rows
+
+def from_csv_rows(rows: np.ndarray, window: float) -> np.ndarray:
+    aggregates = np.zeros(len(rows), dtype=AGGREGATE_DTYPE)
+    for name in AGGREGATE_DTYPE.names:
+        if name in CSV_DTYPE.names:
+            aggregates[name] = rows[name]
+    aggregates['window'] = np.round(rows['start'] / window).astype(np.int64)
+    for field in FIELDS:
+        aggregates[f'{field}_m2'] = rows[f'{field}_std'] ** 2 * np.maximum(rows['count'] - 1.0, 0)
+    return aggregates
+
+def load_summary(path: str) -> Tuple[np.ndarray, float]:
+    """Read a summary CSV file back into aggregates; returns (aggregates, window length)."""
+    match = SUMMARY_PATTERN.search(path)
+    if match is None:
+        raise ValueError(f"{path} is not a summary file (expected *_summary_<window>.csv)")
+    window = parse_window(match.group(1) + match.group(2))
+    rows = np.loadtxt(path, delimiter=',', skiprows=1, dtype=CSV_DTYPE, ndmin=1)
+    return from_csv_rows(rows, window), window
+
+class SummaryLog:
+    """
+    Streaming per-module summaries of the servo records in several tiers, written as
+    <output_dir>/<name>_summary_<window>.csv.
+
+    Only the finest tier is computed from records; each coarser tier merges the closed
+    windows of the one below it. Accepts the chunks of CANMessageProcessor.drain(), so it
+    can be attached to a StreamingCSVWriter (summary=...) next to any raw format.
+    """
+
+    def __init__(self, output_dir: str, name: str, windows: Sequence[float] = WINDOWS):
+        windows = sorted(windows)
+        self.ratios = [1]
+        for finer, coarser in zip(windows, windows[1:]):
+            ratio = round(coarser / finer)
+            if ratio < 1 or abs(ratio * finer - coarser) > 1e-9 * coarser:
+                raise ValueError(f"Window {coarser:g}s is not a multiple of {finer:g}s")
+            self.ratios.append(ratio)
+        self.tiers = [WindowAggregator(window) for window in windows]
+        os.makedirs(output_dir, exist_ok=True)
+        self.paths = [os.path.join(output_dir, f'{name}_summary_{format_window(window)}.csv') for window in windows]
+        self.files = [open(path, 'w') for path in self.paths]
+        for f in self.files:
+            f.write(','.join(CSV_DTYPE.names) + '\n')
+        self.rows = [0] * len(windows)
+        self.records = 0
+
+    def add_records(self, records: Dict[int, np.ndarray]):
+        """
+        Add servo rows per module covering the same time span.
+
+        All modules go into the tiers together: a later window of one module closes the open
+        windows of the others.
+        """
+        window = self.tiers[0].window
+        aggregates = [aggregate_records(module_id, rows, window) for module_id, rows in records.items()]
+        self.records += sum(len(rows) for rows in records.values())
+        if aggregates:
+            self.add_aggregates(np.concatenate(aggregates))
+
+    def add_aggregates(self, aggregates: np.ndarray):
+        """Add aggregates with the window length of the finest tier."""
+        for index, (tier, ratio) in enumerate(zip(self.tiers, self.ratios)):
+            aggregates = tier.add(aggregates, ratio)
+            self._write(index, aggregates)
+
+    def write_chunk(self, chunk: Tuple[Dict[int, np.ndarray], Dict[int, np.ndarray]]):
+        """Add one chunk returned by CANMessageProcessor.drain(); command rows are not summarized."""
+        self.add_records(chunk[1])
+
+    def _write(self, index: int, aggregates: np.ndarray):
+        if len(aggregates):
+            np.savetxt(self.files[index], to_csv_rows(aggregates, self.tiers[index].window), fmt=CSV_FORMAT)
+            self.rows[index] += len(aggregates)
+
+    def close(self):
+        closed = np.empty(0, dtype=AGGREGATE_DTYPE)
+        for index, (tier, ratio) in enumerate(zip(self.tiers, self.ratios)):
+            closed = np.concatenate((tier.add(closed, ratio), tier.finish()))
+            self._write(index, closed)
+        for f in self.files:
+            f.close()
+        print_summary_files(self)
+
+class StreamingSummaryWriter(StreamingCSVWriter):
+    """StreamingCSVWriter that keeps only its summary (a SummaryLog) and writes no raw records."""
+
+    def _write(self, kind: str, module_id: int, rows: np.ndarray):
+        self.written_frames += len(rows)
+
+def print_summary_files(log: SummaryLog):
+    print(f"Summarized {log.records} servo records:")
+    for path, rows in zip(log.paths, log.rows):
+        print(f"  {path}: {rows} windows, {os.path.getsize(path)} bytes")
+
+def save_summary(processor: CANMessageProcessor, output_dir: str = 'output', windows: Sequence[float] = WINDOWS):
+    """Summarize all servo records held by a processor."""
+    log = SummaryLog(output_dir, str(processor.start_time), windows)
+    log.add_records({module_id: responses.view() for module_id, responses in processor.servo_responses.items()})
+    log.close()
+
+def summarize_log(path: str, output_dir: str, windows: Sequence[float] = WINDOWS, batch_size: int = BATCH_SIZE):
+    """Summarize a recorded log (candump -L, ASC, BLF, ...) in batches with bounded memory."""
+    from can_replay import iter_log_frames
+    processor = CANMessageProcessor()
+    log = SummaryLog(output_dir, os.path.splitext(os.path.basename(path))[0], windows)
+    servos = []
+    for frame in iter_log_frames(path):
+        if frame.arbitration_id & SERVO.mask == SERVO.base_id:
+            servos.append(frame)
+            if len(servos) >= batch_size:
+                processor.process_servo_batch(servos)
+                servos.clear()
+                log.write_chunk(processor.drain())
+    if servos:
+        processor.process_servo_batch(servos)
+    log.write_chunk(processor.drain())
+    log.close()
+
+def resummarize(path: str, output_dir: str, windows: Sequence[float]):
+    """Build coarser tiers from an existing summary file without the raw records."""
+    aggregates, window = load_summary(path)
+    if any(coarser < window for coarser in windows):
+        raise ValueError(f"Windows must not be shorter than the {format_window(window)} of {path}")
+    name = SUMMARY_PATTERN.sub('', os.path.basename(path))
+    log = SummaryLog(output_dir, name, [window] + [coarser for coarser in windows if coarser > window])
+    # The input tier is written again unchanged, which keeps the ratios relative to it
+    log.add_aggregates(aggregates)
+    log.records = int(aggregates['count'].sum())
+    log.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Per-module windowed summaries (min/max/mean/std, error counts) of servo records.')
+    parser.add_argument('path', help='Recorded log, or a *_summary_<window>.csv file to build coarser tiers from')
+    parser.add_argument('--windows', default=','.join(f'{window:g}' for window in WINDOWS),
+                        help='Comma separated window lengths in seconds')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    args = parser.parse_args(argv)
+
+    windows = [float(window) for window in args.windows.split(',') if window.strip()]
+    if SUMMARY_PATTERN.search(args.path):
+        resummarize(args.path, args.output_dir, windows)
+    else:
+        summarize_log(args.path, args.output_dir, windows)
+
+if __name__ == "__main__":
+    main()
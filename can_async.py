@@ -0,0 +1,284 @@
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import can
+
+from can_message_processor import CANMessageProcessor, COMMAND, SERVO
+from can_stream_writer import StreamingCSVWriter, FLUSH_FRAMES, FLUSH_INTERVAL
+
+# Pipeline settings
+QUEUE_SIZE = 64  # Batches waiting per consumer before the reader waits for it
+BATCH_SIZE = 256  # Frames taken from the reader buffer per batch
+MAX_BACKLOG = 500_000  # Frames buffered by the reader before the oldest are dropped
+REPORT_INTERVAL = 5.0  # Seconds between status lines
+CAN_CHANNELS = 'can0'
+OUTPUT_DIR = 'can_output'
+
+COMMAND_ID_BASE = COMMAND.base_id
+CONTROL_RESPONSE_ID_BASE = SERVO.base_id
+ID_BASE_MASK = SERVO.mask
+
+class PipelineStats:
+    def __init__(self):
+        self.frames = 0
+        self.batches = 0
+        self.error_frames = 0
+        self.dropped_frames = 0
+
+class Consumer:
+    """
+    One pipeline stage, run as its own task behind a bounded asyncio queue.
+
+    handle() receives batches of can.Message. When flush_interval is set, flush() is also
+    called after that many seconds without input.
+    """
+
+    name = 'consumer'
+    flush_interval: Optional[float] = None
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.frames = 0
+
+    async def run(self):
+        while True:
+            try:
+                if self.flush_interval:
+                    frames = await asyncio.wait_for(self.queue.get(), self.flush_interval)
+                else:
+                    frames = await self.queue.get()
+            except asyncio.TimeoutError:
+                await self.flush()
+                continue
+            if frames is None:
+                break
+            self.frames += len(frames)
+            try:
+                await self.handle(frames)
+            except Exception as e:
+                print(f"Error in consumer '{self.name}': {e}")
+        await self.close()
+
+    async def handle(self, frames: List):
+        raise NotImplementedError
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        pass
+
+class PluginConsumer(Consumer):
+    """Run a can_fanout analyzer plugin (frequency, compare, latency, ...) on the event loop."""
+
+    def __init__(self, plugin, queue_size: int = QUEUE_SIZE):
+        super().__init__(queue_size)
+        self.plugin = plugin
+        self.name = plugin.name
+        self.decoder = None
+        if plugin.decodes:
+            from can_schema import default_decoder
+            self.decoder = default_decoder()
+
+    async def handle(self, frames: List):
+        decoded = None
+        if self.decoder is not None:
+            decode = self.decoder.decode
+            decoded = [decode(frame.arbitration_id, frame.data) for frame in frames]
+        self.plugin.handle(frames, decoded)
+
+    async def close(self):
+        self.plugin.close()
+
+class LogConsumer(Consumer):
+    """
+    Decode command and servo frames in batches and append them to per-module CSV files.
+
+    Chunks are written on a single-thread executor so that decoding continues during disk
+    I/O. At most one write is in flight: if the disk falls behind, handle() waits for it,
+    the queue fills up and the reader waits in turn.
+    """
+
+    name = 'log'
+
+    def __init__(self, output_dir: str = OUTPUT_DIR, flush_frames: int = FLUSH_FRAMES,
+                 flush_interval: float = FLUSH_INTERVAL, queue_size: int = QUEUE_SIZE):
+        super().__init__(queue_size)
+        self.processor = CANMessageProcessor()
+        self.writer = StreamingCSVWriter(self.processor, output_dir, threaded=False)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='csv-writer')
+        self.flush_frames = flush_frames
+        self.flush_interval = flush_interval
+        self.pending_frames = 0
+        self.last_flush_time = time.monotonic()
+        self.write: Optional[asyncio.Future] = None
+
+    async def handle(self, frames: List):
+        commands = [frame for frame in frames if frame.arbitration_id & ID_BASE_MASK == COMMAND_ID_BASE]
+        servos = [frame for frame in frames if frame.arbitration_id & ID_BASE_MASK == CONTROL_RESPONSE_ID_BASE]
+        if commands:
+            self.processor.process_command_batch(commands)
+        if servos:
+            self.processor.process_servo_batch(servos)
+        self.pending_frames += len(commands) + len(servos)
+        if (self.pending_frames >= self.flush_frames
+                or time.monotonic() - self.last_flush_time >= self.flush_interval):
+            await self.flush()
+
+    async def flush(self):
+        if self.write is not None:
+            await self.write
+            self.write = None
+        self.pending_frames = 0
+        self.last_flush_time = time.monotonic()
+        chunk = self.processor.drain()
+        if chunk[0] or chunk[1]:
+            self.write = asyncio.get_running_loop().run_in_executor(self.executor, self.writer.write_chunk, chunk)
+
+    async def close(self):
+        if self.write is not None:
+            await self.write
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.writer.close)
+        self.executor.shutdown()
+
+async def read_frames(reader: can.AsyncBufferedReader, consumers: List[Consumer], stats: PipelineStats,
+                      batch_size: int = BATCH_SIZE, max_backlog: int = MAX_BACKLOG):
+    """
+    Move frames from the Notifier's reader into every consumer queue in batches until a None
+    sentinel is read.
+
+    A full consumer queue makes the reader wait, so the backlog collects in the reader
+    buffer; beyond max_backlog frames the oldest are dropped and counted.
+    """
+    buffer = reader.buffer
+    running = True
+    while running:
+        message = await reader.get_message()
+        batch = []
+        while True:
+            if message is None:
+                running = False
+                break
+            if message.is_error_frame:
+                stats.error_frames += 1
+            else:
+                batch.append(message)
+            if len(batch) >= batch_size or buffer.empty():
+                break
+            message = buffer.get_nowait()
+
+        backlog = buffer.qsize()
+        if backlog > max_backlog:
+            for _ in range(backlog - max_backlog):
+                if buffer.get_nowait() is None:
+                    running = False
+                    break
+                stats.dropped_frames += 1
+
+        if batch:
+            stats.frames += len(batch)
+            stats.batches += 1
+            for consumer in consumers:
+                await consumer.queue.put(batch)
+
+async def report(reader: can.AsyncBufferedReader, consumers: List[Consumer], stats: PipelineStats,
+                 interval: float = REPORT_INTERVAL):
+    last_frames = 0
+    last_time = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        rate = (stats.frames - last_frames) / (now - last_time)
+        last_frames, last_time = stats.frames, now
+        queues = ", ".join(f"{consumer.name} {consumer.queue.qsize()}/{consumer.queue.maxsize}"
+                           for consumer in consumers)
+        print(f"[pipeline] {stats.frames} frames ({rate:.0f}/s), backlog {reader.buffer.qsize()}, "
+              f"dropped {stats.dropped_frames}, error frames {stats.error_frames} | queues: {queues}")
+
+async def run_pipeline(buses: List[can.BusABC], consumers: List[Consumer], duration: Optional[float] = None,
+                       batch_size: int = BATCH_SIZE, report_interval: float = REPORT_INTERVAL) -> PipelineStats:
+    """
+    Receive from several buses in one event loop and feed every consumer.
+
+    Buses with a file descriptor (SocketCAN) are watched by the event loop itself, so no
+    receive thread is involved. Runs until duration has passed or the task is cancelled.
+    """
+    stats = PipelineStats()
+    reader = can.AsyncBufferedReader()
+    notifier = can.Notifier(buses, [reader], loop=asyncio.get_running_loop())
+    consumer_tasks = [asyncio.create_task(consumer.run(), name=consumer.name) for consumer in consumers]
+    reader_task = asyncio.create_task(read_frames(reader, consumers, stats, batch_size), name='reader')
+    report_task = asyncio.create_task(report(reader, consumers, stats, report_interval), name='report')
+    try:
+        if duration is not None:
+            await asyncio.sleep(duration)
+        else:
+            await reader_task
+    finally:
+        notifier.stop()
+        # Frames still buffered are delivered before the consumers stop
+        reader.buffer.put_nowait(None)
+        await reader_task
+        report_task.cancel()
+        for consumer in consumers:
+            await consumer.queue.put(None)
+        await asyncio.gather(*consumer_tasks)
+        print(f"[pipeline] {stats.frames} frames in {stats.batches} batches, dropped {stats.dropped_frames}")
+    return stats
+
+def open_buses(channels: List[str], interface: str) -> List[can.BusABC]:
+    buses = []
+    for channel in channels:
+        if interface == 'socketcan':
+            from canfd_handler import setup_can_interface
+            bus = setup_can_interface(channel)
+        else:
+            bus = can.Bus(interface=interface, channel=channel)
+        if bus is not None:
+            buses.append(bus)
+    return buses
+
+def main(argv=None):
+    from can_fanout import PLUGINS
+    plugin_names = [name for name in PLUGINS if name not in ('log', 'plot')]
+    parser = argparse.ArgumentParser(description='Receive one or more CAN buses with asyncio and run logging and '
+                                                 'analyzers as cooperating tasks.')
+    parser.add_argument('--channels', default=CAN_CHANNELS, help='Comma separated, e.g. can0,can1')
+    parser.add_argument('--interface', default='socketcan', help="python-can interface, e.g. 'virtual' for testing")
+    parser.add_argument('--plugins', default='latency', help=f"Comma separated, from: {', '.join(plugin_names)}")
+    parser.add_argument('--no-log', action='store_true', help='Do not write CSV files')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--duration', type=float, default=None, help='Seconds to run (default: until Ctrl+C)')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help='Batches buffered per consumer')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--report-interval', type=float, default=REPORT_INTERVAL, help='Seconds')
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.plugins.split(',') if name.strip()]
+    unknown = [name for name in names if name not in plugin_names]
+    if unknown:
+        parser.error(f"Unknown plugins: {', '.join(unknown)}")
+
+    buses = open_buses([channel.strip() for channel in args.channels.split(',')], args.interface)
+    if not buses:
+        return
+
+    async def run():
+        consumers: List[Consumer] = [PluginConsumer(PLUGINS[name](), args.queue_size) for name in names]
+        if not args.no_log:
+            consumers.append(LogConsumer(args.output_dir, queue_size=args.queue_size))
+        await run_pipeline(buses, consumers, args.duration, args.batch_size, args.report_interval)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("\nProgram terminated by user.")
+    finally:
+        for bus in buses:
+            bus.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import threading
+import subprocess
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from candump_log import format_candump_line
+from can_traffic import TrafficConfig, generate_frames, send_frames, open_bus, \
+    parse_args as parse_traffic_args, config_from_args
+
+DURATION = 5.0  # Seconds of generated traffic per offline benchmark
+BUS_DURATION = 3.0  # Seconds of real-time traffic for the bus benchmark
+BATCH_SIZE = 1000
+PLOT_UPDATE_RATE = 20  # Plot redraws per second of traffic
+DEFAULT_TOLERANCE = 0.2  # Allowed throughput loss against a baseline
+STARTUP_REPEAT = 5  # Fresh interpreters per command; the fastest run is reported
+STARTUP_SLACK = 0.02  # Seconds of startup noise tolerated on top of the relative tolerance
+
+class Workload:
+    """Generated traffic as frames and as `candump -L` text chunks."""
+
+    def __init__(self, config: TrafficConfig, duration: float):
+        self.config = config
+        self.duration = duration
+        self.frames = list(generate_frames(config, duration, start_time=1_000_000.0))
+        text = ''.join(format_candump_line(frame.timestamp, frame.channel, frame.arbitration_id, frame.data,
+                                           frame.is_fd, frame.is_extended_id, fd_flags=1) + '\n'
+                       for frame in self.frames).encode()
+        chunk_size = 1 << 20
+        self.chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] + [b'']
+
+def bench_processor_message(workload: Workload) -> Callable[[], Dict]:
+    from can_message_processor import CANMessageProcessor, COMMAND, SERVO, ID_BASE_MASK
+    processor = CANMessageProcessor()
+
+    def run():
+        for frame in workload.frames:
+            base = frame.arbitration_id & ID_BASE_MASK
+            if base == COMMAND.base_id:
+                processor.process_command_message(frame)
+            elif base == SERVO.base_id:
+                processor.process_servo_message(frame)
+        return {'stored_bytes': processor.memory_usage()}
+    return run
+
+def bench_processor_batch(workload: Workload) -> Callable[[], Dict]:
+    from can_message_processor import CANMessageProcessor, COMMAND, SERVO, ID_BASE_MASK
+    processor = CANMessageProcessor()
+    frames = workload.frames
+
+    def run():
+        for start in range(0, len(frames), BATCH_SIZE):
+            batch = frames[start:start + BATCH_SIZE]
+            processor.process_command_batch([frame for frame in batch if frame.arbitration_id & ID_BASE_MASK == COMMAND.base_id])
+            processor.process_servo_batch([frame for frame in batch if frame.arbitration_id & ID_BASE_MASK == SERVO.base_id])
+        return {'stored_bytes': processor.memory_usage()}
+    return run
+
+def bench_schema_decode(workload: Workload) -> Callable[[], Dict]:
+    from can_schema import default_decoder
+    decoder = default_decoder()
+
+    def run():
+        decode = decoder.decode
+        decoded = 0
+        for frame in workload.frames:
+            if decode(frame.arbitration_id, frame.data) is not None:
+                decoded += 1
+        return {'decoded': decoded}
+    return run
+
+def bench_schema_batch(workload: Workload) -> Callable[[], Dict]:
+    from can_schema import default_decoder
+    decoder = default_decoder()
+    frames = workload.frames
+    decoder.decode_batch(frames[:BATCH_SIZE])  # Imports NumPy and builds the dtypes outside the timed part
+
+    def run():
+        decoded = 0
+        for start in range(0, len(frames), BATCH_SIZE):
+            for arbitration_ids, timestamps, rows in decoder.decode_batch(frames[start:start + BATCH_SIZE]).values():
+                decoded += len(rows)
+        return {'decoded': decoded}
+    return run
+
+def bench_frequency(workload: Workload) -> Callable[[], Dict]:
+    from can_frequency import calculate_average_interval
+
+    def run():
+        calculate_average_interval(iter(workload.chunks))
+        return {}
+    return run
+
+def bench_compare(workload: Workload) -> Callable[[], Dict]:
+    from can_message_comparison import compare_messages
+
+    def run():
+        compare_messages(iter(workload.chunks))
+        return {}
+    return run
+
+def bench_latency(workload: Workload) -> Callable[[], Dict]:
+    from can_latency import track_latency
+
+    def run():
+        track_latency(workload.frames)
+        return {}
+    return run
+
+def bench_plotter(workload: Workload) -> Callable[[], Dict]:
+    import matplotlib
+    matplotlib.use('Agg')
+    from canfd_plot import CANPlotter
+    plotter = CANPlotter()
+    plotter.fig.canvas.draw()
+    redraw_every = max(1, int(len(workload.frames) / workload.duration / PLOT_UPDATE_RATE))
+
+    def run():
+        redraws = 0
+        for index, frame in enumerate(workload.frames):
+            plotter.handle_message(frame)
+            if index % redraw_every == 0:
+                plotter.update_plot(index)
+                redraws += 1
+        return {'redraws': redraws}
+    return run
+
+def bench_fanout(workload: Workload) -> Callable[[], Dict]:
+    from can_fanout import FanOut, PLUGINS
+    fanout = FanOut()
+    for name in ('frequency', 'compare', 'latency'):
+        fanout.register(PLUGINS[name]())
+
+    def run():
+        for frame in workload.frames:
+            fanout.dispatch(frame)
+        fanout.flush()
+        dropped = sum(runner.dropped_frames for runner in fanout.runners)
+        fanout.close()  # Waits until every plugin has handled its queue
+        return {'dropped': dropped, 'delivered': len(workload.frames) * len(fanout.runners)}
+    return run
+
+def bench_bus(workload: Workload, bus_spec: str) -> Callable[[], Dict]:
+    """Send the traffic in real time on one bus and receive it on another through BatchReceiver."""
+    from can_receiver import BatchReceiver
+    from can_message_processor import CANMessageProcessor, COMMAND, SERVO, ID_BASE_MASK
+    sender = open_bus(bus_spec)
+    receiver_bus = open_bus(bus_spec)
+    receiver = BatchReceiver(receiver_bus)
+    processor = CANMessageProcessor()
+
+    def run():
+        sent = []
+        thread = threading.Thread(target=lambda: sent.append(send_frames(sender, iter(workload.frames))))
+        thread.start()
+        received = 0
+        idle_since = None
+        while True:
+            frames = receiver.recv_batch(0.1)
+            if frames:
+                idle_since = None
+                received += len(frames)
+                processor.process_command_batch([frame for frame in frames
+                                                 if frame.arbitration_id & ID_BASE_MASK == COMMAND.base_id])
+                processor.process_servo_batch([frame for frame in frames
+                                               if frame.arbitration_id & ID_BASE_MASK == SERVO.base_id])
+            elif not thread.is_alive():
+                idle_since = idle_since or time.monotonic()
+                if time.monotonic() - idle_since > 0.5:
+                    break
+        thread.join()
+        sender.shutdown()
+        receiver_bus.shutdown()
+        sent_count = sent[0] if sent else 0
+        result = {'sent': sent_count, 'received': received, 'dropped': max(0, sent_count - received),
+                  'delivered': sent_count}
+        result.update({f'receiver_{key}': value for key, value in receiver.stats.as_dict().items()})
+        return result
+    return run
+
+# Component name -> setup function returning the timed part (imports and setup are not measured)
+BENCHMARKS: Dict[str, Callable[[Workload], Callable[[], Dict]]] = {
+    'processor_message': bench_processor_message,
+    'processor_batch': bench_processor_batch,
+    'schema_decode': bench_schema_decode,
+    'schema_batch': bench_schema_batch,
+    'frequency': bench_frequency,
+    'compare': bench_compare,
+    'latency': bench_latency,
+    'plotter': bench_plotter,
+    'fanout': bench_fanout,
+}
+
+def max_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_benchmark(name: str, config: TrafficConfig, duration: float, bus_spec: Optional[str] = None) -> Dict:
+    """Run one component benchmark. Runs in a fresh worker process so memory figures are not shared."""
+    workload = Workload(config, duration)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        run = bench_bus(workload, bus_spec) if name == 'bus' else BENCHMARKS[name](workload)
+        rss_before = max_rss_kb()
+        start = time.perf_counter()
+        extra = run()
+        seconds = time.perf_counter() - start
+    frames = len(workload.frames)
+    traffic_rate = frames / duration
+    frames_per_sec = frames / seconds if seconds > 0 else float('inf')
+    dropped = extra.pop('dropped', 0)
+    delivered = extra.pop('delivered', frames)
+    result = {
+        'component': name,
+        'frames': frames,
+        'seconds': round(seconds, 6),
+        'frames_per_sec': round(frames_per_sec, 1),
+        'us_per_frame': round(seconds / frames * 1e6, 3) if frames else None,
+        # Multiple of the generated traffic rate the component sustains (>= 1 keeps up)
+        'realtime_factor': round(frames_per_sec / traffic_rate, 2) if name != 'bus' else None,
+        'rss_growth_kb': max_rss_kb() - rss_before,
+        'dropped': dropped,
+        'drop_rate': round(dropped / delivered, 6) if delivered else 0.0,
+    }
+    result.update(extra)
+    return result
+
+def measure_startup(command: Optional[str], repeat: int = STARTUP_REPEAT) -> Dict:
+    """
+    Time a fresh interpreter importing a can-analysis subcommand, and record which heavy
+    modules the import loaded. command=None measures the bare interpreter for reference.
+    """
+    code = ("import json, can_cli; can_cli.load(%r); print(json.dumps(can_cli.heavy_imports()))" % command
+            if command else "print('[]')")
+    directory = os.path.dirname(os.path.abspath(__file__))
+    seconds = []
+    output = '[]'
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], cwd=directory, capture_output=True, text=True,
+                                check=True).stdout
+        seconds.append(time.perf_counter() - start)
+    heavy = json.loads(output)
+    if command is None:
+        return {'command': 'python', 'seconds': round(min(seconds), 4), 'heavy_imports': heavy, 'unexpected_imports': []}
+    from can_cli import COMMANDS
+    allowed = COMMANDS[command][2]
+    return {'command': command, 'seconds': round(min(seconds), 4), 'heavy_imports': heavy,
+            'unexpected_imports': [name for name in heavy if name not in allowed]}
+
+def run_startup(repeat: int = STARTUP_REPEAT) -> List[Dict]:
+    from can_cli import COMMANDS
+    return [measure_startup(None, repeat)] + [measure_startup(command, repeat) for command in COMMANDS]
+
+def compare_startup_with_baseline(results: List[Dict], baseline: Dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Startup regressions: heavy imports outside a command's budget, or a slower start than the baseline."""
+    previous = {result['command']: result for result in baseline.get('startup', [])}
+    regressions = [f"{result['command']}: imports {', '.join(result['unexpected_imports'])} at startup"
+                   for result in results if result['unexpected_imports']]
+    for result in results:
+        old = previous.get(result['command'])
+        if old is None:
+            continue
+        if result['seconds'] > old['seconds'] * (1 + tolerance) + STARTUP_SLACK:
+            regressions.append(f"{result['command']}: starts in {result['seconds'] * 1e3:.0f}ms "
+                               f"(baseline {old['seconds'] * 1e3:.0f}ms)")
+    return regressions
+
+def print_startup(results: List[Dict]):
+    print(f"{'Command':<18} | {'Startup':>9} | Heavy imports")
+    print("----------------------------------------------------------------")
+    for result in results:
+        unexpected = f" (unexpected: {', '.join(result['unexpected_imports'])})" if result['unexpected_imports'] else ''
+        print(f"{result['command']:<18} | {result['seconds'] * 1e3:>7.0f}ms | "
+              f"{', '.join(result['heavy_imports']) or '-'}{unexpected}")
+
+def compare_with_baseline(results: List[Dict], baseline: Dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Return a message for every component whose throughput dropped or drop rate rose against the baseline."""
+    previous = {result['component']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get(result['component'])
+        if old is None:
+            continue
+        if result['frames_per_sec'] < old['frames_per_sec'] * (1 - tolerance):
+            regressions.append(f"{result['component']}: {result['frames_per_sec']:.0f} frames/s "
+                               f"(baseline {old['frames_per_sec']:.0f})")
+        if result['drop_rate'] > old['drop_rate'] + 1e-3:
+            regressions.append(f"{result['component']}: drop rate {result['drop_rate']:.4f} "
+                               f"(baseline {old['drop_rate']:.4f})")
+    return regressions
+
+def print_results(results: List[Dict]):
+    print(f"{'Component':<18} | {'Frames':>8} | {'Frames/s':>11} | {'us/frame':>9} | {'x realtime':>10} | "
+          f"{'RSS +KB':>8} | {'Drop rate':>9}")
+    print("-----------------------------------------------------------------------------------------------------------")
+    for result in results:
+        factor = result['realtime_factor']
+        print(f"{result['component']:<18} | {result['frames']:>8} | {result['frames_per_sec']:>11.0f} | "
+              f"{result['us_per_frame']:>9.2f} | {'-' if factor is None else f'{factor:.1f}':>10} | "
+              f"{result['rss_growth_kb']:>8} | {result['drop_rate']:>9.4f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the throughput of the CAN analysis components on generated traffic.')
+    parser.add_argument('--components', default=','.join(BENCHMARKS),
+                        help=f"Comma separated, from: {', '.join(BENCHMARKS)}, bus")
+    parser.add_argument('--bench-duration', type=float, default=DURATION, help='Seconds of traffic per benchmark')
+    parser.add_argument('--bus', help="Also benchmark live reception, e.g. 'virtual:bench' or 'socketcan:vcan0'")
+    parser.add_argument('--bus-duration', type=float, default=BUS_DURATION, help='Seconds of real-time traffic')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Earlier JSON results; exit with status 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Allowed throughput loss, e.g. 0.2')
+    parser.add_argument('--startup', action='store_true',
+                        help='Also time the startup of every can-analysis subcommand and check its heavy imports')
+    args, traffic_argv = parser.parse_known_args(argv)
+    # Remaining options (--modules, --rate, --burst-size, ...) configure the traffic as in can_traffic
+    config = config_from_args(parse_traffic_args(traffic_argv))
+
+    names = [name.strip() for name in args.components.split(',') if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARKS and name != 'bus']
+    if unknown:
+        parser.error(f"Unknown components: {', '.join(unknown)}")
+    if args.bus and 'bus' not in names:
+        names.append('bus')
+    if 'bus' in names and not args.bus:
+        parser.error("The bus benchmark needs --bus")
+
+    print(f"Traffic: {config.modules} modules at {config.command_rate:.0f} Hz, "
+          f"about {config.frames_per_second():.0f} frames/s")
+    results = []
+    for name in names:
+        duration = args.bus_duration if name == 'bus' else args.bench_duration
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                results.append(executor.submit(run_benchmark, name, config, duration, args.bus).result())
+            except Exception as e:
+                print(f"Error in benchmark '{name}': {e}")
+    print_results(results)
+    startup = []
+    if args.startup:
+        startup = run_startup()
+        print_startup(startup)
+
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'traffic': config.as_dict(),
+        'duration': args.bench_duration,
+        'results': results,
+        'startup': startup,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    # Heavy imports outside a command's budget fail even without a baseline
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    regressions += compare_startup_with_baseline(startup, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import math
+import time
+import argparse
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from can_frequency import QuantileSketch
+from can_schema import default_schema
+
+# Bus settings, as configured in can_log and canfd_handler
+CAN_CHANNEL = 'can0'
+CAN_BITRATE = 1_000_000  # 1Mbps arbitration phase
+CAN_DATA_BITRATE = 5_000_000  # 5Mbps data phase (frames with BRS)
+
+WINDOW = 0.01  # Seconds per utilization window
+REPORT_PERIOD = 1.0  # Seconds of bus time per printed line
+BATCH_SIZE = 10000  # Frames per vectorized batch when reading logs
+PROJECTION_RATE = 1000.0  # Cycles per second of an added module
+MAX_LOAD = 0.8  # Utilization that projections must stay below
+WINDOW_QUANTILE = 0.99
+
+# Payload lengths a CAN FD DLC can encode; shorter payloads are padded up to the next one
+FD_LENGTHS = np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64])
+
+def frame_bits(lengths: np.ndarray, is_fd: np.ndarray, is_extended: np.ndarray,
+               brs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Worst-case on-wire bits of each frame, split into the arbitration and data bit rates.
+
+    Classic frames use the worst case of Davis et al. (g + 8n + 13 + floor((g + 8n - 1) / 4)
+    with g = 34 or 54 control bits). CAN FD frames count SOF to BRS (17 or 36 bits) and the
+    trailer (CRC delimiter, ACK, EOF, intermission: 13 bits) at the arbitration rate, and
+    ESI, DLC, data, stuff count and CRC (17 or 21 bits) with its fixed stuff bits at the data
+    rate when BRS is set. Dynamic stuffing is one bit per 4 bits in both phases. The 3-bit
+    intermission is included, so the result is the bus time the frame occupies.
+
+    :return: (bits at the arbitration rate, bits at the data rate)
+    """
+    lengths = np.minimum(np.asarray(lengths, dtype=np.int64), 64)
+    is_fd = np.asarray(is_fd, dtype=bool)
+    is_extended = np.asarray(is_extended, dtype=bool)
+    brs = np.asarray(brs, dtype=bool) & is_fd
+    lengths = np.where(is_fd, FD_LENGTHS[np.searchsorted(FD_LENGTHS, lengths)], np.minimum(lengths, 8))
+
+    control = np.where(is_extended, 54, 34)
+    classic = control + 8 * lengths + 13 + (control + 8 * lengths - 1) // 4
+
+    arbitration = np.where(is_extended, 36, 17)
+    arbitration += (arbitration - 1) // 4
+    data = 5 + 8 * lengths
+    data += data // 4
+    crc = np.where(lengths > 16, 21, 17)
+    data += 4 + crc + (4 + crc + 3) // 4
+    nominal = np.where(is_fd, arbitration + 13 + np.where(brs, 0, data), classic)
+    fast = np.where(brs, data, 0)
+    return nominal, fast
+
+def frame_seconds(lengths, is_fd, is_extended, brs, bitrate: float = CAN_BITRATE,
+                  data_bitrate: float = CAN_DATA_BITRATE) -> np.ndarray:
+    """Worst-case time on the wire of each frame in seconds."""
+    nominal, fast = frame_bits(lengths, is_fd, is_extended, brs)
+    return nominal / bitrate + fast / data_bitrate
+
+@dataclass
+class PeriodLoad:
+    start: float
+    frames: int = 0
+    busy: float = 0.0  # Seconds of bus time
+    duration: float = 0.0
+    peak: float = 0.0  # Highest window utilization
+
+    @property
+    def load(self) -> float:
+        return self.busy / self.duration if self.duration else 0.0
+
+class BusLoadAnalyzer:
+    """
+    Bus utilization from frame timestamps, IDs, lengths and flags.
+
+    Frames are added as arrays (add) or batches of frames (add_frames); the time on the wire
+    is computed vectorized per batch and summed into fixed windows, per ID and per module.
+    Memory stays constant: closed windows only update the period, the maximum and a
+    quantile sketch.
+    """
+
+    def __init__(self, bitrate: float = CAN_BITRATE, data_bitrate: float = CAN_DATA_BITRATE,
+                 window: float = WINDOW, report_period: float = REPORT_PERIOD, brs: bool = True,
+                 on_period=None, schema=None):
+        """
+        :param brs: Whether FD frames switch to the data bit rate; the receive path does not report the flag
+        :param on_period: Called with a PeriodLoad each time report_period of bus time is complete
+        """
+        self.bitrate = bitrate
+        self.data_bitrate = data_bitrate
+        self.window = window
+        self.window_ns = round(window * 1e9)  # Window indexes are computed on integer nanoseconds
+        self.windows_per_period = max(1, round(report_period / window))
+        self.brs = brs
+        self.on_period = on_period
+        self.schema = schema or default_schema()
+        self.command = self.schema.message('command')
+        self.frames = 0
+        self.busy = 0.0
+        self.first_time: Optional[float] = None
+        self.last_time: Optional[float] = None
+        self.current_window: Optional[int] = None
+        self.period_window = 0  # First window of the current period
+        self.window_busy = 0.0
+        self.peak_window = 0.0
+        self.window_loads = QuantileSketch()
+        self.period: Optional[PeriodLoad] = None
+        self.id_frames: Dict[int, int] = {}
+        self.id_busy: Dict[int, float] = {}
+        self.id_owner: Dict[int, Optional[Tuple[str, int]]] = {}
+
+    def add(self, timestamps: np.ndarray, ids: np.ndarray, lengths: np.ndarray, is_fd: np.ndarray,
+            is_extended: np.ndarray, brs: Optional[np.ndarray] = None):
+        """Add a batch of frames in timestamp order."""
+        if not len(timestamps):
+            return
+        seconds = frame_seconds(lengths, is_fd, is_extended, self.brs if brs is None else brs,
+                                self.bitrate, self.data_bitrate)
+        self.frames += len(seconds)
+        self.busy += float(seconds.sum())
+        if self.first_time is None:
+            self.first_time = float(timestamps[0])
+        self.last_time = float(timestamps[-1])
+
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        counts = np.bincount(inverse)
+        busy = np.bincount(inverse, weights=seconds)
+        for arbitration_id, count, id_busy in zip(unique_ids.tolist(), counts.tolist(), busy.tolist()):
+            self.id_frames[arbitration_id] = self.id_frames.get(arbitration_id, 0) + count
+            self.id_busy[arbitration_id] = self.id_busy.get(arbitration_id, 0.0) + id_busy
+
+        # On floats, a frame exactly on a boundary (3.0 // 0.01 == 299) would fall into the previous window
+        nanoseconds = np.round(np.asarray(timestamps, dtype=np.float64) * 1e9).astype(np.int64)
+        windows, inverse = np.unique(nanoseconds // self.window_ns, return_inverse=True)
+        counts = np.bincount(inverse)
+        busy = np.bincount(inverse, weights=seconds)
+        for window, count, window_busy in zip(windows.tolist(), counts.tolist(), busy.tolist()):
+            self._add_window(window, count, window_busy)
+
+    def add_frames(self, frames: List):
+        """Add frames with timestamp, arbitration_id, data, is_fd and is_extended_id (candump_log.Frame, can.Message)."""
+        if not frames:
+            return
+        count = len(frames)
+        self.add(np.fromiter((frame.timestamp for frame in frames), np.float64, count),
+                 np.fromiter((frame.arbitration_id for frame in frames), np.int64, count),
+                 np.fromiter((len(frame.data) for frame in frames), np.int64, count),
+                 np.fromiter((frame.is_fd for frame in frames), bool, count),
+                 np.fromiter((frame.is_extended_id for frame in frames), bool, count),
+                 np.fromiter((getattr(frame, 'bitrate_switch', self.brs) for frame in frames), bool, count))
+
+    def _add_window(self, window: int, frames: int, busy: float):
+        if self.current_window is None:
+            self._start_period(window)
+        elif window > self.current_window:
+            self._close_window()
+            self.window_loads.add_zeros(window - self.current_window - 1)  # Idle windows
+            if window // self.windows_per_period != self.current_window // self.windows_per_period:
+                self._end_period((self.current_window // self.windows_per_period + 1) * self.windows_per_period)
+                self._start_period(window)
+        # Frames of an older window (merged channels) are counted in the current one
+        self.current_window = max(window, self.current_window)
+        self.window_busy += busy
+        self.period.frames += frames
+
+    def _start_period(self, window: int):
+        # Periods are aligned to their boundary, so idle windows before the first frame count toward them
+        self.current_window = window
+        self.period_window = window // self.windows_per_period * self.windows_per_period
+        self.period = PeriodLoad(self.period_window * self.window)
+
+    def _end_period(self, end_window: int):
+        self.period.duration = (end_window - self.period_window) * self.window
+        if self.on_period:
+            self.on_period(self.period)
+
+    def _close_window(self):
+        load = self.window_busy / self.window
+        self.window_loads.add(load)
+        self.peak_window = max(self.peak_window, load)
+        self.period.peak = max(self.period.peak, load)
+        self.period.busy += self.window_busy
+        self.window_busy = 0.0
+
+    def finish(self):
+        """Close the last window and report the partial period."""
+        if self.current_window is None:
+            return
+        self._close_window()
+        self._end_period(self.current_window + 1)
+        self.current_window = None
+
+    @property
+    def duration(self) -> float:
+        if self.first_time is None:
+            return 0.0
+        return max(self.last_time - self.first_time, self.window)
+
+    def owner(self, arbitration_id: int) -> Optional[Tuple[str, int]]:
+        """(message name, module ID) of an ID, or None for IDs that do not belong to a module."""
+        if arbitration_id not in self.id_owner:
+            message = self.schema.match(arbitration_id)
+            self.id_owner[arbitration_id] = (message.name, message.module_id(arbitration_id)) \
+                if message is not None and message.module_mask else None
+        return self.id_owner[arbitration_id]
+
+    def modules(self) -> Dict[int, Tuple[float, int]]:
+        """Module ID -> (seconds of bus time, command frames)."""
+        modules: Dict[int, Tuple[float, int]] = {}
+        for arbitration_id, busy in self.id_busy.items():
+            owner = self.owner(arbitration_id)
+            if owner is None:
+                continue
+            name, module_id = owner
+            module_busy, commands = modules.get(module_id, (0.0, 0))
+            if name == self.command.name:
+                commands += self.id_frames[arbitration_id]
+            modules[module_id] = (module_busy + busy, commands)
+        return modules
+
+    def projection(self, rate: float = PROJECTION_RATE, max_load: float = MAX_LOAD) -> Optional[dict]:
+        """
+        How many more modules like the observed ones fit at a command rate.
+
+        The bus time per control cycle (command plus everything a module sends back) is
+        averaged over the modules, scaled to rate and compared with the free capacity below
+        max_load at the WINDOW_QUANTILE window utilization.
+        """
+        cycles = [(busy, commands) for busy, commands in self.modules().values() if commands]
+        if not cycles:
+            return None
+        cycle_seconds = sum(busy for busy, _ in cycles) / sum(commands for _, commands in cycles)
+        module_load = cycle_seconds * rate
+        window_load = self.window_loads.quantile(WINDOW_QUANTILE) or 0.0
+        return {
+            'rate': rate,
+            'max_load': max_load,
+            'cycle_us': cycle_seconds * 1e6,
+            'module_load': module_load,
+            'window_load': window_load,
+            'extra_modules': max(0, math.floor((max_load - window_load) / module_load)),
+            'max_rate': len(cycles) and max_load / (cycle_seconds * len(cycles)),
+        }
+
+def print_period(period: PeriodLoad):
+    print(f"{period.start:<16.3f} | {period.frames:>7} | {period.load * 100:>7.2f}% | {period.peak * 100:>8.2f}%")
+
+def print_header(window: float):
+    print(f"{'Time (s)':<16} | {'Frames':>7} | {'Load':>8} | {f'Peak {window * 1000:g}ms':>9}")
+
+def print_summary(analyzer: BusLoadAnalyzer, rate: float = PROJECTION_RATE, max_load: float = MAX_LOAD):
+    duration = analyzer.duration
+    if not analyzer.frames:
+        print("No frames")
+        return
+    print(f"\n{analyzer.frames} frames over {duration:.3f}s at {analyzer.bitrate / 1e6:g}/"
+          f"{analyzer.data_bitrate / 1e6:g} Mbit/s: mean load {analyzer.busy / duration * 100:.2f}%, "
+          f"{analyzer.window * 1000:g}ms windows p{WINDOW_QUANTILE * 100:g} "
+          f"{(analyzer.window_loads.quantile(WINDOW_QUANTILE) or 0) * 100:.2f}%, max {analyzer.peak_window * 100:.2f}%")
+
+    print(f"\n{'ID':<10} | {'Frames':>9} | {'Rate (Hz)':>10} | {'us/frame':>8} | {'Load':>7}")
+    for arbitration_id in sorted(analyzer.id_busy, key=analyzer.id_busy.get, reverse=True):
+        frames = analyzer.id_frames[arbitration_id]
+        busy = analyzer.id_busy[arbitration_id]
+        print(f"0x{arbitration_id:<8X} | {frames:>9} | {frames / duration:>10.1f} | {busy / frames * 1e6:>8.1f} | "
+              f"{busy / duration * 100:>6.2f}%")
+
+    modules = analyzer.modules()
+    if modules:
+        print(f"\n{'Module':<6} | {'Load':>7} | {'Cycles/s':>9}")
+        for module_id, (busy, commands) in sorted(modules.items()):
+            print(f"{module_id:<6} | {busy / duration * 100:>6.2f}% | {commands / duration:>9.1f}")
+
+    projection = analyzer.projection(rate, max_load)
+    if projection:
+        print(f"\nOne module cycle takes {projection['cycle_us']:.1f}us of bus time; a module at {rate:g} Hz "
+              f"adds {projection['module_load'] * 100:.2f}% load.")
+        print(f"{projection['extra_modules']} more modules at {rate:g} Hz fit below {max_load * 100:g}% "
+              f"(p{WINDOW_QUANTILE * 100:g} window load now {projection['window_load'] * 100:.2f}%); "
+              f"the current {len([m for m in modules.values() if m[1]])} modules could run at up to "
+              f"{projection['max_rate']:.0f} Hz.")
+
+def analyze_logs(paths: Iterable[str], analyzer: BusLoadAnalyzer, batch_size: int = BATCH_SIZE) -> BusLoadAnalyzer:
+    """Feed recorded logs (candump -L, ASC, BLF, ...) through the analyzer in vectorized batches."""
+    from can_replay import iter_log_frames
+    for path in paths:
+        batch = []
+        for frame in iter_log_frames(path):
+            batch.append(frame)
+            if len(batch) >= batch_size:
+                analyzer.add_frames(batch)
+                batch = []
+        analyzer.add_frames(batch)
+    analyzer.finish()
+    return analyzer
+
+def analyze_bus(channel: str, analyzer: BusLoadAnalyzer, duration: Optional[float] = None):
+    """Measure the live bus until the duration has passed or Ctrl+C."""
+    from canfd_handler import setup_can_interface
+    from can_receiver import BatchReceiver
+    bus = setup_can_interface(channel, int(analyzer.bitrate), int(analyzer.data_bitrate))
+    if bus is None:
+        return
+    receiver = BatchReceiver(bus)
+    start_time = time.time()
+    try:
+        while duration is None or time.time() - start_time < duration:
+            analyzer.add_frames(receiver.recv_batch(1.0))
+    except KeyboardInterrupt:
+        print("\nProgram terminated by user.")
+    finally:
+        analyzer.finish()
+        receiver.print_stats()
+        bus.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='CAN FD bus load: worst-case time on the wire per window, ID and module.')
+    parser.add_argument('logs', nargs='*', help='Recorded logs; without logs the live bus is measured')
+    parser.add_argument('--channel', default=CAN_CHANNEL)
+    parser.add_argument('--duration', type=float, default=None, help='Seconds to measure the live bus')
+    parser.add_argument('--bitrate', type=int, default=CAN_BITRATE)
+    parser.add_argument('--data-bitrate', type=int, default=CAN_DATA_BITRATE)
+    parser.add_argument('--no-brs', action='store_true', help='FD frames are sent without bit rate switching')
+    parser.add_argument('--window', type=float, default=WINDOW, help='Seconds per utilization window')
+    parser.add_argument('--period', type=float, default=REPORT_PERIOD, help='Seconds of bus time per printed line')
+    parser.add_argument('--rate', type=float, default=PROJECTION_RATE, help='Command rate of added modules (Hz)')
+    parser.add_argument('--max-load', type=float, default=MAX_LOAD, help='Utilization limit for the projection')
+    args = parser.parse_args(argv)
+
+    analyzer = BusLoadAnalyzer(args.bitrate, args.data_bitrate, args.window, args.period, brs=not args.no_brs,
+                               on_period=print_period)
+    print_header(args.window)
+    if args.logs:
+        analyze_logs(args.logs, analyzer)
+    else:
+        analyze_bus(args.channel, analyzer, args.duration)
+    print_summary(analyzer, args.rate, args.max_load)
+
+if __name__ == "__main__":
+    main()
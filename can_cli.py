@@ -0,0 +1,56 @@
+import sys
+import argparse
+import importlib
+
+# Subcommand -> (module, description, heavy modules that importing the module may load)
+# Modules are imported only when their subcommand is selected, and are expected to defer
+# anything not in their list until it is used, so that short diagnostic runs start quickly.
+COMMANDS = {
+    'frequency': ('can_frequency', 'Per-ID interval statistics from candump -L on stdin', ()),
+    'compare': ('can_message_comparison', 'Per-module message count comparison from candump -L on stdin', ('numpy',)),
+    'latency': ('can_latency', 'Command-to-response latency per module', ()),
+    'deadline': ('can_deadline', 'Per-ID deadline misses against learned periods', ()),
+    'log': ('can_log', 'Log command and servo frames to per-module files', ('numpy',)),
+    'plot': ('canfd_plot', 'Live plot of command and position angles', ('numpy',)),
+    'handler': ('canfd_handler', 'Print every received CAN FD message', ()),
+    'replay': ('can_replay', 'Replay or convert recorded logs offline', ('numpy',)),
+    'fanout': ('can_fanout', 'Read the bus once and feed several analyzers', ()),
+    'async': ('can_async', 'asyncio pipeline over one or more buses', ('numpy', 'can')),
+    'multichannel': ('can_multichannel', 'Capture several interfaces in worker processes', ('numpy',)),
+    'busload': ('can_busload', 'Bus load and time on the wire per window, ID and module', ('numpy',)),
+    'flight-recorder': ('can_flight_recorder', 'Save windows around trigger events', ()),
+    'query': ('can_indexed_log', 'Query an indexed block log by module and time range', ('numpy',)),
+    'compact': ('can_compact_log', 'Inspect or decode a compressed long-term log', ('numpy',)),
+    'summary': ('can_aggregate', 'Per-module window summaries from logs or finer summaries', ('numpy',)),
+    'tracking': ('can_tracking', 'Tracking error per module over recorded logs', ('numpy',)),
+    'traffic': ('can_traffic', 'Generate synthetic robot traffic', ()),
+    'benchmark': ('can_benchmark', 'Throughput and startup benchmarks', ()),
+    'schema': ('can_schema', 'Show the message layouts of a schema', ()),
+}
+HEAVY_MODULES = ('numpy', 'pandas', 'matplotlib', 'can', 'pyarrow')
+PROG = 'can-analysis'
+
+def load(command: str):
+    """Import the module of a subcommand."""
+    return importlib.import_module(COMMANDS[command][0])
+
+def heavy_imports() -> list:
+    """Heavy modules loaded in this process so far."""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog=PROG, description='CAN FD analysis tools.',
+        epilog='\n'.join(f"  {name:<16} {description}" for name, (_, description, _) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=COMMANDS, metavar='command', help='One of the commands below')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="Options of the command, see '<command> --help'")
+    args = parser.parse_args(argv)
+
+    module = load(args.command)
+    # The command's own parser then shows 'can-analysis <command>' in its usage line
+    sys.argv[0] = f'{PROG} {args.command}'
+    return module.main(args.args)
+
+if __name__ == "__main__":
+    sys.exit(main())
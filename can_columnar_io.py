@@ -0,0 +1,98 @@
+import os
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pyarrow as pa
+
+COLUMNAR_FORMATS = ('parquet', 'arrow', 'npy')
+FILE_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow', 'npy': '.npy'}
+DEFAULT_COMPRESSION = 'zstd'
+
+def _pyarrow():
+    """Import pyarrow on first use (it is optional and slow to import); returns (pa, pq) or (None, None)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet as pq
+    except ImportError:  # pyarrow is optional; fall back to .npy files
+        return None, None
+    return pa, pq
+
+def resolve_format(fmt: str) -> str:
+    """Return the format that will actually be written, falling back to npy without pyarrow."""
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown columnar format '{fmt}', expected one of {COLUMNAR_FORMATS}")
+    if fmt != 'npy' and _pyarrow()[0] is None:
+        print(f"pyarrow is not installed, writing npy files instead of {fmt}")
+        return 'npy'
+    return fmt
+
+def _to_table(rows: 'np.ndarray', module_id: int) -> 'pa.Table':
+    import numpy as np
+    pa, _ = _pyarrow()
+    columns = {name: pa.array(np.ascontiguousarray(rows[name])) for name in rows.dtype.names}
+    columns['module_id'] = pa.array(np.full(len(rows), module_id, dtype=np.uint8))
+    return pa.table(columns)
+
+def _with_module_id(rows: 'np.ndarray', module_id: int) -> 'np.ndarray':
+    import numpy as np
+    columns = [(name, rows.dtype.fields[name][0]) for name in rows.dtype.names]
+    records = np.empty(len(rows), dtype=columns + [('module_id', np.uint8)])
+    for name in rows.dtype.names:
+        records[name] = rows[name]
+    records['module_id'] = module_id
+    return records
+
+def write_columnar(path_base: str, rows: 'np.ndarray', module_id: int, fmt: str = 'parquet',
+                   compression: Optional[str] = DEFAULT_COMPRESSION) -> str:
+    """
+    Write one module's structured rows as typed columns.
+
+    :param path_base: Output path without extension
+    :param rows: Structured array of records (COMMAND_DTYPE or SERVO_DTYPE)
+    :param module_id: The module ID, stored as a column in every format
+    :param fmt: 'parquet', 'arrow' (Arrow IPC file) or 'npy'; see resolve_format
+    :param compression: Codec for parquet/arrow ('zstd', 'lz4', None); npy is never compressed
+    :return: Path of the written file
+    """
+    import numpy as np
+    fmt = resolve_format(fmt)
+    pa, pq = _pyarrow()
+    path = path_base + FILE_EXTENSIONS[fmt]
+    if fmt == 'parquet':
+        pq.write_table(_to_table(rows, module_id), path, compression=compression or 'none')
+    elif fmt == 'arrow':
+        table = _to_table(rows, module_id)
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+    else:
+        # Same columns as parquet/arrow; uncompressed so that load_columnar can memory-map it
+        np.save(path, _with_module_id(rows, module_id))
+    return path
+
+def load_columnar(path: str) -> Dict[str, 'np.ndarray']:
+    """
+    Load a file written by write_columnar as column arrays.
+
+    Files are memory-mapped; uncompressed Arrow IPC and npy columns are returned without copying.
+
+    :param path: Path of a .parquet, .arrow or .npy file
+    :return: Mapping of column name to array
+    """
+    import numpy as np
+    extension = os.path.splitext(path)[1]
+    if extension == '.npy':
+        rows = np.load(path, mmap_mode='r')
+        return {name: rows[name] for name in rows.dtype.names}
+    pa, pq = _pyarrow()
+    if pa is None:
+        raise ImportError(f"pyarrow is required to load {path}")
+    if extension == '.parquet':
+        table = pq.read_table(path, memory_map=True)
+    elif extension == '.arrow':
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    else:
+        raise ValueError(f"Unknown columnar file extension '{extension}'")
+    return {name: table.column(name).to_numpy() for name in table.column_names}
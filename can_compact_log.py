@@ -0,0 +1,307 @@
+import os
+import lzma
+import zlib
+import time
+import struct
+import argparse
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from can_message_processor import CANMessageProcessor, COMMAND_DTYPE, SERVO_DTYPE
+from can_stream_writer import StreamingCSVWriter
+
+# Compact log settings
+BLOCK_ROWS = 1 << 16  # Records collected before a block is encoded and compressed
+DEFAULT_CODEC = 'zlib'
+ZLIB_LEVEL = 6
+LZMA_PRESET = 6
+MAGIC = b'CANDLT01'
+LOG_EXTENSION = '.cdl'
+
+CODECS = ('zlib', 'lzma')
+FILE_HEADER = struct.Struct('<8sB7x')  # Magic, codec index
+BLOCK_HEADER = struct.Struct('<II')  # Compressed size, raw size
+SEGMENT_HEADER = struct.Struct('<BxHI')  # Kind, module_id, records; followed by one u4 size per column
+
+# Record kind -> (code, row layout), as in can_indexed_log
+KINDS: Dict[str, Tuple[int, np.dtype]] = {
+    'command': (0, COMMAND_DTYPE),
+    'servo': (1, SERVO_DTYPE),
+}
+KIND_BY_CODE = {code: name for name, (code, _) in KINDS.items()}
+KIND_ALIASES = {'servo_responses': 'servo'}
+
+# Column encodings; integer columns not listed use zig-zag varint deltas
+COLUMN_ENCODINGS = {
+    'timestamp': 'delta_of_delta',
+    'command_id': 'run_length',
+    'error': 'run_length',
+}
+
+# --- Integer codecs, vectorized over whole columns ---
+
+def zigzag(values: np.ndarray) -> np.ndarray:
+    """Map signed to unsigned integers so that small magnitudes get small codes (0, -1, 1, -2, ...)."""
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+def unzigzag(codes: np.ndarray) -> np.ndarray:
+    codes = codes.astype(np.uint64)
+    return ((codes >> np.uint64(1)).view(np.int64)) ^ -((codes & np.uint64(1)).view(np.int64))
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """LEB128: 7 bits per byte, high bit set on every byte but the last of a value."""
+    values = values.astype(np.uint64)
+    if not len(values):
+        return b''
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += values >= np.uint64(1 << shift)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    output = np.empty(int(ends[-1]), dtype=np.uint8)
+    for index in range(int(lengths.max())):
+        present = lengths > index
+        group = (values[present] >> np.uint64(7 * index)) & np.uint64(0x7F)
+        more = (lengths[present] > index + 1).astype(np.uint64) << np.uint64(7)
+        output[starts[present] + index] = (group | more).astype(np.uint8)
+    return output.tobytes()
+
+def decode_varints(data: bytes) -> np.ndarray:
+    encoded = np.frombuffer(data, dtype=np.uint8)
+    if not len(encoded):
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(encoded < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    value_index = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (np.arange(len(encoded)) - starts[value_index]) * 7
+    groups = (encoded & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    # The 7-bit groups of a value never overlap, so adding them is the same as or-ing them
+    return np.add.reduceat(groups, starts)
+
+def encode_delta(values: np.ndarray) -> bytes:
+    return encode_varints(zigzag(np.diff(values.astype(np.int64), prepend=np.int64(0))))
+
+def decode_delta(data: bytes, dtype: np.dtype) -> np.ndarray:
+    return np.cumsum(unzigzag(decode_varints(data))).astype(dtype)
+
+def encode_delta_of_delta(values: np.ndarray) -> bytes:
+    """
+    Timestamps: second differences of the raw IEEE-754 bits.
+
+    Positive doubles of one binade are evenly spaced and ordered like their bit patterns,
+    so nearly periodic timestamps give near-zero second differences and the decoder gets
+    the exact same doubles back (no rounding to a fixed resolution).
+    """
+    bits = np.ascontiguousarray(values, dtype=np.float64).view(np.int64)
+    deltas = np.diff(bits, prepend=np.int64(0))
+    return encode_varints(zigzag(np.diff(deltas, prepend=np.int64(0))))
+
+def decode_delta_of_delta(data: bytes, dtype: np.dtype) -> np.ndarray:
+    bits = np.cumsum(np.cumsum(unzigzag(decode_varints(data))))
+    return bits.view(np.float64).astype(dtype)
+
+def encode_run_length(values: np.ndarray) -> bytes:
+    """(value, run length) pairs: the number of runs, the values, then the lengths, all varints."""
+    values = values.astype(np.int64)
+    starts = np.flatnonzero(np.diff(values, prepend=values[:1] - 1)) if len(values) else np.empty(0, dtype=np.int64)
+    runs = np.diff(np.append(starts, len(values)))
+    return (encode_varints(np.array([len(starts)], dtype=np.uint64)) + encode_varints(zigzag(values[starts]))
+            + encode_varints(runs))
+
+def decode_run_length(data: bytes, dtype: np.dtype) -> np.ndarray:
+    decoded = decode_varints(data)
+    if not len(decoded):
+        return np.empty(0, dtype=dtype)
+    count = int(decoded[0])
+    values = unzigzag(decoded[1:1 + count])
+    runs = decoded[1 + count:1 + 2 * count].astype(np.int64)
+    return np.repeat(values, runs).astype(dtype)
+
+ENCODERS = {'delta': encode_delta, 'delta_of_delta': encode_delta_of_delta, 'run_length': encode_run_length}
+DECODERS = {'delta': decode_delta, 'delta_of_delta': decode_delta_of_delta, 'run_length': decode_run_length}
+
+def encode_segment(kind: str, module_id: int, rows: np.ndarray) -> bytes:
+    """Encode one module's rows column by column."""
+    code, dtype = KINDS[kind]
+    columns = [ENCODERS[COLUMN_ENCODINGS.get(name, 'delta')](rows[name]) for name in dtype.names]
+    return (SEGMENT_HEADER.pack(code, module_id, len(rows)) + struct.pack(f'<{len(columns)}I', *map(len, columns))
+            + b''.join(columns))
+
+def decode_segments(block: bytes) -> Iterator[Tuple[str, int, np.ndarray]]:
+    """Yield (kind, module_id, rows) for every segment of a decompressed block."""
+    offset = 0
+    while offset < len(block):
+        code, module_id, count = SEGMENT_HEADER.unpack_from(block, offset)
+        offset += SEGMENT_HEADER.size
+        kind = KIND_BY_CODE[code]
+        dtype = KINDS[kind][1]
+        sizes = struct.unpack_from(f'<{len(dtype.names)}I', block, offset)
+        offset += 4 * len(sizes)
+        rows = np.empty(count, dtype=dtype)
+        for name, size in zip(dtype.names, sizes):
+            column = block[offset:offset + size]
+            rows[name] = DECODERS[COLUMN_ENCODINGS.get(name, 'delta')](column, dtype[name])
+            offset += size
+        yield kind, module_id, rows
+
+class CompactLogWriter:
+    """
+    Streaming writer of the delta-encoded capture format.
+
+    Records are collected per (kind, module) and every block_rows records all pending
+    segments are encoded and compressed together as one self-contained block (the delta
+    state restarts per block), so a damaged block does not affect the others and a crash
+    loses at most the block being collected.
+    """
+
+    def __init__(self, path: str, codec: str = DEFAULT_CODEC, block_rows: int = BLOCK_ROWS):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}', expected one of {CODECS}")
+        self.path = path
+        self.codec = codec
+        self.block_rows = block_rows
+        self.file = open(path, 'wb')
+        self.file.write(FILE_HEADER.pack(MAGIC, CODECS.index(codec)))
+        self.pending: Dict[Tuple[str, int], List[np.ndarray]] = {}
+        self.pending_rows = 0
+        self.records = 0
+        self.raw_bytes = 0  # Size of the records as packed column rows
+        self.encode_seconds = 0.0
+
+    def append(self, kind: str, module_id: int, rows: np.ndarray):
+        kind = KIND_ALIASES.get(kind, kind)
+        if not len(rows):
+            return
+        self.pending.setdefault((kind, module_id), []).append(rows)
+        self.pending_rows += len(rows)
+        if self.pending_rows >= self.block_rows:
+            self.flush()
+
+    def write_chunk(self, chunk: Tuple[Dict[int, np.ndarray], Dict[int, np.ndarray]]):
+        """Append one chunk returned by CANMessageProcessor.drain()."""
+        command_chunks, servo_chunks = chunk
+        for module_id, rows in command_chunks.items():
+            self.append('command', module_id, rows)
+        for module_id, rows in servo_chunks.items():
+            self.append('servo', module_id, rows)
+
+    def flush(self):
+        """Encode, compress and write the pending records as one block."""
+        if not self.pending:
+            return
+        start = time.perf_counter()
+        segments = []
+        for (kind, module_id), chunks in self.pending.items():
+            rows = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+            segments.append(encode_segment(kind, module_id, rows))
+            self.records += len(rows)
+            self.raw_bytes += rows.nbytes
+        raw = b''.join(segments)
+        compressed = zlib.compress(raw, ZLIB_LEVEL) if self.codec == 'zlib' else lzma.compress(raw, preset=LZMA_PRESET)
+        self.file.write(BLOCK_HEADER.pack(len(compressed), len(raw)))
+        self.file.write(compressed)
+        self.file.flush()
+        self.pending = {}
+        self.pending_rows = 0
+        self.encode_seconds += time.perf_counter() - start
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+def iter_compact_log(path: str) -> Iterator[Tuple[str, int, np.ndarray]]:
+    """Decode a compact log block by block, yielding (kind, module_id, rows) with exactly the logged values."""
+    with open(path, 'rb') as f:
+        magic, codec_index = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compact CAN log")
+        decompress = zlib.decompress if CODECS[codec_index] == 'zlib' else lzma.decompress
+        while True:
+            header = f.read(BLOCK_HEADER.size)
+            if len(header) < BLOCK_HEADER.size:
+                return
+            compressed_size, raw_size = BLOCK_HEADER.unpack(header)
+            compressed = f.read(compressed_size)
+            if len(compressed) < compressed_size:
+                print(f"{path}: last block is truncated, stopping")
+                return
+            yield from decode_segments(decompress(compressed))
+
+def read_compact_log(path: str) -> Dict[Tuple[str, int], np.ndarray]:
+    """Decode a whole compact log into (kind, module_id) -> rows."""
+    parts: Dict[Tuple[str, int], List[np.ndarray]] = {}
+    for kind, module_id, rows in iter_compact_log(path):
+        parts.setdefault((kind, module_id), []).append(rows)
+    return {key: np.concatenate(chunks) for key, chunks in parts.items()}
+
+class StreamingCompactWriter(StreamingCSVWriter):
+    """StreamingCSVWriter that appends the drained chunks to a compact log instead of CSV files."""
+
+    def __init__(self, processor: CANMessageProcessor, output_dir: str = 'output', codec: str = DEFAULT_CODEC,
+                 **kwargs):
+        os.makedirs(output_dir, exist_ok=True)
+        self.log = CompactLogWriter(os.path.join(output_dir, f'{processor.start_time}{LOG_EXTENSION}'), codec)
+        super().__init__(processor, output_dir, **kwargs)
+
+    def _write(self, kind: str, module_id: int, rows: np.ndarray):
+        self.log.append(kind, module_id, rows)
+        self.written_frames += len(rows)
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        self.log.close()
+        print_log_stats(self.log)
+
+def save_compact(processor: CANMessageProcessor, output_dir: str = 'output', codec: str = DEFAULT_CODEC) -> str:
+    """Write all records of a processor to <output_dir>/<start_time>.cdl and return the path."""
+    os.makedirs(output_dir, exist_ok=True)
+    writer = CompactLogWriter(os.path.join(output_dir, f'{processor.start_time}{LOG_EXTENSION}'), codec)
+    for module_id, responses in processor.command_responses.items():
+        writer.append('command', module_id, responses.view())
+    for module_id, responses in processor.servo_responses.items():
+        writer.append('servo', module_id, responses.view())
+    writer.close()
+    print_log_stats(writer)
+    return writer.path
+
+def print_log_stats(writer: CompactLogWriter):
+    size = os.path.getsize(writer.path)
+    rate = writer.records / writer.encode_seconds if writer.encode_seconds else float('inf')
+    print(f"Compact log: {writer.path}, {writer.records} records in {size} bytes "
+          f"({size / max(writer.records, 1):.2f} bytes/record, {writer.raw_bytes / max(size, 1):.1f}x smaller than "
+          f"packed columns), encoded at {rate:.0f} records/s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect or decode a delta-encoded compact CAN log.')
+    parser.add_argument('path', help=f'{LOG_EXTENSION} file')
+    parser.add_argument('--csv-dir', default=None, help='Decode into per-module CSV files in this directory')
+    args = parser.parse_args(argv)
+
+    from can_message_processor import responses_to_dataframe
+    if args.csv_dir:
+        os.makedirs(args.csv_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(args.path))[0]
+    counts: Dict[Tuple[str, int], int] = {}
+    written = set()
+    for kind, module_id, rows in iter_compact_log(args.path):
+        counts[(kind, module_id)] = counts.get((kind, module_id), 0) + len(rows)
+        if args.csv_dir:
+            file_kind = 'servo_responses' if kind == 'servo' else kind
+            path = os.path.join(args.csv_dir, f'{name}_{file_kind}_{module_id}.csv')
+            responses_to_dataframe(module_id, rows).to_csv(path, mode='a' if path in written else 'w',
+                                                           header=path not in written, index=False)
+            written.add(path)
+    size = os.path.getsize(args.path)
+    records = sum(counts.values())
+    print(f"{args.path}: {records} records, {size} bytes ({size / max(records, 1):.2f} bytes/record)")
+    for (kind, module_id), count in sorted(counts.items()):
+        print(f"  {kind} module {module_id}: {count}")
+    if args.csv_dir:
+        print(f"Decoded to {len(written)} CSV files in '{args.csv_dir}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import sys
+import argparse
+from typing import Dict, Iterable, Optional, TextIO
+from candump_log import parse_frame_header, read_chunks, iter_line_batches
+from can_frequency import ReportPeriods
+
+REPORT_PERIOD = 1.0  # Seconds of log time per report
+TOLERANCE = 0.5  # A frame is late when its interval exceeds the period by this fraction of the period
+WARMUP = 20  # Intervals averaged before frames of an ID are checked
+ALPHA = 0.01  # Weight of a new interval in the learned period after the warmup
+EVENT_FIELDS = ('timestamp', 'id', 'kind', 'interval_ms', 'period_ms', 'late_ms', 'lost', 'consecutive',
+                'previous_ms', 'bus_frames')
+
+class PeriodState:
+    """Learned period and miss bookkeeping of one arbitration ID."""
+
+    __slots__ = ('last_timestamp', 'last_bus_frame', 'period', 'intervals', 'previous_interval', 'consecutive')
+
+    def __init__(self, timestamp: float, bus_frame: int):
+        self.last_timestamp = timestamp
+        self.last_bus_frame = bus_frame
+        self.period = 0.0
+        self.intervals = 0
+        self.previous_interval = 0.0
+        self.consecutive = 0
+
+class DeadlineStats:
+    """Frame and miss counts of one ID over a report period or in total."""
+
+    __slots__ = ('frames', 'misses', 'gaps', 'lost', 'max_consecutive', 'worst_late', 'period')
+
+    def __init__(self):
+        self.frames = 0
+        self.misses = 0  # Frames later than the tolerance
+        self.gaps = 0  # Misses where at least one whole period passed without a frame
+        self.lost = 0  # Frames estimated to be missing in those gaps
+        self.max_consecutive = 0
+        self.worst_late = 0.0  # Seconds beyond the learned period
+        self.period = 0.0  # Learned period at the end
+
+    def merge(self, other: 'DeadlineStats'):
+        self.frames += other.frames
+        self.misses += other.misses
+        self.gaps += other.gaps
+        self.lost += other.lost
+        self.max_consecutive = max(self.max_consecutive, other.max_consecutive)
+        self.worst_late = max(self.worst_late, other.worst_late)
+        self.period = other.period
+
+class DeadlineTracker:
+    """
+    Per-ID deadline misses against a period learned online.
+
+    The period of an ID is the running mean of its first WARMUP intervals and an exponential
+    moving average afterwards. Intervals are clamped to the deadline before they are averaged,
+    so misses do not stretch the period but a slower rate is still picked up. update() does a
+    fixed amount of work per frame and calls on_event with a dict of EVENT_FIELDS for every
+    frame that arrives after period * (1 + tolerance) (or period + tolerance_ms).
+    """
+
+    def __init__(self, tolerance: float = TOLERANCE, tolerance_ms: Optional[float] = None, warmup: int = WARMUP,
+                 alpha: float = ALPHA, on_event=None):
+        self.tolerance = tolerance
+        self.tolerance_seconds = tolerance_ms / 1000 if tolerance_ms is not None else None
+        self.warmup = warmup
+        self.alpha = alpha
+        self.on_event = on_event
+        self.bus_frames = 0
+        self.states: Dict[int, PeriodState] = {}
+        self.period: Dict[int, DeadlineStats] = {}
+        self.total: Dict[int, DeadlineStats] = {}
+
+    def update(self, arbitration_id: int, timestamp: float):
+        self.bus_frames += 1
+        state = self.states.get(arbitration_id)
+        if state is None:
+            self.states[arbitration_id] = PeriodState(timestamp, self.bus_frames)
+            return
+        stats = self.period.get(arbitration_id)
+        if stats is None:
+            stats = self.period[arbitration_id] = DeadlineStats()
+        stats.frames += 1
+        interval = timestamp - state.last_timestamp
+        if interval <= 0:
+            return  # Out of order or duplicate timestamp
+        period = state.period
+        deadline = period + self.tolerance_seconds if self.tolerance_seconds is not None \
+            else period * (1 + self.tolerance)
+
+        if state.intervals >= self.warmup and interval > deadline:
+            state.consecutive += 1
+            lost = max(0, round(interval / period) - 1)
+            late = interval - period
+            stats.misses += 1
+            if lost:
+                stats.gaps += 1
+                stats.lost += lost
+            if state.consecutive > stats.max_consecutive:
+                stats.max_consecutive = state.consecutive
+            if late > stats.worst_late:
+                stats.worst_late = late
+            if self.on_event:
+                self.on_event({
+                    'timestamp': timestamp, 'id': arbitration_id, 'kind': 'gap' if lost else 'late',
+                    'interval_ms': interval * 1000, 'period_ms': period * 1000, 'late_ms': late * 1000,
+                    'lost': lost, 'consecutive': state.consecutive, 'previous_ms': state.previous_interval * 1000,
+                    'bus_frames': self.bus_frames - state.last_bus_frame - 1,
+                })
+            interval = deadline
+        else:
+            state.consecutive = 0
+
+        state.intervals += 1
+        weight = 1 / state.intervals if state.intervals <= self.warmup else self.alpha
+        state.period = period + weight * (interval - period) if state.intervals > 1 else interval
+        stats.period = state.period
+        state.previous_interval = timestamp - state.last_timestamp
+        state.last_timestamp = timestamp
+        state.last_bus_frame = self.bus_frames
+
+    def end_period(self) -> Dict[int, DeadlineStats]:
+        period = self.period
+        self.period = {}
+        for arbitration_id, stats in period.items():
+            if arbitration_id not in self.total:
+                self.total[arbitration_id] = DeadlineStats()
+            self.total[arbitration_id].merge(stats)
+        return period
+
+class EventLog:
+    """Misses as CSV lines (EVENT_FIELDS), one per late frame."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.count = 0
+        stream.write(','.join(EVENT_FIELDS) + '\n')
+
+    def __call__(self, event: dict):
+        self.count += 1
+        self.stream.write(f"{event['timestamp']:.6f},0x{event['id']:X},{event['kind']},{event['interval_ms']:.3f},"
+                          f"{event['period_ms']:.3f},{event['late_ms']:.3f},{event['lost']},{event['consecutive']},"
+                          f"{event['previous_ms']:.3f},{event['bus_frames']}\n")
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+def print_header():
+    print("Time (s)   | ID    | Frames | Period (ms) | Late | Gaps | Lost | Max run | Worst late (ms)")
+    print("------------------------------------------------------------------------------------------")
+
+def print_stats(label: str, stats_by_id: Dict[int, DeadlineStats], misses_only: bool = False):
+    for arbitration_id in sorted(stats_by_id):
+        stats = stats_by_id[arbitration_id]
+        if misses_only and not stats.misses:
+            continue
+        print(f"{label:<10} | {arbitration_id:03X}   | {stats.frames:>6} | {stats.period * 1000:>11.3f} | "
+              f"{stats.misses:>4} | {stats.gaps:>4} | {stats.lost:>4} | {stats.max_consecutive:>7} | "
+              f"{stats.worst_late * 1000:>15.3f}")
+
+def detect_deadline_misses(chunks: Iterable[bytes] = None, tracker: DeadlineTracker = None,
+                           report_period: float = REPORT_PERIOD) -> DeadlineTracker:
+    """
+    Check the frames of `candump -L` output against their learned periods.
+
+    Each report period prints the IDs that missed deadlines; the totals of all IDs are
+    printed at the end.
+
+    :param chunks: Byte chunks of candump output (buffered stdin by default)
+    """
+    if chunks is None:
+        chunks = read_chunks(sys.stdin.buffer)
+    if tracker is None:
+        tracker = DeadlineTracker()
+    update = tracker.update
+    periods = ReportPeriods(report_period)
+
+    print("Checking CAN message deadlines per ID from candump timestamps. Press Ctrl+C to stop.")
+    print_header()
+    try:
+        for lines in iter_line_batches(chunks):
+            for line in lines:
+                frame = parse_frame_header(line)
+                if frame is None:
+                    continue
+                timestamp, arbitration_id = frame
+
+                if timestamp >= periods.next_time:
+                    label = periods.advance(timestamp)
+                    if label is not None:
+                        print_stats(label, tracker.end_period(), True)
+
+                update(arbitration_id, timestamp)
+
+    except KeyboardInterrupt:
+        print("\nProgram terminated by user.")
+
+    print_stats(periods.label, tracker.end_period(), True)
+    if tracker.total:
+        print("Total:")
+        print_stats("total", tracker.total)
+    return tracker
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-ID deadline misses against learned periods, from `candump -L` on stdin.')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='Late when the interval exceeds the period by this fraction of it')
+    parser.add_argument('--tolerance-ms', type=float, default=None, help='Absolute tolerance instead of --tolerance')
+    parser.add_argument('--warmup', type=int, default=WARMUP, help='Intervals learned per ID before checking')
+    parser.add_argument('--events', default=None, help="CSV file for the miss events ('-' for stdout)")
+    parser.add_argument('--period', type=float, default=REPORT_PERIOD, help='Seconds of log time per report')
+    args = parser.parse_args(argv)
+
+    events = None
+    if args.events:
+        events = EventLog(sys.stdout if args.events == '-' else open(args.events, 'w'))
+    tracker = DeadlineTracker(args.tolerance, args.tolerance_ms, args.warmup, on_event=events)
+    try:
+        detect_deadline_misses(tracker=tracker, report_period=args.period)
+    finally:
+        if events:
+            print(f"{events.count} miss events", file=sys.stderr)
+            events.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+import sys
+import time
+import queue
+import argparse
+import threading
+from itertools import repeat
+from typing import Callable, Dict, Iterable, List, Optional
+
+from candump_log import parse_candump_lines
+from can_frequency import IntervalTracker, ReportPeriods, REPORT_PERIOD, print_header, print_stats
+
+# Fan-out settings
+QUEUE_SIZE = 256  # Batches waiting per plugin before that plugin starts dropping
+BATCH_SIZE = 256  # Frames per dispatched batch
+BATCH_INTERVAL = 0.02  # Seconds before a partial batch is dispatched
+CAN_CHANNEL = 'can0'
+
+# Held while a plugin prints, so the lines of reports from different plugin threads do not interleave
+REPORT_LOCK = threading.RLock()
+
+class AnalyzerPlugin:
+    """
+    Base class of the analyzers fed by FanOut.
+
+    handle() receives batches of frames (can.Message or candump_log.Frame, both with
+    arbitration_id, timestamp and data) on the plugin's own thread; close() is called
+    once after the last batch, with REPORT_LOCK held. Plugins that set decodes receive the
+    SchemaDecoder.decode result of every frame as well, decoded once by FanOut for all of
+    them; the others receive None. Output printed from handle() goes through REPORT_LOCK.
+    """
+
+    name = 'plugin'
+    decodes = False
+
+    def handle(self, frames: List, decoded: Optional[List]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class PluginRunner:
+    """Run one plugin on its own thread behind a bounded queue."""
+
+    def __init__(self, plugin: AnalyzerPlugin, queue_size: int = QUEUE_SIZE):
+        self.plugin = plugin
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.dropped_frames = 0
+        self.thread = threading.Thread(target=self._run, name=f'plugin-{plugin.name}', daemon=True)
+        self.thread.start()
+
+    def submit(self, frames: List, decoded: Optional[List] = None):
+        """Queue a batch without blocking; a full queue drops the batch for this plugin only."""
+        try:
+            self.queue.put_nowait((frames, decoded if self.plugin.decodes else None))
+        except queue.Full:
+            self.dropped_frames += len(frames)
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+        with REPORT_LOCK:
+            self.plugin.close()
+            if self.dropped_frames:
+                print(f"Plugin '{self.plugin.name}' dropped {self.dropped_frames} frames")
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            try:
+                self.plugin.handle(*batch)
+            except Exception as e:
+                with REPORT_LOCK:
+                    print(f"Error in plugin '{self.plugin.name}': {e}")
+
+class FanOut:
+    """
+    Read frames once and dispatch them in batches to every registered plugin.
+
+    Each plugin has its own queue and thread, so a slow consumer only drops its own
+    batches and never stalls the reader or the other plugins. Frames are decoded once per
+    batch, and only if a registered plugin uses the decoded values.
+    """
+
+    def __init__(self, queue_size: int = QUEUE_SIZE, batch_size: int = BATCH_SIZE,
+                 batch_interval: float = BATCH_INTERVAL):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.runners: List[PluginRunner] = []
+        self.batch: List = []
+        self.last_dispatch = time.monotonic()
+        self.frame_count = 0
+        self.running = True
+        self.decoder = None  # Set when the first plugin that decodes is registered
+
+    def register(self, plugin: AnalyzerPlugin) -> AnalyzerPlugin:
+        if plugin.decodes and self.decoder is None:
+            from can_schema import default_decoder
+            self.decoder = default_decoder()
+        self.runners.append(PluginRunner(plugin, self.queue_size))
+        return plugin
+
+    def dispatch(self, frame):
+        self.batch.append(frame)
+        self.frame_count += 1
+        if len(self.batch) >= self.batch_size or time.monotonic() - self.last_dispatch >= self.batch_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_dispatch = time.monotonic()
+        if not self.batch:
+            return
+        batch = self.batch
+        self.batch = []
+        decoded = None
+        if self.decoder is not None:
+            decode = self.decoder.decode
+            decoded = [decode(frame.arbitration_id, frame.data) for frame in batch]
+        for runner in self.runners:
+            runner.submit(batch, decoded)
+
+    def run_bus(self, bus, timeout: float = 0.1):
+        """Receive from a python-can bus in batches until stop() is called."""
+        from can_receiver import BatchReceiver
+        receiver = BatchReceiver(bus, max_batch=self.batch_size)
+        while self.running:
+            try:
+                frames = receiver.recv_batch(timeout)
+            except Exception as e:
+                print(f"Error receiving CAN message: {e}")
+                continue
+            if not frames:
+                self.flush()
+                continue
+            self.batch.extend(frames)
+            self.frame_count += len(frames)
+            if len(self.batch) >= self.batch_size or time.monotonic() - self.last_dispatch >= self.batch_interval:
+                self.flush()
+        self.flush()
+        receiver.print_stats()
+
+    def run_lines(self, lines: Iterable[str]):
+        """Dispatch the frames of `candump -L` text lines (e.g. stdin) until the input ends."""
+        for frame in parse_candump_lines(lines):
+            if not self.running:
+                break
+            self.dispatch(frame)
+        self.flush()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        self.flush()
+        for runner in self.runners:
+            runner.stop()
+        print(f"Dispatched {self.frame_count} frames to {len(self.runners)} plugins")
+
+class PeriodicPlugin(AnalyzerPlugin):
+    """
+    Plugin printing its tracker's statistics every report period of frame time.
+
+    Subclasses set tracker (with end_period() and total) and print_stats, and implement
+    update() for one frame.
+    """
+
+    tracker = None
+    print_stats: Callable = None
+
+    def __init__(self, report_period: float = REPORT_PERIOD):
+        self.periods = ReportPeriods(report_period)
+
+    def update(self, frame, decoded):
+        raise NotImplementedError
+
+    def print_period(self, label: str, stats):
+        self.print_stats(label, stats)
+
+    def handle(self, frames: List, decoded: Optional[List]):
+        periods = self.periods
+        update = self.update
+        for frame, message in zip(frames, decoded if decoded is not None else repeat(None)):
+            if frame.timestamp >= periods.next_time:
+                label = periods.advance(frame.timestamp)
+                if label is not None:
+                    with REPORT_LOCK:
+                        self.print_period(label, self.tracker.end_period())
+            update(frame, message)
+
+    def close(self):
+        self.print_period(self.periods.label, self.tracker.end_period())
+        self.print_stats("total", self.tracker.total)
+
+class FrequencyPlugin(PeriodicPlugin):
+    """Per-ID interval statistics (can_frequency)."""
+
+    name = 'frequency'
+
+    def __init__(self, report_period: float = REPORT_PERIOD):
+        super().__init__(report_period)
+        self.tracker = IntervalTracker()
+        self.print_stats = print_stats
+        print_header()
+
+    def update(self, frame, decoded):
+        self.tracker.update(frame.arbitration_id, frame.timestamp)
+
+class ComparisonPlugin(AnalyzerPlugin):
+    """Per-module message count comparison (can_message_comparison)."""
+
+    name = 'compare'
+
+    def __init__(self, window_size: float = 1.0):
+        # Imported here so that NumPy is only loaded when this plugin is used
+        from can_message_comparison import MessageClassifier, print_window
+        self.classifier = MessageClassifier()
+        self.print_window = print_window
+        self.window_size = window_size
+        self.counts = [0] * len(self.classifier.slots)
+        self.window = None
+
+    def handle(self, frames: List, decoded: Optional[List]):
+        table = self.classifier.table
+        counts = self.counts
+        for frame in frames:
+            window = frame.timestamp // self.window_size
+            if window != self.window:
+                if self.window is not None:
+                    with REPORT_LOCK:
+                        self.print_window(f"{self.window * self.window_size:.3f}", self.classifier, counts)
+                    counts = self.counts = [0] * len(counts)
+                self.window = window
+            slot = table.get(frame.arbitration_id)
+            if slot is not None:
+                counts[slot] += 1
+
+    def close(self):
+        if self.window is not None:
+            self.print_window(f"{self.window * self.window_size:.3f}", self.classifier, self.counts)
+            self.window = None
+
+class LoggerPlugin(AnalyzerPlugin):
+    """Command/servo logging through CANMessageProcessor (can_log)."""
+
+    name = 'log'
+
+    def __init__(self, output_dir: str = 'can_output', stream: bool = True):
+        from can_message_processor import CANMessageProcessor
+        from can_stream_writer import StreamingCSVWriter
+        from can_log import COMMAND_ID_BASE, CONTROL_RESPONSE_ID_BASE, ID_BASE_MASK
+        self.command_base = COMMAND_ID_BASE
+        self.mask = ID_BASE_MASK
+        self.response_base = CONTROL_RESPONSE_ID_BASE
+        self.output_dir = output_dir
+        self.processor = CANMessageProcessor()
+        self.writer = StreamingCSVWriter(self.processor, output_dir) if stream else None
+
+    def handle(self, frames: List, decoded: Optional[List]):
+        commands = [frame for frame in frames if frame.arbitration_id & self.mask == self.command_base]
+        servos = [frame for frame in frames if frame.arbitration_id & self.mask == self.response_base]
+        if commands:
+            self.processor.process_command_batch(commands)
+        if servos:
+            self.processor.process_servo_batch(servos)
+        if self.writer:
+            self.writer.poll(len(commands) + len(servos))
+
+    def close(self):
+        self.processor.save_to_csv(self.output_dir)
+
+class LatencyPlugin(PeriodicPlugin):
+    """Command-to-response latency per module (can_latency)."""
+
+    name = 'latency'
+    decodes = True
+
+    def __init__(self, report_period: float = REPORT_PERIOD):
+        from can_latency import LatencyTracker, print_header, print_stats
+        super().__init__(report_period)
+        self.tracker = LatencyTracker()
+        self.print_stats = print_stats
+        print_header()
+
+    def update(self, frame, decoded):
+        self.tracker.update_decoded(frame.arbitration_id, frame.timestamp, decoded)
+
+class PlotterPlugin(AnalyzerPlugin):
+    """Live angle plot (canfd_plot). The window itself runs on the main thread, see main()."""
+
+    name = 'plot'
+    decodes = True
+
+    def __init__(self):
+        from canfd_plot import CANPlotter
+        self.plotter = CANPlotter()
+
+    def handle(self, frames: List, decoded: Optional[List]):
+        handle_decoded = self.plotter.handle_decoded
+        for frame, message in zip(frames, decoded):
+            handle_decoded(frame, message)
+
+class DeadlinePlugin(PeriodicPlugin):
+    """Per-ID deadline misses against learned periods (can_deadline)."""
+
+    name = 'deadline'
+
+    def __init__(self, report_period: float = REPORT_PERIOD):
+        from can_deadline import DeadlineTracker, print_header, print_stats
+        super().__init__(report_period)
+        self.tracker = DeadlineTracker()
+        self.print_stats = print_stats
+        print_header()
+
+    def update(self, frame, decoded):
+        self.tracker.update(frame.arbitration_id, frame.timestamp)
+
+    def print_period(self, label: str, stats):
+        self.print_stats(label, stats, True)  # Only the IDs that missed deadlines
+
+class BusLoadPlugin(AnalyzerPlugin):
+    """Bus utilization per window, ID and module (can_busload)."""
+
+    name = 'busload'
+
+    def __init__(self):
+        from can_busload import BusLoadAnalyzer, WINDOW, print_header, print_period, print_summary
+        self.analyzer = BusLoadAnalyzer(on_period=self.print_period)
+        self.print_summary = print_summary
+        self._print_period = print_period
+        print_header(WINDOW)
+
+    def print_period(self, period):
+        with REPORT_LOCK:
+            self._print_period(period)
+
+    def handle(self, frames: List, decoded: Optional[List]):
+        self.analyzer.add_frames(frames)
+
+    def close(self):
+        self.analyzer.finish()
+        self.print_summary(self.analyzer)
+
+# Plugin name -> factory
+PLUGINS: Dict[str, Callable[[], AnalyzerPlugin]] = {
+    'frequency': FrequencyPlugin,
+    'compare': ComparisonPlugin,
+    'log': LoggerPlugin,
+    'latency': LatencyPlugin,
+    'plot': PlotterPlugin,
+    'deadline': DeadlinePlugin,
+    'busload': BusLoadPlugin,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read the CAN bus (or candump -L on stdin) once and feed several analyzers.')
+    parser.add_argument('--source', choices=('bus', 'stdin'), default='bus')
+    parser.add_argument('--channel', default=CAN_CHANNEL)
+    parser.add_argument('--plugins', default='frequency,compare,log',
+                        help=f"Comma separated, from: {', '.join(PLUGINS)}")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help='Batches buffered per plugin')
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.plugins.split(',') if name.strip()]
+    unknown = [name for name in names if name not in PLUGINS]
+    if unknown:
+        parser.error(f"Unknown plugins: {', '.join(unknown)}")
+
+    bus = None
+    if args.source == 'bus':
+        from canfd_handler import setup_can_interface
+        bus = setup_can_interface(args.channel)
+        if bus is None:
+            return
+
+    fanout = FanOut(queue_size=args.queue_size)
+    plugins = [fanout.register(PLUGINS[name]()) for name in names]
+    plotter = next((plugin.plotter for plugin in plugins if isinstance(plugin, PlotterPlugin)), None)
+
+    def acquire():
+        if bus is not None:
+            fanout.run_bus(bus)
+        else:
+            fanout.run_lines(sys.stdin)
+
+    try:
+        if plotter is not None:
+            # matplotlib needs the main thread, so acquisition moves to a worker thread
+            acquisition = threading.Thread(target=acquire, name='acquisition', daemon=True)
+            acquisition.start()
+            plotter.show()
+            fanout.stop()
+            acquisition.join()
+        else:
+            acquire()
+    except KeyboardInterrupt:
+        print("\nProgram terminated by user.")
+        fanout.stop()
+    finally:
+        fanout.close()
+        if bus is not None:
+            bus.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+import os
+import sys
+import json
+import time
+import argparse
+import bisect
+import itertools
+import operator
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from candump_log import format_candump_line, parse_candump_lines
+from can_schema import default_decoder
+
+# Recorder settings
+PRE_SECONDS = 10.0  # Seconds kept before a trigger
+POST_SECONDS = 5.0  # Seconds recorded after a trigger
+MAX_FRAMES = 500_000  # Frames held in the ring (about 25 s at 20k frames/s)
+MAX_EVENTS = 100  # Events written per run; later triggers are only counted
+MAX_EVENT_SECONDS = 60.0  # Overlapping triggers extend an event up to this length
+MAX_PENDING_FRAMES = 2 * MAX_FRAMES  # Frames queued for the writer thread; more are dropped and counted
+OUTPUT_DIR = 'flight_recorder'
+
+LATENCY_THRESHOLD_MS = 5.0
+COUNT_WINDOW = 1.0
+COUNT_TOLERANCE = 1  # Frames a group may differ by, e.g. a response that falls into the next window
+COUNT_GROUPS = {
+    'command': ['201-207'],
+    'response': ['501-507'],
+}
+
+Firing = Tuple[float, str]  # (timestamp, reason)
+TIMESTAMP = operator.attrgetter('timestamp')
+
+class Trigger:
+    """Inspect batches of frames and return the (timestamp, reason) of every event."""
+
+    name = 'trigger'
+
+    def check(self, frames: List) -> List[Firing]:
+        raise NotImplementedError
+
+class ServoErrorTrigger(Trigger):
+    """Fire on servo responses with a nonzero error field."""
+
+    name = 'servo_error'
+
+    def __init__(self):
+        self.decoder = default_decoder()
+        self.servo = self.decoder.schema.message('servo')
+        self.error_index = self.servo.index('error')
+
+    def check(self, frames: List) -> List[Firing]:
+        fired = []
+        decode = self.decoder.decode
+        servo = self.servo
+        for frame in frames:
+            decoded = decode(frame.arbitration_id, frame.data)
+            if decoded is not None and decoded[0] is servo and decoded[1][self.error_index]:
+                fired.append((frame.timestamp, f'servo_error_0x{frame.arbitration_id:03X}'))
+        return fired
+
+class LatencyTrigger(Trigger):
+    """Fire when a command-to-response latency exceeds threshold_ms (see can_latency)."""
+
+    name = 'latency'
+
+    def __init__(self, threshold_ms: float = LATENCY_THRESHOLD_MS):
+        from can_latency import LatencyTracker
+        # No timeout: late responses are exactly what this trigger is looking for
+        self.tracker = LatencyTracker(timeout=float('inf'))
+        self.threshold_ms = threshold_ms
+
+    def check(self, frames: List) -> List[Firing]:
+        fired = []
+        update = self.tracker.update
+        for frame in frames:
+            latency = update(frame.arbitration_id, frame.timestamp, frame.data)
+            if latency is not None and latency > self.threshold_ms:
+                fired.append((frame.timestamp, f'latency_0x{frame.arbitration_id:03X}'))
+        return fired
+
+class CountMismatchTrigger(Trigger):
+    """Fire at the end of a window in which groups sharing a module differ by more than tolerance frames."""
+
+    name = 'count'
+
+    def __init__(self, groups: Dict[str, List[str]] = COUNT_GROUPS, window_size: float = COUNT_WINDOW,
+                 tolerance: int = COUNT_TOLERANCE):
+        from can_message_comparison import MessageClassifier
+        self.classifier = MessageClassifier(groups)
+        self.window_size = window_size
+        self.tolerance = tolerance
+        self.counts = [0] * len(self.classifier.slots)
+        self.window = None
+
+    def check(self, frames: List) -> List[Firing]:
+        fired = []
+        table = self.classifier.table
+        counts = self.counts
+        for frame in frames:
+            window = frame.timestamp // self.window_size
+            if window != self.window:
+                if self.window is not None:
+                    end = (self.window + 1) * self.window_size
+                    for group, module_id, count, expected in self.classifier.divergences(counts):
+                        if expected - count > self.tolerance:
+                            fired.append((end, f'count_{group}_{module_id}'))
+                    counts = self.counts = [0] * len(counts)
+                self.window = window
+            slot = table.get(frame.arbitration_id)
+            if slot is not None:
+                counts[slot] += 1
+        return fired
+
+# Trigger name -> factory
+TRIGGERS = {
+    'servo_error': ServoErrorTrigger,
+    'latency': LatencyTrigger,
+    'count': CountMismatchTrigger,
+}
+
+@dataclass
+class Event:
+    number: int
+    trigger_time: float
+    start: float
+    end: float
+    reasons: Dict[str, int] = field(default_factory=dict)  # Reason -> triggers
+    frames: int = 0
+    dropped: int = 0  # Frames not written because the writer queue was full
+    truncated: bool = False
+    file: Optional[TextIO] = None  # Only used on the writer thread
+
+class FlightRecorder:
+    """
+    Keep the most recent frames in a bounded ring and dump a window around every trigger.
+
+    Memory is bounded by max_frames, disk use by max_events and max_event_seconds. A trigger
+    opens an event covering [t - pre_seconds, t + post_seconds]; triggers inside an open
+    event extend it. The pre-trigger frames come from the ring (which must hold pre_seconds
+    of traffic, otherwise the event is marked truncated); later frames are appended as they
+    arrive. All file writes run on one background thread as `candump -L` text; at most
+    max_pending_frames wait for it, frames beyond that are dropped and counted per event.
+    """
+
+    def __init__(self, output_dir: str = OUTPUT_DIR, triggers: Optional[List[Trigger]] = None,
+                 pre_seconds: float = PRE_SECONDS, post_seconds: float = POST_SECONDS,
+                 max_frames: int = MAX_FRAMES, max_events: int = MAX_EVENTS,
+                 max_event_seconds: float = MAX_EVENT_SECONDS, max_pending_frames: int = MAX_PENDING_FRAMES):
+        self.output_dir = output_dir
+        self.triggers = triggers if triggers is not None else [ServoErrorTrigger()]
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_events = max_events
+        self.max_event_seconds = max_event_seconds
+        self.ring: deque = deque(maxlen=max_frames)
+        self.event: Optional[Event] = None
+        self.events_started = 0
+        self.suppressed = 0
+        self.last_fired: Dict[str, float] = {}  # Reason -> time, so a persisting fault is not re-triggered
+        self.run_name = time.strftime('%Y%m%d_%H%M%S')
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='flight-recorder')
+        self.max_pending_frames = max_pending_frames
+        self.pending_frames = 0  # Submitted to the writer and not written yet
+        self.pending_lock = threading.Lock()
+        self.dropped_frames = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def handle(self, frames: List):
+        if not frames:
+            return
+        fired = sorted(firing for trigger in self.triggers for firing in trigger.check(frames))
+        position = 0  # frames[:position] have been passed to the open event
+        for timestamp, reason in fired:
+            if self.event is not None and timestamp > self.event.end:
+                position = self._record(frames, position)
+                self._close()
+            self._fire(timestamp, reason, frames[:position])
+        if self.event is not None:
+            position = self._record(frames, position)
+            if frames[-1].timestamp > self.event.end:
+                self._close()
+        self.ring.extend(frames)
+
+    def _fire(self, timestamp: float, reason: str, recorded: List):
+        """
+        :param recorded: Frames of the current batch that are not in the ring yet but were
+                         already passed to the previous event
+        """
+        last = self.last_fired.get(reason)
+        if last is not None and timestamp - last < self.post_seconds:
+            return
+        self.last_fired[reason] = timestamp
+
+        event = self.event
+        if event is not None:
+            event.end = min(max(event.end, timestamp + self.post_seconds), event.start + self.max_event_seconds)
+            event.reasons[reason] = event.reasons.get(reason, 0) + 1
+            return
+        if self.events_started >= self.max_events:
+            self.suppressed += 1
+            return
+
+        self.events_started += 1
+        start = timestamp - self.pre_seconds
+        event = self.event = Event(self.events_started, timestamp, start, timestamp + self.post_seconds, {reason: 1})
+        # Newest frames first until the start of the window; the ring is in arrival order
+        history = list(itertools.takewhile(lambda frame: frame.timestamp >= start, reversed(self.ring)))
+        history.reverse()
+        event.truncated = len(history) == len(self.ring) == self.ring.maxlen
+        history.extend(frame for frame in recorded if frame.timestamp >= start)
+        print(f"Trigger '{reason}' at {timestamp:.6f}, recording event {event.number}")
+        self.executor.submit(self._open_file, event)
+        self._submit(history)
+
+    def _record(self, frames: List, position: int) -> int:
+        """Pass frames[position:] up to the end of the open event to the writer; return the new position."""
+        end = bisect.bisect_right(frames, self.event.end, lo=position, key=TIMESTAMP)
+        if end > position:
+            self._submit(frames[position:end])
+        return end
+
+    def _submit(self, frames: List):
+        if not frames:
+            return
+        with self.pending_lock:
+            if self.pending_frames + len(frames) > self.max_pending_frames:
+                # The disk cannot keep up; drop rather than let the queue grow without bound
+                self.event.dropped += len(frames)
+                self.dropped_frames += len(frames)
+                return
+            self.pending_frames += len(frames)
+        self.event.frames += len(frames)
+        self.executor.submit(self._write_frames, self.event, frames)
+
+    def _close(self):
+        self.executor.submit(self._close_file, self.event)
+        self.event = None
+
+    def _open_file(self, event: Event):
+        path = os.path.join(self.output_dir, f'{self.run_name}_event{event.number:04d}_{next(iter(event.reasons))}.log')
+        try:
+            event.file = open(path, 'w')
+        except OSError as e:
+            print(f"Error opening event file: {e}")
+
+    def _write_frames(self, event: Event, frames: List):
+        try:
+            if event.file is not None:
+                event.file.writelines(format_candump_line(frame.timestamp, frame.channel or 'can0', frame.arbitration_id,
+                                                          frame.data, frame.is_fd, frame.is_extended_id) + '\n'
+                                      for frame in frames)
+        except OSError as e:
+            print(f"Error writing event {event.number}: {e}")
+        finally:
+            with self.pending_lock:
+                self.pending_frames -= len(frames)
+
+    def _close_file(self, event: Event):
+        if event.file is None:
+            return
+        event.file.close()
+        record = {'event': event.number, 'file': os.path.basename(event.file.name), 'trigger_time': event.trigger_time,
+                  'start': event.start, 'end': event.end, 'reasons': event.reasons, 'frames': event.frames,
+                  'dropped': event.dropped, 'truncated': event.truncated}
+        with open(os.path.join(self.output_dir, f'{self.run_name}_events.jsonl'), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        dropped = f", {event.dropped} dropped" if event.dropped else ''
+        print(f"Wrote event {event.number} ({event.frames} frames{dropped}{', truncated' if event.truncated else ''}) "
+              f"to {event.file.name}")
+
+    def close(self):
+        """Close a pending event with the frames received so far and wait for the writer."""
+        if self.event is not None:
+            self._close()
+        self.executor.shutdown(wait=True)
+        if self.suppressed:
+            print(f"{self.suppressed} triggers ignored after {self.max_events} events")
+        if self.dropped_frames:
+            print(f"{self.dropped_frames} frames dropped because the writer fell behind")
+
+def make_triggers(names: List[str], latency_threshold_ms: float = LATENCY_THRESHOLD_MS,
+                  count_window: float = COUNT_WINDOW, count_tolerance: int = COUNT_TOLERANCE) -> List[Trigger]:
+    triggers = []
+    for name in names:
+        if name == 'latency':
+            triggers.append(LatencyTrigger(latency_threshold_ms))
+        elif name == 'count':
+            triggers.append(CountMismatchTrigger(window_size=count_window, tolerance=count_tolerance))
+        else:
+            triggers.append(TRIGGERS[name]())
+    return triggers
+
+def iter_batches(frames, batch_size: int = 256):
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Keep the last frames in memory and dump a window around every '
+                                                 'trigger (servo error, latency spike, count mismatch).')
+    parser.add_argument('--log', help='Replay a recorded log (candump -L, ASC, BLF) instead of stdin')
+    parser.add_argument('--bus', metavar='CHANNEL', help='Record the live bus, e.g. can0')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--triggers', default='servo_error,latency,count', help=f"Comma separated, from: {', '.join(TRIGGERS)}")
+    parser.add_argument('--pre', type=float, default=PRE_SECONDS, help='Seconds before a trigger')
+    parser.add_argument('--post', type=float, default=POST_SECONDS, help='Seconds after a trigger')
+    parser.add_argument('--max-frames', type=int, default=MAX_FRAMES, help='Frames held in memory')
+    parser.add_argument('--max-events', type=int, default=MAX_EVENTS)
+    parser.add_argument('--max-event-seconds', type=float, default=MAX_EVENT_SECONDS)
+    parser.add_argument('--max-pending-frames', type=int, default=MAX_PENDING_FRAMES,
+                        help='Frames queued for the writer before frames are dropped')
+    parser.add_argument('--latency-threshold', type=float, default=LATENCY_THRESHOLD_MS, help='Milliseconds')
+    parser.add_argument('--count-window', type=float, default=COUNT_WINDOW, help='Seconds')
+    parser.add_argument('--count-tolerance', type=int, default=COUNT_TOLERANCE, help='Frames')
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.triggers.split(',') if name.strip()]
+    unknown = [name for name in names if name not in TRIGGERS]
+    if unknown:
+        parser.error(f"Unknown triggers: {', '.join(unknown)}")
+    recorder = FlightRecorder(args.output_dir, make_triggers(names, args.latency_threshold, args.count_window,
+                                                             args.count_tolerance),
+                              args.pre, args.post, args.max_frames, args.max_events, args.max_event_seconds,
+                              args.max_pending_frames)
+
+    bus = None
+    try:
+        if args.bus:
+            from canfd_handler import setup_can_interface
+            from can_receiver import BatchReceiver
+            bus = setup_can_interface(args.bus)
+            if bus is None:
+                return
+            receiver = BatchReceiver(bus)
+            print(f"Recording {args.bus}, press Ctrl+C to stop")
+            while True:
+                recorder.handle(receiver.recv_batch(1.0))
+        else:
+            if args.log:
+                from can_replay import iter_log_frames
+                frames = iter_log_frames(args.log)
+            else:
+                frames = parse_candump_lines(sys.stdin)
+            for batch in iter_batches(frames):
+                recorder.handle(batch)
+    except KeyboardInterrupt:
+        print("\nProgram terminated by user.")
+    finally:
+        recorder.close()
+        if bus is not None:
+            bus.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,234 @@
 import sys
-import time
-from collections import deque
+import math
+import argparse
+from typing import Dict, Iterable, Optional
+from candump_log import parse_frame_header, read_chunks, iter_line_batches
 
-def calculate_average_interval():
-    intervals = deque()
-    last_timestamp = None
-    current_second = int(time.time())
-    next_print_time = current_second + 1
+REPORT_PERIOD = 1.0  # Seconds of log time per report
+QUANTILES = (0.5, 0.99, 0.999)
+SKETCH_RELATIVE_ACCURACY = 0.01  # Quantiles are within 1% of the true value
+SKETCH_MAX_BUCKETS = 2048
 
-    print("Calculating average CAN bus message interval using system time. Press Ctrl+C to stop.")
-    print("Time (s) | Avg Interval (ms)")
-    print("----------------------------")
+class QuantileSketch:
+    """
+    Streaming quantile sketch with logarithmic buckets (DDSketch).
+
+    Each value is counted in bucket ceil(log_gamma(value)), so quantiles are returned with a
+    bounded relative error. The number of buckets is capped by collapsing the lowest ones,
+    which keeps memory constant no matter how many values are added. Sketches can be merged.
+    """
+
+    __slots__ = ('gamma', 'log_gamma', 'max_buckets', 'buckets', 'zero_count', 'count')
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY, max_buckets: int = SKETCH_MAX_BUCKETS):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + 1
+        if len(buckets) > self.max_buckets:
+            self._collapse()
+
+    def add_zeros(self, count: int):
+        """Add count values <= 0 at once (e.g. idle windows)."""
+        self.zero_count += count
+        self.count += count
+
+    def _collapse(self):
+        lowest, second = sorted(self.buckets)[:2]
+        self.buckets[second] += self.buckets.pop(lowest)
+
+    def merge(self, other: 'QuantileSketch'):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        while len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+class IntervalStats:
+    """Count, mean, standard deviation (Welford), min/max and quantiles of one ID's intervals."""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max', 'sketch')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+
+    def add(self, interval: float):
+        self.count += 1
+        delta = interval - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (interval - self.mean)
+        if interval < self.min:
+            self.min = interval
+        if interval > self.max:
+            self.max = interval
+        self.sketch.add(interval)
+
+    def merge(self, other: 'IntervalStats'):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+class ReportPeriods:
+    """
+    Split frame time into report periods aligned to multiples of the period length.
+
+    The caller compares each timestamp with next_time (one float comparison per frame) and
+    only calls advance() once a frame has left the current period.
+    """
+
+    __slots__ = ('period', 'label_format', 'next_time')
+
+    def __init__(self, period: float = REPORT_PERIOD):
+        self.period = period
+        self.label_format = '.0f' if period >= 1 else '.3f'
+        self.next_time = -math.inf  # End of the current period; the first frame starts one
+
+    def advance(self, timestamp: float) -> Optional[str]:
+        """
+        Start the period holding timestamp.
+
+        :return: Label of the period that ended, or None for the first frame
+        """
+        label = self.label if self.next_time != -math.inf else None
+        self.next_time = (timestamp // self.period + 1) * self.period
+        return label
+
+    @property
+    def label(self) -> str:
+        """Start time of the current period, or "last" before the first frame."""
+        return format(self.next_time - self.period, self.label_format) if self.next_time != -math.inf else "last"
+
+class IntervalTracker:
+    """
+    Per-arbitration-ID interval statistics over the frame timestamps.
+
+    update() is O(1) per frame. Statistics of the current report period are kept separately
+    and merged into the totals by end_period().
+    """
+
+    def __init__(self):
+        self.last_timestamp: Dict[int, float] = {}
+        self.period: Dict[int, IntervalStats] = {}
+        self.total: Dict[int, IntervalStats] = {}
+
+    def update(self, arbitration_id: int, timestamp: float):
+        last = self.last_timestamp.get(arbitration_id)
+        self.last_timestamp[arbitration_id] = timestamp
+        if last is None:
+            return
+        stats = self.period.get(arbitration_id)
+        if stats is None:
+            stats = self.period[arbitration_id] = IntervalStats()
+        stats.add((timestamp - last) * 1000)  # Convert to milliseconds
+
+    def end_period(self) -> Dict[int, IntervalStats]:
+        period = self.period
+        self.period = {}
+        for arbitration_id, stats in period.items():
+            if arbitration_id not in self.total:
+                self.total[arbitration_id] = IntervalStats()
+            self.total[arbitration_id].merge(stats)
+        return period
+
+def print_header():
+    print("Time (s)   | ID    | Count | Mean (ms) | Min (ms) | Max (ms) | Std (ms) | p50 (ms) | p99 (ms) | p99.9 (ms)")
+    print("-----------------------------------------------------------------------------------------------------------")
+
+def print_stats(label: str, stats_by_id: Dict[int, IntervalStats]):
+    for arbitration_id in sorted(stats_by_id):
+        stats = stats_by_id[arbitration_id]
+        p50, p99, p999 = (stats.sketch.quantile(q) for q in QUANTILES)
+        print(f"{label:<10} | {arbitration_id:03X}   | {stats.count:>5} | {stats.mean:>9.3f} | {stats.min:>8.3f} | "
+              f"{stats.max:>8.3f} | {stats.std:>8.3f} | {p50:>8.3f} | {p99:>8.3f} | {p999:>10.3f}")
+
+def calculate_average_interval(chunks: Iterable[bytes] = None, report_period: float = REPORT_PERIOD) -> IntervalTracker:
+    """
+    Print per-ID interval statistics of `candump -L` output using the logged timestamps.
+
+    :param chunks: Byte chunks of candump output (buffered stdin by default)
+    :param report_period: Seconds of log time per printed report
+    :return: The tracker holding the totals
+    """
+    if chunks is None:
+        chunks = read_chunks(sys.stdin.buffer)
+    tracker = IntervalTracker()
+    update = tracker.update
+    periods = ReportPeriods(report_period)
+
+    print("Calculating CAN message intervals per ID from candump timestamps. Press Ctrl+C to stop.")
+    print_header()
 
     try:
-        while True:
-            line = sys.stdin.readline().strip()
-            if not line:
-                continue
-
-            current_time = time.time()
-            current_second = int(current_time)
-            
-            if last_timestamp is not None:
-                interval = (current_time - last_timestamp) * 1000  # Convert to milliseconds
-                intervals.append(interval)
-            
-            if current_second >= next_print_time:
-                if intervals:
-                    avg_interval = sum(intervals) / len(intervals)
-                    print(f"{current_second-1:<9} | {avg_interval:>14.3f}")
-                else:
-                    print(f"{current_second-1:<9} | {'N/A':>14}")
-                
-                intervals.clear()
-                next_print_time = current_second + 1
-            
-            last_timestamp = current_time
-            
+        for lines in iter_line_batches(chunks):
+            for line in lines:
+                frame = parse_frame_header(line)
+                if frame is None:
+                    continue
+                timestamp, arbitration_id = frame
+
+                if timestamp >= periods.next_time:
+                    label = periods.advance(timestamp)
+                    if label is not None:
+                        print_stats(label, tracker.end_period())
+
+                update(arbitration_id, timestamp)
+
     except KeyboardInterrupt:
         print("\nProgram terminated by user.")
 
+    # The last, partial period is printed like the full ones
+    print_stats(periods.label, tracker.end_period())
+    if tracker.total:
+        print("Total:")
+        print_stats("total", tracker.total)
+    return tracker
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-ID CAN message interval statistics from `candump -L` on stdin.')
+    parser.add_argument('--period', type=float, default=REPORT_PERIOD, help='Seconds of log time per report')
+    args = parser.parse_args(argv)
+    calculate_average_interval(report_period=args.period)
+
 if __name__ == "__main__":
-    calculate_average_interval()
\ No newline at end of file
+    main()
@@ -0,0 +1,345 @@
+import os
+import mmap
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from can_message_processor import CANMessageProcessor, COMMAND_DTYPE, SERVO_DTYPE, ID_BASE_MASK, MODULE_ID_MASK, \
+    COMMAND, SERVO, responses_to_dataframe
+from can_stream_writer import StreamingCSVWriter
+
+# Block log settings
+BLOCK_ROWS = 4096  # Records per block; every block of a kind has the same size on disk
+BATCH_SIZE = 10000  # Frames decoded per batch when indexing a recorded log
+MAGIC = b'CANBLK01'
+INDEX_MAGIC = b'CANIDX01'
+HEADER_SIZE = 16  # Magic and block_rows, at the start of both files
+LOG_EXTENSION = '.canlog'
+INDEX_EXTENSION = '.idx'
+
+# Record kind -> (code stored in the index, row layout)
+KINDS: Dict[str, Tuple[int, np.dtype]] = {
+    'command': (0, COMMAND_DTYPE),
+    'servo': (1, SERVO_DTYPE),
+}
+KIND_BY_CODE = {code: name for name, (code, _) in KINDS.items()}
+# Kind names used by CANMessageProcessor's file names
+KIND_ALIASES = {'servo_responses': 'servo'}
+
+# One sparse index entry per block
+INDEX_DTYPE = np.dtype([
+    ('kind', 'u1'),
+    ('reserved', 'u1'),
+    ('module_id', '<u2'),
+    ('rows', '<u4'),  # Valid records in the block; only the last block of a stream may be partial
+    ('offset', '<u8'),  # Byte offset of the block in the log
+    ('first_time', '<f8'),  # Smallest timestamp in the block
+    ('last_time', '<f8'),  # Largest timestamp in the block
+])
+
+def index_path(path: str) -> str:
+    return path + INDEX_EXTENSION
+
+def _file_header(magic: bytes, block_rows: int) -> bytes:
+    return magic + block_rows.to_bytes(4, 'little') + bytes(HEADER_SIZE - len(magic) - 4)
+
+def _read_header(f, magic: bytes) -> int:
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:len(magic)] != magic:
+        raise ValueError(f"{f.name} is not a CAN block log file")
+    return int.from_bytes(header[len(magic):len(magic) + 4], 'little')
+
+class IndexedLogWriter:
+    """
+    Append-only log of fixed-size record blocks with a sparse block index.
+
+    Records are collected per (kind, module) until a block of block_rows is full, so every
+    block holds one module's rows of one kind. The block is appended to the log and its
+    index entry (kind, module, offset, time span) to the .idx file next to it; a crash
+    therefore loses at most the unwritten partial blocks. close() writes those padded to
+    the full block size.
+    """
+
+    def __init__(self, path: str, block_rows: int = BLOCK_ROWS):
+        self.path = path
+        self.block_rows = block_rows
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, 'ab')
+        self.index_file = open(index_path(path), 'ab')
+        if exists:
+            with open(path, 'rb') as f:
+                if _read_header(f, MAGIC) != block_rows:
+                    raise ValueError(f"{path} was written with a different block size")
+        else:
+            self.file.write(_file_header(MAGIC, block_rows))
+            self.index_file.write(_file_header(INDEX_MAGIC, block_rows))
+        self.offset = self.file.tell()
+        # (kind, module_id) -> rows waiting for a full block
+        self.pending: Dict[Tuple[str, int], List[np.ndarray]] = {}
+        self.pending_rows: Dict[Tuple[str, int], int] = {}
+        self.blocks = 0
+        self.records = 0
+
+    def append(self, kind: str, module_id: int, rows: np.ndarray):
+        """Add rows of COMMAND_DTYPE ('command') or SERVO_DTYPE ('servo') for one module."""
+        kind = KIND_ALIASES.get(kind, kind)
+        if not len(rows):
+            return
+        key = (kind, module_id)
+        chunks = self.pending.setdefault(key, [])
+        chunks.append(rows)
+        self.pending_rows[key] = self.pending_rows.get(key, 0) + len(rows)
+        if self.pending_rows[key] >= self.block_rows:
+            self._write_blocks(key, partial=False)
+
+    def write_chunk(self, chunk: Tuple[Dict[int, np.ndarray], Dict[int, np.ndarray]]):
+        """Append one chunk returned by CANMessageProcessor.drain()."""
+        command_chunks, servo_chunks = chunk
+        for module_id, rows in command_chunks.items():
+            self.append('command', module_id, rows)
+        for module_id, rows in servo_chunks.items():
+            self.append('servo', module_id, rows)
+
+    def _write_blocks(self, key: Tuple[str, int], partial: bool):
+        kind, module_id = key
+        code, dtype = KINDS[kind]
+        chunks = self.pending.pop(key)
+        rows = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        self.pending_rows[key] = 0
+        full = len(rows) - len(rows) % self.block_rows
+        end = len(rows) if partial else full
+        entries = []
+        block = np.zeros(self.block_rows, dtype=dtype)
+        for start in range(0, end, self.block_rows):
+            block_rows = rows[start:start + self.block_rows]
+            block[:len(block_rows)] = block_rows
+            block[len(block_rows):] = 0
+            self.file.write(block.tobytes())
+            # fmin/fmax skip NaN timestamps; the span is NaN only when the whole block is
+            timestamps = block_rows['timestamp']
+            entries.append((code, 0, module_id, len(block_rows), self.offset,
+                            np.fmin.reduce(timestamps), np.fmax.reduce(timestamps)))
+            self.offset += block.nbytes
+            self.records += len(block_rows)
+        if full < len(rows) and not partial:
+            self.pending[key] = [rows[full:]]
+            self.pending_rows[key] = len(rows) - full
+        if entries:
+            # Data first, so that an index entry never points past the end of the log
+            self.file.flush()
+            self.index_file.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+            self.index_file.flush()
+            self.blocks += len(entries)
+
+    def close(self):
+        for key in list(self.pending):
+            if self.pending_rows[key]:
+                self._write_blocks(key, partial=True)
+        self.file.close()
+        self.index_file.close()
+
+class StreamingIndexedWriter(StreamingCSVWriter):
+    """StreamingCSVWriter that appends the drained chunks to an indexed block log instead of CSV files."""
+
+    def __init__(self, processor: CANMessageProcessor, output_dir: str = 'output', block_rows: int = BLOCK_ROWS,
+                 **kwargs):
+        os.makedirs(output_dir, exist_ok=True)
+        self.log = IndexedLogWriter(os.path.join(output_dir, f'{processor.start_time}{LOG_EXTENSION}'), block_rows)
+        super().__init__(processor, output_dir, **kwargs)
+
+    def _write(self, kind: str, module_id: int, rows: np.ndarray):
+        self.log.append(kind, module_id, rows)
+        self.written_frames += len(rows)
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        self.log.close()
+        print(f"Indexed log: {self.log.path} ({self.log.blocks} blocks)")
+
+def save_indexed(processor: CANMessageProcessor, output_dir: str = 'output', block_rows: int = BLOCK_ROWS) -> str:
+    """Write all records of a processor to <output_dir>/<start_time>.canlog and return the path."""
+    os.makedirs(output_dir, exist_ok=True)
+    writer = IndexedLogWriter(os.path.join(output_dir, f'{processor.start_time}{LOG_EXTENSION}'), block_rows)
+    for module_id, responses in processor.command_responses.items():
+        writer.append('command', module_id, responses.view())
+    for module_id, responses in processor.servo_responses.items():
+        writer.append('servo', module_id, responses.view())
+    writer.close()
+    return writer.path
+
+def index_recorded_log(path: str, log_path: str, block_rows: int = BLOCK_ROWS, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Convert a recorded log (candump -L, ASC, BLF, ...) into a block log with bounded memory.
+
+    Frames are decoded in batches and each batch is handed to the writer right away, so
+    only one batch and the partial blocks are held in memory whatever the log size.
+
+    :return: Number of frames read
+    """
+    from can_replay import iter_log_frames
+    # A conversion replaces the output instead of appending to it
+    for existing in (log_path, index_path(log_path)):
+        if os.path.exists(existing):
+            os.remove(existing)
+    processor = CANMessageProcessor()
+    writer = IndexedLogWriter(log_path, block_rows)
+    commands = []
+    servos = []
+    count = 0
+
+    def flush():
+        if commands:
+            processor.process_command_batch(commands)
+        if servos:
+            processor.process_servo_batch(servos)
+        commands.clear()
+        servos.clear()
+        writer.write_chunk(processor.drain())
+
+    try:
+        for frame in iter_log_frames(path):
+            count += 1
+            base = frame.arbitration_id & ID_BASE_MASK
+            if base == COMMAND.base_id:
+                commands.append(frame)
+            elif base == SERVO.base_id:
+                servos.append(frame)
+            if len(commands) + len(servos) >= batch_size:
+                flush()
+        flush()
+    finally:
+        writer.close()
+    return count
+
+class IndexedLogReader:
+    """
+    Query a log written by IndexedLogWriter.
+
+    The index is loaded into memory (32 bytes per block) and the log is memory-mapped, so a
+    query selects the matching blocks with one vectorized comparison over the index and then
+    only touches the pages of those blocks. Query time depends on the size of the result,
+    not of the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.block_rows = _read_header(self.file, MAGIC)
+        self.mmap = None
+        self.index = np.empty(0, dtype=INDEX_DTYPE)
+        self.refresh()
+
+    def refresh(self):
+        """Pick up blocks appended since the log was opened (the log may still be written)."""
+        with open(index_path(self.path), 'rb') as f:
+            _read_header(f, INDEX_MAGIC)
+            data = f.read()
+        self.index = np.frombuffer(data, dtype=INDEX_DTYPE, count=len(data) // INDEX_DTYPE.itemsize)
+        if self.mmap is not None:
+            self.mmap.close()
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def modules(self, kind: str) -> List[int]:
+        code = KINDS[kind][0]
+        return sorted(int(module_id) for module_id in np.unique(self.index['module_id'][self.index['kind'] == code]))
+
+    def time_range(self) -> Tuple[float, float]:
+        if not len(self.index):
+            return float('nan'), float('nan')
+        return float(np.fmin.reduce(self.index['first_time'])), float(np.fmax.reduce(self.index['last_time']))
+
+    def query(self, kind: str, module_id: Optional[int] = None, start: float = -np.inf,
+              end: float = np.inf) -> np.ndarray:
+        """
+        Return the records of one kind with start <= timestamp <= end, in log order.
+
+        Without start and end every record is returned, including those with NaN timestamps.
+
+        :param kind: 'command' or 'servo'
+        :param module_id: Only this module, or every module if None
+        :return: Rows of COMMAND_DTYPE or SERVO_DTYPE (copies; the log stays mapped read-only)
+        """
+        code, dtype = KINDS[kind]
+        index = self.index
+        bounded = start > -np.inf or end < np.inf
+        selected = index['kind'] == code
+        if bounded:
+            selected &= (index['last_time'] >= start) & (index['first_time'] <= end)
+        if module_id is not None:
+            selected &= index['module_id'] == module_id
+        parts = []
+        for entry in index[selected]:
+            rows = np.frombuffer(self.mmap, dtype=dtype, count=int(entry['rows']), offset=int(entry['offset']))
+            if bounded and (entry['first_time'] < start or entry['last_time'] > end):
+                timestamps = rows['timestamp']
+                rows = rows[(timestamps >= start) & (timestamps <= end)]
+            parts.append(rows)
+        if not parts:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(parts)
+
+    def query_id(self, arbitration_id: int, start: float = -np.inf, end: float = np.inf) -> np.ndarray:
+        """Records of one arbitration ID (e.g. 0x503 for the servo responses of module 3)."""
+        base = arbitration_id & ID_BASE_MASK
+        kind = 'command' if base == COMMAND.base_id else 'servo' if base == SERVO.base_id else None
+        if kind is None:
+            raise ValueError(f"0x{arbitration_id:X} is neither a command nor a servo response ID")
+        return self.query(kind, arbitration_id & MODULE_ID_MASK, start, end)
+
+    def servo(self, module_id: int, start: float = -np.inf, end: float = np.inf) -> np.ndarray:
+        return self.query('servo', module_id, start, end)
+
+    def command(self, module_id: int, start: float = -np.inf, end: float = np.inf) -> np.ndarray:
+        return self.query('command', module_id, start, end)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query an indexed CAN block log by module, ID and time range.')
+    parser.add_argument('path', help='.canlog file')
+    parser.add_argument('--kind', choices=tuple(KINDS), default='servo')
+    parser.add_argument('--module', type=int, default=None)
+    parser.add_argument('--id', type=lambda value: int(value, 0), default=None, help='Arbitration ID, e.g. 0x503')
+    parser.add_argument('--start', type=float, default=-np.inf, help='Seconds from the start of the log')
+    parser.add_argument('--end', type=float, default=np.inf, help='Seconds from the start of the log')
+    parser.add_argument('--absolute', action='store_true', help='--start/--end are absolute timestamps')
+    parser.add_argument('--csv', default=None, help='Write the result to this CSV file')
+    args = parser.parse_args(argv)
+
+    with IndexedLogReader(args.path) as reader:
+        first, last = reader.time_range()
+        offset = 0.0 if args.absolute else first
+        start, end = args.start + offset, args.end + offset
+        if args.id is None and args.module is None:
+            print(f"{args.path}: {len(reader.index)} blocks of {reader.block_rows} records, "
+                  f"{last - first:.3f}s from {first:.6f}")
+            for kind in KINDS:
+                print(f"  {kind}: modules {reader.modules(kind)}")
+            return
+        if args.id is not None:
+            rows = reader.query_id(args.id, start, end)
+            module_id = args.id & MODULE_ID_MASK
+        else:
+            rows = reader.query(args.kind, args.module, start, end)
+            module_id = args.module
+        print(f"{len(rows)} records")
+        df = responses_to_dataframe(module_id, rows)
+        if args.csv:
+            df.to_csv(args.csv, index=False)
+            print(f"Saved to {args.csv}")
+        else:
+            print(df.to_string(max_rows=20))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import sys
+import bisect
+import argparse
+from typing import Dict, Iterable, Optional, Tuple
+
+from candump_log import parse_candump_lines
+from can_frequency import IntervalStats, QUANTILES, ReportPeriods
+from can_schema import MessageType, SchemaDecoder, default_decoder, default_schema
+
+# Arbitration IDs from the shared message schema (can_schema.json)
+SCHEMA = default_schema()
+COMMAND_ID_BASE = SCHEMA.message('command').base_id
+RESPONSE_MESSAGES = ('servo', 'position')  # Servo response frames and the position variant of feedback frames
+RESPONSE_ID_BASES = tuple(SCHEMA.message(name).base_id for name in RESPONSE_MESSAGES)
+ID_BASE_MASK = SCHEMA.message('command').mask
+MODULE_ID_MASK = SCHEMA.message('command').module_mask
+RESPONSE_TIMEOUT = 0.01  # Seconds after which a command counts as unanswered
+REPORT_PERIOD = 1.0  # Seconds of frame time per report
+HISTOGRAM_EDGES_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10)
+
+class LatencyStats:
+    """Round-trip latency statistics of one (module, response message)."""
+
+    __slots__ = ('latency', 'histogram', 'timeouts', 'missing', 'unmatched')
+
+    def __init__(self):
+        self.latency = IntervalStats()  # Milliseconds
+        self.histogram = [0] * (len(HISTOGRAM_EDGES_MS) + 1)
+        self.timeouts = 0  # Responses that arrived after the timeout
+        self.missing = 0  # Commands superseded by the next command without a response
+        self.unmatched = 0  # Responses without a pending command
+
+    def add(self, latency_ms: float):
+        self.latency.add(latency_ms)
+        self.histogram[bisect.bisect_right(HISTOGRAM_EDGES_MS, latency_ms)] += 1
+
+    def merge(self, other: 'LatencyStats'):
+        self.latency.merge(other.latency)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        self.timeouts += other.timeouts
+        self.missing += other.missing
+        self.unmatched += other.unmatched
+
+class LatencyTracker:
+    """
+    Pair each command frame with the next response frame of the same module.
+
+    Responses are resolved through the schema decoder, so only the response messages count:
+    a feedback frame of another frame type neither answers nor closes a pending command.
+    One pending command timestamp is kept per (module, response message), so update() is O(1)
+    per frame. Commands only arm the response streams already seen from their module, so a
+    module that answers on one stream is not counted as missing on the others; the first
+    response of a stream is paired with the module's last command. A command that is
+    followed by another command before its response arrives counts as missing; a response
+    later than the timeout counts as a timeout instead of a latency sample.
+    """
+
+    def __init__(self, timeout: float = RESPONSE_TIMEOUT, responses: Tuple[str, ...] = RESPONSE_MESSAGES,
+                 decoder: Optional[SchemaDecoder] = None):
+        """
+        :param responses: Names of the schema messages (or variants) that answer a command
+        :param decoder: Decoder resolving response frames, the default schema's if None
+        """
+        self.timeout = timeout
+        self.decoder = decoder if decoder is not None else default_decoder()
+        self.responses = {self.decoder.schema.message(name): name for name in responses}
+        self.response_bases = frozenset(message.base_id for message in self.responses)  # IDs worth decoding
+        self.pending: Dict[Tuple[int, str], float] = {}  # (module, response) -> command timestamp
+        self.last_command: Dict[int, float] = {}  # Module -> timestamp of its last command
+        self.streams: Dict[int, Tuple[str, ...]] = {}  # Module -> responses seen from it
+        self.stats: Dict[Tuple[int, str], LatencyStats] = {}  # Current period
+        self.total: Dict[Tuple[int, str], LatencyStats] = {}  # Completed periods
+
+    def _stats(self, key: Tuple[int, str]) -> LatencyStats:
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = LatencyStats()
+        return stats
+
+    def update(self, arbitration_id: int, timestamp: float, data: bytes) -> Optional[float]:
+        """
+        Process one frame, decoding it only if its ID can carry a response.
+
+        :return: The round-trip latency in milliseconds if this frame answered a command
+        """
+        decoded = None
+        if arbitration_id & ID_BASE_MASK in self.response_bases:
+            decoded = self.decoder.decode(arbitration_id, data)
+        return self.update_decoded(arbitration_id, timestamp, decoded)
+
+    def update_decoded(self, arbitration_id: int, timestamp: float,
+                       decoded: Optional[Tuple[MessageType, tuple]]) -> Optional[float]:
+        """
+        Process one frame already decoded by SchemaDecoder.decode (None for frames it does not know).
+
+        :return: The round-trip latency in milliseconds if this frame answered a command
+        """
+        base = arbitration_id & ID_BASE_MASK
+        module_id = arbitration_id & MODULE_ID_MASK
+        if base == COMMAND_ID_BASE:
+            self.last_command[module_id] = timestamp
+            for response in self.streams.get(module_id, ()):
+                key = (module_id, response)
+                if key in self.pending:
+                    self._stats(key).missing += 1
+                self.pending[key] = timestamp
+            return None
+        response = self.responses.get(decoded[0]) if decoded is not None else None
+        if response is None:
+            return None
+
+        key = (module_id, response)
+        streams = self.streams.get(module_id, ())
+        if response in streams:
+            command_timestamp = self.pending.pop(key, None)
+        else:
+            # First response on this stream: answer to the module's last command
+            self.streams[module_id] = streams + (response,)
+            command_timestamp = self.last_command.get(module_id)
+        stats = self._stats(key)
+        latency = timestamp - command_timestamp if command_timestamp is not None else -1
+        if latency < 0:
+            # No command, or frames merged from several sources arrived out of order
+            stats.unmatched += 1
+            return None
+        if latency > self.timeout:
+            stats.timeouts += 1
+            return None
+        latency_ms = latency * 1000
+        stats.add(latency_ms)
+        return latency_ms
+
+    def end_period(self) -> Dict[Tuple[int, str], LatencyStats]:
+        """Return the statistics of the current period, add them to the totals and start a new period."""
+        stats = self.stats
+        self.stats = {}
+        for key, period in stats.items():
+            self.total.setdefault(key, LatencyStats()).merge(period)
+        return stats
+
+def print_header():
+    buckets = " ".join(f"<{edge}" for edge in HISTOGRAM_EDGES_MS) + f" >={HISTOGRAM_EDGES_MS[-1]}"
+    print(f"Time (s)   | Module | Response | Count | Mean (ms) | Max (ms) | p50 (ms) | p99 (ms) | p99.9 (ms) | "
+          f"Timeout | Missing | Unmatched | Histogram ms [{buckets}]")
+    print("-----------------------------------------------------------------------------------------------------------")
+
+def print_stats(label: str, stats_by_key: Dict[Tuple[int, str], LatencyStats]):
+    for module_id, response in sorted(stats_by_key):
+        stats = stats_by_key[(module_id, response)]
+        latency = stats.latency
+        if latency.count:
+            p50, p99, p999 = (f"{latency.sketch.quantile(q):>8.3f}" for q in QUANTILES)
+            mean, maximum = f"{latency.mean:>9.3f}", f"{latency.max:>8.3f}"
+        else:
+            p50 = p99 = p999 = maximum = f"{'N/A':>8}"
+            mean = f"{'N/A':>9}"
+        print(f"{label:<10} | {module_id:>6} | {response:<8} | {latency.count:>5} | {mean} | {maximum} | "
+              f"{p50} | {p99} | {p999:>10} | {stats.timeouts:>7} | {stats.missing:>7} | {stats.unmatched:>9} | "
+              f"{' '.join(str(count) for count in stats.histogram)}")
+
+def track_latency(frames: Iterable, timeout: float = RESPONSE_TIMEOUT,
+                  report_period: float = REPORT_PERIOD) -> LatencyTracker:
+    """
+    Print per-module latency statistics every report_period seconds of frame time.
+
+    :param frames: can.Message or candump_log.Frame objects, in time order
+    :param timeout: Seconds after which a command counts as unanswered
+    :param report_period: Seconds of frame time per report
+    :return: The tracker, with the statistics of the whole input in tracker.total
+    """
+    tracker = LatencyTracker(timeout)
+    update = tracker.update
+    periods = ReportPeriods(report_period)
+    print_header()
+
+    try:
+        for frame in frames:
+            timestamp = frame.timestamp
+            if timestamp >= periods.next_time:
+                label = periods.advance(timestamp)
+                if label is not None:
+                    print_stats(label, tracker.end_period())
+            update(frame.arbitration_id, timestamp, frame.data)
+    except KeyboardInterrupt:
+        print("\nProgram terminated by user.")
+
+    print_stats(periods.label, tracker.end_period())
+    print_stats("total", tracker.total)
+    return tracker
+
+def iter_bus_frames(bus, timeout: float = 1.0):
+    while True:
+        message = bus.recv(timeout)
+        if message is not None:
+            yield message
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Command-to-response latency per module from candump -L on stdin, '
+                                                 'a recorded log or the live bus.')
+    parser.add_argument('--log', help='Recorded log (candump -L, ASC, BLF) to analyze offline')
+    parser.add_argument('--bus', metavar='CHANNEL', help='Read the live bus, e.g. can0')
+    parser.add_argument('--timeout', type=float, default=RESPONSE_TIMEOUT, help='Seconds')
+    parser.add_argument('--period', type=float, default=REPORT_PERIOD, help='Seconds per report')
+    args = parser.parse_args(argv)
+
+    if args.log:
+        from can_replay import iter_log_frames
+        frames = iter_log_frames(args.log)
+    elif args.bus:
+        from canfd_handler import setup_can_interface
+        bus = setup_can_interface(args.bus)
+        if bus is None:
+            return
+        frames = iter_bus_frames(bus)
+    else:
+        frames = parse_candump_lines(sys.stdin)
+    track_latency(frames, args.timeout, args.period)
+
+if __name__ == "__main__":
+    main()
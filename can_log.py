@@ -1,6 +1,14 @@
-import can
 import time
-from can_message_processor import CANMessageProcessor
+import argparse
+from can_message_processor import CANMessageProcessor, COMMAND, SERVO
+from can_stream_writer import StreamingCSVWriter, FLUSH_FRAMES, FLUSH_INTERVAL, MAX_QUEUED_FRAMES
+from can_columnar_io import COLUMNAR_FORMATS
+from can_indexed_log import StreamingIndexedWriter, save_indexed
+from can_compact_log import StreamingCompactWriter, save_compact
+from can_aggregate import SummaryLog, StreamingSummaryWriter, save_summary, WINDOWS
+from can_receiver import BatchReceiver, MAX_BATCH, RCVBUF_SIZE
+from can_metrics import (MetricsRegistry, Reporter, RateTracker, serve_metrics, id_labels,
+                         format_seconds, SIZE_BUCKETS, REPORT_INTERVAL)
 
 # Configuration
 # CAN settings
@@ -8,57 +16,171 @@ CAN_CHANNEL = 'can0'
 CAN_BITRATE = 1_000_000  # 1Mbps
 CAN_DATA_BITRATE = 5_000_000  # 5Mbps
 
-# CAN message filter settings
-COMMAND_ID_BASE = 0x200
-CONTROL_RESPONSE_ID_BASE = 0x500
-MODULE_ID_MASK = 0xFF
+# CAN message filter settings, from the shared message schema (can_schema.json)
+COMMAND_ID_BASE = COMMAND.base_id
+CONTROL_RESPONSE_ID_BASE = SERVO.base_id
+ID_BASE_MASK = SERVO.mask
+MODULE_ID_MASK = SERVO.module_mask
 
-def setup_can_interface():
+# Logging settings
+LOG_DURATION = 60  # Seconds
+OUTPUT_DIR = 'can_output'
+
+def setup_can_interface(channel: str = CAN_CHANNEL):
+    import can
     try:
         filters = [
-            {"can_id": COMMAND_ID_BASE, "can_mask": 0xFF00, "extended": False},
-            {"can_id": CONTROL_RESPONSE_ID_BASE, "can_mask": 0xFF00, "extended": False}
+            {"can_id": COMMAND_ID_BASE, "can_mask": COMMAND.mask, "extended": False},
+            {"can_id": CONTROL_RESPONSE_ID_BASE, "can_mask": SERVO.mask, "extended": False}
         ]
-        bus = can.interface.Bus(channel=CAN_CHANNEL,
+        bus = can.interface.Bus(channel=channel,
                                 interface='socketcan',
                                 fd=True,
                                 bitrate=CAN_BITRATE,
                                 data_bitrate=CAN_DATA_BITRATE,
                                 can_filters=filters)
-        print(f"Successfully configured {CAN_CHANNEL} for CANFD")
+        print(f"Successfully configured {channel} for CANFD")
         print(f"Bitrate: {CAN_BITRATE / 1_000_000}Mbps, Data Bitrate: {CAN_DATA_BITRATE / 1_000_000}Mbps")
         return bus
     except can.CanError as e:
         print(f"Error setting up CAN interface: {e}")
         return None
 
-def main():
-    bus = setup_can_interface()
+class CaptureMetrics:
+    """Counters and histograms of the capture loop, and the periodic summary line."""
+
+    def __init__(self, registry: MetricsRegistry, processor: CANMessageProcessor, receiver: BatchReceiver,
+                 writer=None):
+        self.registry = registry
+        self.processor = processor
+        self.receiver = receiver
+        self.writer = writer
+        # The socket filter only passes command and servo IDs, so per-ID counts are taken from the
+        # decoded batches (one update per module and batch instead of one per frame)
+        self.received = registry.counter('can_frames_received_total', 'Frames received')
+        self.decoded = registry.counter('can_frames_decoded_total', 'Frames decoded per arbitration ID',
+                                        ('id',), key_labels=id_labels)
+        registry.gauge('can_frames_rejected', 'Received frames that could not be decoded (short payload)',
+                       lambda: self.received.total() - self.decoded.total())
+        self.decode_seconds = registry.histogram('can_decode_seconds', 'Decode time per received batch')
+        self.batch_frames = registry.histogram('can_batch_frames', 'Frames per received batch', SIZE_BUCKETS)
+        self.save_seconds = registry.histogram('can_save_seconds', 'Time spent saving the records at the end')
+        registry.gauge('can_socket_drops', 'Frames dropped by the kernel (SO_RXQ_OVFL)',
+                       lambda: receiver.stats.kernel_drops)
+        registry.gauge('can_buffered_frames', 'Decoded records held in memory', processor.pending_frames)
+        self.received_rate = RateTracker(self.received.total)
+        self.decoded_rate = RateTracker(self.decoded.total)
+
+    def record_batch(self, frames, decoded_commands, decoded_servos, decode_seconds: float):
+        self.received.inc(len(frames))
+        inc = self.decoded.inc
+        for module_id, rows in decoded_commands.items():
+            inc(len(rows), COMMAND_ID_BASE | module_id)
+        for module_id, rows in decoded_servos.items():
+            inc(len(rows), CONTROL_RESPONSE_ID_BASE | module_id)
+        self.decode_seconds.observe(decode_seconds)
+        self.batch_frames.observe(len(frames))
+
+    def summary(self, elapsed: float) -> str:
+        drops = self.receiver.stats.kernel_drops
+        line = (f"{self.received_rate.rate(elapsed):.0f} frames/s received, {self.decoded_rate.rate(elapsed):.0f}/s decoded"
+                f" | decode p99 {format_seconds(self.decode_seconds.quantile(0.99))}/batch"
+                f" | buffered {self.processor.pending_frames()}"
+                f" | kernel drops {'n/a' if drops is None else drops}")
+        if self.writer is not None:
+            write_seconds = self.writer.write_seconds
+            line += (f" | writer queue {self.writer.queued_frames}/{self.writer.max_queued_frames} frames"
+                     f", write p99 {format_seconds(write_seconds.quantile(0.99))}"
+                     f", dropped {self.writer.dropped_frames}")
+        return line
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Log CAN FD command and servo frames to per-module CSV files.')
+    parser.add_argument('--channel', default=CAN_CHANNEL)
+    parser.add_argument('--duration', type=float, default=LOG_DURATION, help='Seconds to log')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--format', choices=('csv', 'indexed', 'compact', 'summary') + COLUMNAR_FORMATS,
+                        default='csv',
+                        help='Output format; indexed is a block log with a time/module index (can_indexed_log), '
+                             'compact is a delta-encoded compressed log for long captures (can_compact_log), '
+                             'summary keeps only the per-module window summaries (can_aggregate), '
+                             'parquet/arrow fall back to npy without pyarrow')
+    parser.add_argument('--summary', action='store_true',
+                        help='Also write per-module window summaries next to the raw records')
+    parser.add_argument('--summary-windows', default=','.join(f'{window:g}' for window in WINDOWS),
+                        help='Comma separated summary window lengths in seconds')
+    parser.add_argument('--stream', action='store_true',
+                        help='Flush chunks to disk from a background thread while logging. When more than '
+                             '--max-queued-frames records wait for the writer, the oldest queued chunks are '
+                             'dropped to keep the newest; the loss is counted in can_writer_dropped_frames')
+    parser.add_argument('--max-queued-frames', type=int, default=MAX_QUEUED_FRAMES,
+                        help='Records waiting for the --stream writer before the oldest are dropped')
+    parser.add_argument('--flush-frames', type=int, default=FLUSH_FRAMES)
+    parser.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL, help='Seconds')
+    parser.add_argument('--rotate-bytes', type=int, default=None, help='Start a new file above this size')
+    parser.add_argument('--rotate-seconds', type=float, default=None, help='Start a new file after this many seconds')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='Frames drained per socket read')
+    parser.add_argument('--rcvbuf', type=int, default=RCVBUF_SIZE, help='Kernel socket receive buffer in bytes')
+    parser.add_argument('--hw-timestamps', action='store_true', help='Use hardware RX timestamps if the adapter has them')
+    parser.add_argument('--report-interval', type=float, default=REPORT_INTERVAL, help='Seconds between summary lines')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--metrics-json', default=None, help='Append a JSON metrics snapshot per interval to this file')
+    args = parser.parse_args(argv)
+    if args.stream and args.format not in ('csv', 'indexed', 'compact', 'summary'):
+        parser.error('--stream only supports --format csv, indexed, compact or summary')
+    args.summary_windows = [float(window) for window in args.summary_windows.split(',') if window.strip()]
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    bus = setup_can_interface(args.channel)
     if bus is None:
         return
 
     processor = CANMessageProcessor()
     print(f"Started logging at {processor.start_time}")
-    
+
+    registry = MetricsRegistry()
+    writer = None
+    if args.stream:
+        writer_class = {'indexed': StreamingIndexedWriter, 'compact': StreamingCompactWriter,
+                        'summary': StreamingSummaryWriter}.get(args.format, StreamingCSVWriter)
+        summary = None
+        if args.summary or args.format == 'summary':
+            summary = SummaryLog(args.output_dir, str(processor.start_time), args.summary_windows)
+        writer = writer_class(processor, args.output_dir,
+                              flush_frames=args.flush_frames, flush_interval=args.flush_interval,
+                              max_file_bytes=args.rotate_bytes, max_file_seconds=args.rotate_seconds,
+                              max_queued_frames=args.max_queued_frames, metrics=registry, summary=summary)
+
+    receiver = BatchReceiver(bus, max_batch=args.max_batch, rcvbuf=args.rcvbuf,
+                             hardware_timestamps=args.hw_timestamps)
+    metrics = CaptureMetrics(registry, processor, receiver, writer)
+    reporter = Reporter(registry, metrics.summary, args.report_interval, args.metrics_json)
+    server = serve_metrics(registry, args.metrics_port) if args.metrics_port is not None else None
+
     try:
         start_time = time.time()
-        while time.time() - start_time < 60:  # Run for 60 seconds
-            message = bus.recv(1.0)  # Wait up to 1 second for a message
-            if message is None:
+        while time.time() - start_time < args.duration:
+            frames = receiver.recv_batch(1.0)  # Wait up to 1 second for the first frame
+            if not frames:
+                if writer:
+                    writer.flush()
+                reporter.poll()
                 continue
-            
-            command_id = message.arbitration_id & 0xFF00
-            module_id = message.arbitration_id & MODULE_ID_MASK
-            
-            if command_id == COMMAND_ID_BASE:
-                response = processor.process_command_message(message)
-                if response:
-                    print(f"Processed command message: Command ID=0x{response.command_id:X}, Module ID={response.module_id}, Value={response.value}")
-            elif command_id == CONTROL_RESPONSE_ID_BASE:
-                response = processor.process_servo_message(message)
-                if response:
-                    print(f"Processed servo message: Command ID=0x{response.command_id:X}, Module ID={response.module_id}, Position={response.position}")
-    
+
+            decode_start = time.perf_counter()
+            commands = [frame for frame in frames if frame.arbitration_id & ID_BASE_MASK == COMMAND_ID_BASE]
+            servos = [frame for frame in frames if frame.arbitration_id & ID_BASE_MASK == CONTROL_RESPONSE_ID_BASE]
+            decoded_commands = processor.process_command_batch(commands) if commands else {}
+            decoded_servos = processor.process_servo_batch(servos) if servos else {}
+            metrics.record_batch(frames, decoded_commands, decoded_servos, time.perf_counter() - decode_start)
+
+            if writer:
+                writer.poll(len(frames))
+            reporter.poll()
+
     except KeyboardInterrupt:
         print("Interrupted by user")
     
@@ -66,11 +188,38 @@ def main():
         print(f"An error occurred: {e}")
     
     finally:
+        receiver.print_stats()
+        save_start = time.perf_counter()
         try:
-            processor.save_to_csv(output_dir='can_output')
-            print(f"Data saved to CSV files in 'can_output' directory with timestamp {processor.start_time}")
+            if writer is None and (args.summary or args.format == 'summary'):
+                save_summary(processor, args.output_dir, args.summary_windows)
+            if args.format == 'csv':
+                processor.save_to_csv(output_dir=args.output_dir)
+                print(f"Data saved to CSV files in '{args.output_dir}' directory with timestamp {processor.start_time}")
+            elif args.format == 'indexed':
+                if writer:
+                    writer.close()
+                else:
+                    print(f"Data saved to {save_indexed(processor, args.output_dir)}")
+            elif args.format == 'compact':
+                if writer:
+                    writer.close()
+                else:
+                    print(f"Data saved to {save_compact(processor, args.output_dir)}")
+            elif args.format == 'summary':
+                if writer:
+                    writer.close()
+            else:
+                processor.save_columnar(output_dir=args.output_dir, fmt=args.format)
+                print(f"Data saved to {args.format} files in '{args.output_dir}' directory with timestamp {processor.start_time}")
         except Exception as e:
-            print(f"Error saving to CSV: {e}")
+            print(f"Error saving to {args.format}: {e}")
+        metrics.save_seconds.observe(time.perf_counter() - save_start)
+        print(f"Saving took {time.perf_counter() - save_start:.2f}s")
+        reporter.report()
+        reporter.close()
+        if server:
+            server.shutdown()
         
         if bus:
             bus.shutdown()
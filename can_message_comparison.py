@@ -1,61 +1,218 @@
-
 import sys
-import time
-import re
-from collections import defaultdict
-
-def compare_messages():
-    control_count = defaultdict(int)
-    motor_count = defaultdict(int)
-    debug_count = defaultdict(int)
-    current_second = int(time.time())
-    next_print_time = current_second + 1
-
-    # 正規表現パターンを定義
-    control_pattern = re.compile(r'can0 (00[1-7]|20[1-7]|30[1-7]|40[1-7])')
-    motor_pattern = re.compile(r'can0 (10[1-7]|50[1-7])')
-    debug_pattern = re.compile(r'can0 700')
+import json
+import bisect
+import argparse
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+from candump_log import parse_frame_header, read_chunks, iter_line_blocks
 
-    print("-----------------------------------------------------------------------------------------------------------")
-    print("Comparing control commands (001-007, 201-207, 301-307, 401-407), motor responses (101-107, 501-507), and debug output (700) messages.")
-    print("Time (s) | Control (001-007, 201-207, 301-307, 401-407) | Motor (101-107, 501-507) | Debug (700) | Match?")
-    print("-----------------------------------------------------------------------------------------------------------")
+WINDOW_SIZE = 1.0  # Seconds of log time per comparison window
+MODULE_ID_MASK = 0xFF
+CHUNK_SIZE = 1 << 20  # Larger reads amortise the per-block array work
 
-    try:
-        while True:
-            line = sys.stdin.readline().strip()
-            if not line:
-                continue
+# Message groups as hex ID ranges. The module of an ID is its lower byte.
+MESSAGE_GROUPS = {
+    'control': ['001-007', '201-207', '301-307', '401-407'],
+    'motor': ['101-107', '501-507'],
+    'debug': ['700'],
+}
+
+def parse_id_range(id_range: str) -> range:
+    first, _, last = id_range.partition('-')
+    return range(int(first, 16), int(last or first, 16) + 1)
+
+class MessageClassifier:
+    """
+    Classify arbitration IDs into (group, module) counters through a precomputed table.
+
+    Each ID listed in the group definition maps to one slot. Slots are ordered by group, then module.
+
+    Blocks of candump text are classified without splitting them into lines: the ID text
+    of every line is read at the column where the first line has it, packed into an
+    integer key and looked up in a sorted key table with one searchsorted call. Only lines
+    with a different layout (other channel name length, extended IDs) are parsed one by one.
+    """
+
+    def __init__(self, groups: Dict[str, List[str]] = MESSAGE_GROUPS):
+        self.group_names = list(groups)
+        self.slots: List[Tuple[int, int]] = []  # (group index, module ID)
+        self.table: Dict[int, int] = {}  # arbitration ID -> slot
+        slot_index = {}
+        for group_index, name in enumerate(self.group_names):
+            for id_range in groups[name]:
+                for arbitration_id in parse_id_range(id_range):
+                    key = (group_index, arbitration_id & MODULE_ID_MASK)
+                    if key not in slot_index:
+                        slot_index[key] = len(self.slots)
+                        self.slots.append(key)
+                    self.table.setdefault(arbitration_id, slot_index[key])
+        # Key of ' 201#' is the three ID characters packed into an integer
+        keys = {}
+        for arbitration_id, slot in self.table.items():
+            if arbitration_id <= 0x7FF:
+                keys[int.from_bytes(f'{arbitration_id:03X}'.encode(), 'big')] = slot
+        self.keys = np.array(sorted(keys), dtype=np.int64)
+        self.key_slots = np.array([keys[key] for key in sorted(keys)], dtype=np.int64)
+
+    def new_counts(self) -> np.ndarray:
+        return np.zeros(len(self.slots), dtype=np.int64)
+
+    def classify_block(self, block: bytes, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """
+        Return the slot of every line of a block, -1 for IDs outside all groups.
+
+        :param block: candump -L text
+        :param starts: Start offset of every line
+        :param ends: End offset of every line (exclusive of the newline)
+        """
+        slots = np.full(len(starts), -1, dtype=np.int64)
+        first_hash = block.find(b'#', starts[0], ends[0]) if len(starts) else -1
+        if first_hash < 0:
+            fallback = np.arange(len(starts))
+        else:
+            # ' ' + 3 ID characters + '#' at the first line's column
+            data = np.frombuffer(block, dtype=np.uint8)
+            positions = starts + (first_hash - starts[0])
+            in_range = positions < ends
+            positions = np.where(in_range, positions, 0)
+            fast = (in_range & (data[starts] == ord('(')) & (data[positions] == ord('#'))
+                    & (data[positions - 4] == ord(' ')))
+            keys = ((data[positions - 3].astype(np.int64) << 16) | (data[positions - 2].astype(np.int64) << 8)
+                    | data[positions - 1])
+            index = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            found = fast & (self.keys[index] == keys)
+            slots[found] = self.key_slots[index[found]]
+            fallback = np.flatnonzero(~fast)
+        for line in fallback:
+            frame = parse_frame_header(block[starts[line]:ends[line]])
+            if frame is not None:
+                slots[line] = self.table.get(frame[1], -1)
+        return slots
 
-            current_time = time.time()
-            current_second = int(current_time)
+    def group_totals(self, counts: np.ndarray) -> List[int]:
+        totals = [0] * len(self.group_names)
+        for (group_index, _), count in zip(self.slots, counts):
+            totals[group_index] += count
+        return totals
 
-            if control_pattern.search(line):
-                control_count[current_second] += 1
-            elif motor_pattern.search(line):
-                motor_count[current_second] += 1
-            elif debug_pattern.search(line):
-                debug_count[current_second] += 1
+    def divergences(self, counts: np.ndarray) -> List[Tuple[str, int, int, int]]:
+        """
+        Compare the groups that share a module.
 
-            if current_second >= next_print_time:
-                prev_second = current_second - 1
-                control_msgs = control_count[prev_second]
-                motor_msgs = motor_count[prev_second]
-                debug_msgs = debug_count[prev_second]
-                match = "Yes" if control_msgs == motor_msgs == debug_msgs else "No"
+        :return: (group, module, count, expected) for every group whose count for a module
+                 differs from the highest count of that module across groups
+        """
+        by_module: Dict[int, List[Tuple[int, int]]] = {}
+        for (group_index, module_id), count in zip(self.slots, counts):
+            by_module.setdefault(module_id, []).append((group_index, count))
+        diverged = []
+        for module_id in sorted(by_module):
+            entries = by_module[module_id]
+            expected = max(count for _, count in entries)
+            for group_index, count in entries:
+                if count != expected:
+                    diverged.append((self.group_names[group_index], module_id, count, expected))
+        return diverged
 
-                print(f"{prev_second:<9} | {control_msgs:^27} | {motor_msgs:^25} | {debug_msgs:^11} | {match:^6}")
+def line_bounds(block: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the start and end offsets of every line in a block (ends exclude the newline)."""
+    data = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(data == ord('\n'))
+    if len(data) and data[-1] != ord('\n'):
+        ends = np.append(ends, len(data))
+    starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)
+    return starts, ends
 
-                # Clear old data
-                if prev_second - 1 in control_count:
-                    del control_count[prev_second - 1]
-                    del motor_count[prev_second - 1]
-                    del debug_count[prev_second - 1]
+def load_groups(path: str) -> Dict[str, List[str]]:
+    """Load a group definition such as {"control": ["201-207"], "motor": ["501-507"]} from JSON."""
+    with open(path, 'r') as f:
+        return json.load(f)
 
-                next_print_time = current_second + 1
+def print_window(label: str, classifier: MessageClassifier, counts: np.ndarray):
+    totals = classifier.group_totals(counts)
+    diverged = classifier.divergences(counts)
+    if diverged:
+        match = "No: " + ", ".join(f"{group}/{module_id} ({count} vs {expected})"
+                                   for group, module_id, count, expected in diverged)
+    else:
+        match = "Yes"
+    columns = " | ".join(f"{total:^{max(len(name), 7)}}" for name, total in zip(classifier.group_names, totals))
+    print(f"{label:<14} | {columns} | {match}")
+
+def compare_messages(chunks: Iterable[bytes] = None, window_size: float = WINDOW_SIZE,
+                     groups: Dict[str, List[str]] = MESSAGE_GROUPS):
+    """
+    Print per-window message counts of each group and which module/group diverged.
+
+    :param chunks: Byte chunks of `candump -L` output (buffered stdin by default)
+    :param window_size: Seconds of log time per window (e.g. 0.01 or 0.1)
+    :param groups: Group definition, see MESSAGE_GROUPS
+    """
+    if chunks is None:
+        chunks = read_chunks(sys.stdin.buffer, CHUNK_SIZE)
+    classifier = MessageClassifier(groups)
+    counts = classifier.new_counts()
+    current_window = None
+    label_format = '.0f' if window_size >= 1 else '.3f'
+
+    header = " | ".join(f"{name.capitalize():^{max(len(name), 7)}}" for name in classifier.group_names)
+    definition = "; ".join(f"{name}: {', '.join(groups[name])}" for name in classifier.group_names)
+    print("-----------------------------------------------------------------------------------------------------------")
+    print(f"Comparing message counts per module over {window_size}s windows ({definition}).")
+    print(f"Time (s)       | {header} | Match?")
+    print("-----------------------------------------------------------------------------------------------------------")
+
+    try:
+        for block in iter_line_blocks(chunks):
+            starts, ends = line_bounds(block)
+            if not len(starts):
+                continue
+            slots = classifier.classify_block(block, starts, ends)
+
+            # Timestamps are only parsed where the window changes, found by bisecting the block
+            def line_window(line):
+                frame = parse_frame_header(block[starts[line]:ends[line]])
+                return frame[0] // window_size if frame is not None else -np.inf
+
+            start = 0
+            last_window = line_window(len(starts) - 1)
+            while start < len(starts):
+                window = line_window(start)
+                if window == -np.inf:
+                    end = start + 1  # Not a frame: counts nothing
+                elif window == last_window:
+                    end = len(starts)
+                else:
+                    end = bisect.bisect_right(range(len(starts)), window, lo=start, key=line_window)
+                    if line_window(end - 1) != window:
+                        # A non-frame line (or a frame out of order) broke the ordering bisect relies on;
+                        # scan line by line, non-frame lines count nothing wherever they go
+                        end = start + 1
+                        while end < len(starts) and line_window(end) in (window, -np.inf):
+                            end += 1
+                if current_window is None or current_window == -np.inf:
+                    current_window = window
+                elif window != current_window and window != -np.inf:
+                    print_window(format(current_window * window_size, label_format), classifier, counts)
+                    counts = classifier.new_counts()
+                    current_window = window
+                segment = slots[start:end]
+                counts += np.bincount(segment[segment >= 0], minlength=len(counts))
+                start = end
 
     except KeyboardInterrupt:
         print("\nProgram terminated by user.")
 
+    if current_window is not None and current_window != -np.inf:
+        print_window(format(current_window * window_size, label_format), classifier, counts)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare per-module CAN message counts from `candump -L` on stdin.')
+    parser.add_argument('--window', type=float, default=WINDOW_SIZE, help='Window size in seconds, e.g. 0.01')
+    parser.add_argument('--groups', help='JSON file with the message group definition')
+    args = parser.parse_args(argv)
+    groups = load_groups(args.groups) if args.groups else MESSAGE_GROUPS
+    compare_messages(window_size=args.window, groups=groups)
+
 if __name__ == "__main__":
-    compare_messages()
\ No newline at end of file
+    main()
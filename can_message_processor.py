@@ -1,10 +1,48 @@
-import can
 import struct
-import pandas as pd
-from typing import List, Optional, Dict
-from dataclasses import dataclass, asdict
+import numpy as np
+from typing import TYPE_CHECKING, List, Optional, Dict, Iterable, Tuple, Union
+from dataclasses import dataclass
 import os
 from datetime import datetime
+from can_columnar_io import resolve_format, write_columnar, DEFAULT_COMPRESSION
+from can_schema import default_schema
+
+if TYPE_CHECKING:  # python-can and pandas are only imported where they are used
+    import can
+    import pandas as pd
+
+# Per-module column layouts. module_id is the dictionary key and is not stored per row.
+COMMAND_DTYPE = np.dtype([
+    ('command_id', '<u2'),
+    ('timestamp', '<f8'),
+    ('value', '<i4'),
+])
+SERVO_DTYPE = np.dtype([
+    ('command_id', '<u2'),
+    ('timestamp', '<f8'),
+    ('current', '<i4'),
+    ('velocity', '<i4'),
+    ('position', '<i4'),
+    ('error', '<u2'),
+])
+INITIAL_CAPACITY = 1024
+
+# Payload layouts, compiled from the shared message schema (can_schema.json)
+SCHEMA = default_schema()
+COMMAND = SCHEMA.message('command')
+SERVO = SCHEMA.message('servo')
+SERVO_PAYLOAD_SIZE = SERVO.length
+COMMAND_PAYLOAD_SIZE = COMMAND.size
+SERVO_PAYLOAD_DTYPE = SERVO.dtype
+COMMAND_PAYLOAD_DTYPE = COMMAND.dtype
+SERVO_STRUCT = SERVO.struct
+COMMAND_STRUCT = COMMAND.struct
+ID_BASE_MASK = SERVO.mask
+MODULE_ID_MASK = SERVO.module_mask
+
+# A raw frame is a can.Message (or any object with the same attributes, such as
+# candump_log.Frame) or an (arbitration_id, timestamp, payload) tuple
+RawFrame = Union['can.Message', Tuple[int, float, bytes]]
 
 @dataclass
 class ServoMessageResponse:
@@ -23,74 +61,328 @@ class CommandMessageResponse:
     timestamp: float
     value: int
 
+class ColumnBuffer:
+    """
+    Growable, array-backed storage for one module's records.
+
+    Rows are kept in a packed NumPy structured array whose capacity doubles when full,
+    so appending is amortised O(1) and a frame costs only its column widths in memory.
+    """
+
+    def __init__(self, dtype: np.dtype, capacity: int = INITIAL_CAPACITY):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._data.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def _reserve(self, size: int):
+        if size <= len(self._data):
+            return
+        capacity = max(len(self._data), 1)
+        while capacity < size:
+            capacity *= 2
+        data = np.empty(capacity, dtype=self._data.dtype)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def append(self, row: tuple):
+        if self._size == len(self._data):
+            self._reserve(self._size + 1)
+        self._data[self._size] = row
+        self._size += 1
+
+    def view(self) -> np.ndarray:
+        """Return the stored rows as a structured array view (no copy)."""
+        return self._data[:self._size]
+
+    def column(self, name: str) -> np.ndarray:
+        return self._data[name][:self._size]
+
+    def extend(self, rows: np.ndarray):
+        self._reserve(self._size + len(rows))
+        self._data[self._size:self._size + len(rows)] = rows
+        self._size += len(rows)
+
+    def clear(self):
+        self._size = 0
+
+def frames_to_arrays(frames: Iterable[RawFrame], payload_size: int,
+                     exact: bool = False) -> Tuple[np.ndarray, np.ndarray, bytes]:
+    """
+    Pack raw frames into arrays suitable for the batch decoders.
+
+    Frames whose payload is shorter than payload_size (or of any other size when exact is
+    set) are dropped and longer payloads are truncated, so the returned buffer has a fixed
+    stride of payload_size bytes. The fields are read in one pass over the frames and the
+    payloads joined at once; only when some payload has another size are the kept ones
+    gathered out of the joined buffer.
+
+    :param frames: can.Message objects or (arbitration_id, timestamp, payload) tuples, not mixed
+    :param payload_size: Number of payload bytes to keep per frame
+    :param exact: Keep only payloads of exactly payload_size bytes
+    :return: (arbitration_ids, timestamps, contiguous payload buffer)
+    """
+    frames = frames if isinstance(frames, list) else list(frames)
+    if not frames:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.float64), b''
+    if hasattr(frames[0], 'arbitration_id'):
+        fields = [(frame.arbitration_id, frame.timestamp, frame.data) for frame in frames]
+    else:
+        fields = frames
+    ids, timestamps, payloads = zip(*fields)
+    buffer = b''.join(payloads)
+    ids = np.array(ids, dtype=np.uint32)
+    timestamps = np.array(timestamps, dtype=np.float64)
+    lengths = np.fromiter(map(len, payloads), dtype=np.int64, count=len(payloads))
+    if np.all(lengths == payload_size):
+        return ids, timestamps, buffer
+    keep = lengths == payload_size if exact else lengths >= payload_size
+    offsets = (np.cumsum(lengths) - lengths)[keep]
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    payloads = data[offsets[:, None] + np.arange(payload_size)]
+    return ids[keep], timestamps[keep], payloads.tobytes()
+
+def _split_by_module(arbitration_ids: np.ndarray, columns: Dict[str, np.ndarray],
+                     dtype: np.dtype) -> Dict[int, np.ndarray]:
+    """
+    Build rows of dtype from the columns, grouped by module.
+
+    The columns are gathered in module order so that each module's rows are a slice of one
+    array; indexing packed structured rows per module would copy them field by field.
+    """
+    module_ids = arbitration_ids & MODULE_ID_MASK
+    order = np.argsort(module_ids, kind='stable')
+    module_ids = module_ids[order]
+    rows = np.empty(len(order), dtype=dtype)
+    for name, column in columns.items():
+        rows[name] = column[order]
+    starts = np.flatnonzero(module_ids[1:] != module_ids[:-1]) + 1
+    bounds = [0] + starts.tolist() + [len(order)]
+    return {int(module_ids[start]): rows[start:end] for start, end in zip(bounds[:-1], bounds[1:]) if end > start}
+
+def decode_servo_batch(arbitration_ids: np.ndarray, timestamps: np.ndarray,
+                       payloads: Union[bytes, np.ndarray]) -> Dict[int, np.ndarray]:
+    """
+    Decode many servo response payloads at once.
+
+    :param arbitration_ids: Arbitration ID of each frame
+    :param timestamps: Timestamp of each frame
+    :param payloads: Contiguous buffer of 16-byte payloads, one per frame
+    :return: Mapping of module ID to SERVO_DTYPE rows
+    """
+    decoded = np.frombuffer(payloads, dtype=SERVO_PAYLOAD_DTYPE, count=len(arbitration_ids))
+    columns = {'command_id': arbitration_ids & ID_BASE_MASK, 'timestamp': timestamps}
+    for name in ('current', 'velocity', 'position', 'error'):
+        columns[name] = decoded[name]
+    return _split_by_module(arbitration_ids, columns, SERVO_DTYPE)
+
+def decode_command_batch(arbitration_ids: np.ndarray, timestamps: np.ndarray,
+                         payloads: Union[bytes, np.ndarray]) -> Dict[int, np.ndarray]:
+    """
+    Decode many command payloads at once.
+
+    :param arbitration_ids: Arbitration ID of each frame
+    :param timestamps: Timestamp of each frame
+    :param payloads: Contiguous buffer of 4-byte payloads, one per frame
+    :return: Mapping of module ID to COMMAND_DTYPE rows
+    """
+    decoded = np.frombuffer(payloads, dtype=COMMAND_PAYLOAD_DTYPE, count=len(arbitration_ids))
+    columns = {'command_id': arbitration_ids & ID_BASE_MASK, 'timestamp': timestamps, 'value': decoded['value']}
+    return _split_by_module(arbitration_ids, columns, COMMAND_DTYPE)
+
+def responses_to_dataframe(module_id: int, rows: np.ndarray) -> 'pd.DataFrame':
+    """Build the CSV layout (command_id as hex, module_id as second column) from column rows."""
+    import pandas as pd
+    df = pd.DataFrame({name: rows[name] for name in rows.dtype.names})
+    df.insert(1, 'module_id', module_id)
+    df['command_id'] = [f"0x{command_id:X}" for command_id in df['command_id']]
+    return df
+
 class CANMessageProcessor:
     def __init__(self):
-        self.command_responses: Dict[int, List[CommandMessageResponse]] = {}
-        self.servo_responses: Dict[int, List[ServoMessageResponse]] = {}
+        self.command_responses: Dict[int, ColumnBuffer] = {}
+        self.servo_responses: Dict[int, ColumnBuffer] = {}
         self.start_time: str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.stream_writer = None  # Set by can_stream_writer.StreamingCSVWriter
 
     @staticmethod
     def parse_int32(data: bytes) -> int:
         return struct.unpack('<i', data)[0]
-    
+
     @staticmethod
     def parse_uint16(data: bytes) -> int:
         return struct.unpack('<H', data)[0]
-    
-    def process_command_message(self, message: can.Message) -> Optional[CommandMessageResponse]:
-        if len(message.data) < 4:
+
+    def process_command_message(self, message: 'can.Message') -> Optional[CommandMessageResponse]:
+        if len(message.data) < COMMAND_PAYLOAD_SIZE:
             return None
-        command_id = message.arbitration_id & 0xFF00
-        module_id = message.arbitration_id & 0x00FF
-        value = self.parse_int32(message.data[:4])
+        command_id = message.arbitration_id & ID_BASE_MASK
+        module_id = message.arbitration_id & MODULE_ID_MASK
+        value, = COMMAND_STRUCT.unpack_from(message.data)
         response = CommandMessageResponse(command_id, module_id, message.timestamp, value)
-        
+
         if module_id not in self.command_responses:
-            self.command_responses[module_id] = []
-        self.command_responses[module_id].append(response)
-        
+            self.command_responses[module_id] = ColumnBuffer(COMMAND_DTYPE)
+        self.command_responses[module_id].append((command_id, message.timestamp, value))
+
         return response
 
-    def process_servo_message(self, message: can.Message) -> Optional[ServoMessageResponse]:
-        if len(message.data) != 16:
+    def process_servo_message(self, message: 'can.Message') -> Optional[ServoMessageResponse]:
+        if len(message.data) != SERVO_PAYLOAD_SIZE:
             return None
-        command_id = message.arbitration_id & 0xFF00
-        module_id = message.arbitration_id & 0x00FF
-        current = self.parse_int32(message.data[0:4])
-        velocity = self.parse_int32(message.data[4:8])
-        position = self.parse_int32(message.data[8:12])
-        error = self.parse_uint16(message.data[14:16])
+        command_id = message.arbitration_id & ID_BASE_MASK
+        module_id = message.arbitration_id & MODULE_ID_MASK
+        current, velocity, position, error = SERVO_STRUCT.unpack_from(message.data)
         response = ServoMessageResponse(command_id, module_id, message.timestamp, current, velocity, position, error)
-        
+
         if module_id not in self.servo_responses:
-            self.servo_responses[module_id] = []
-        self.servo_responses[module_id].append(response)
-        
+            self.servo_responses[module_id] = ColumnBuffer(SERVO_DTYPE)
+        self.servo_responses[module_id].append((command_id, message.timestamp, current, velocity, position, error))
+
         return response
 
+    def process_command_batch(self, frames: Iterable[RawFrame]) -> Dict[int, np.ndarray]:
+        """
+        Decode and store a batch of command frames.
+
+        :param frames: can.Message objects or (arbitration_id, timestamp, payload) tuples
+        :return: Mapping of module ID to the decoded rows of this batch
+        """
+        decoded = decode_command_batch(*frames_to_arrays(frames, COMMAND_PAYLOAD_SIZE))
+        self._store_batch(self.command_responses, decoded, COMMAND_DTYPE)
+        return decoded
+
+    def process_servo_batch(self, frames: Iterable[RawFrame]) -> Dict[int, np.ndarray]:
+        """
+        Decode and store a batch of servo frames. Frames without a 16-byte payload are skipped.
+
+        :param frames: can.Message objects or (arbitration_id, timestamp, payload) tuples
+        :return: Mapping of module ID to the decoded rows of this batch
+        """
+        decoded = decode_servo_batch(*frames_to_arrays(frames, SERVO_PAYLOAD_SIZE, exact=True))
+        self._store_batch(self.servo_responses, decoded, SERVO_DTYPE)
+        return decoded
+
+    @staticmethod
+    def _store_batch(buffers: Dict[int, ColumnBuffer], decoded: Dict[int, np.ndarray], dtype: np.dtype):
+        for module_id, rows in decoded.items():
+            if module_id not in buffers:
+                buffers[module_id] = ColumnBuffer(dtype)
+            buffers[module_id].extend(rows)
+
+    def command_columns(self, module_id: int) -> Dict[str, np.ndarray]:
+        """
+        Return the command records of a module as column arrays without building dataclasses.
+
+        :param module_id: The module ID (lower byte of the arbitration ID)
+        :return: Mapping of column name to array view
+        """
+        return self._columns(self.command_responses, module_id, COMMAND_DTYPE)
+
+    def servo_columns(self, module_id: int) -> Dict[str, np.ndarray]:
+        """
+        Return the servo records of a module as column arrays without building dataclasses.
+
+        :param module_id: The module ID (lower byte of the arbitration ID)
+        :return: Mapping of column name to array view
+        """
+        return self._columns(self.servo_responses, module_id, SERVO_DTYPE)
+
+    @staticmethod
+    def _columns(buffers: Dict[int, ColumnBuffer], module_id: int, dtype: np.dtype) -> Dict[str, np.ndarray]:
+        buffer = buffers.get(module_id)
+        rows = buffer.view() if buffer is not None else np.empty(0, dtype=dtype)
+        return {name: rows[name] for name in dtype.names}
+
+    def get_command_responses(self, module_id: int) -> List[CommandMessageResponse]:
+        rows = self.command_responses[module_id].view() if module_id in self.command_responses else []
+        return [CommandMessageResponse(int(r['command_id']), module_id, float(r['timestamp']), int(r['value']))
+                for r in rows]
+
+    def get_servo_responses(self, module_id: int) -> List[ServoMessageResponse]:
+        rows = self.servo_responses[module_id].view() if module_id in self.servo_responses else []
+        return [ServoMessageResponse(int(r['command_id']), module_id, float(r['timestamp']), int(r['current']),
+                                     int(r['velocity']), int(r['position']), int(r['error']))
+                for r in rows]
+
+    def memory_usage(self) -> int:
+        """Return the number of bytes held by all column buffers."""
+        buffers = list(self.command_responses.values()) + list(self.servo_responses.values())
+        return sum(buffer.nbytes for buffer in buffers)
+
+    def pending_frames(self) -> int:
+        """Return the number of records currently held in the column buffers."""
+        buffers = list(self.command_responses.values()) + list(self.servo_responses.values())
+        return sum(len(buffer) for buffer in buffers)
+
+    def drain(self) -> Tuple[Dict[int, np.ndarray], Dict[int, np.ndarray]]:
+        """
+        Copy out and clear the buffered records, keeping the buffers' capacity for reuse.
+
+        :return: (command rows per module, servo rows per module)
+        """
+        def take(buffers):
+            chunks = {}
+            for module_id, buffer in buffers.items():
+                if len(buffer):
+                    chunks[module_id] = buffer.view().copy()
+                    buffer.clear()
+            return chunks
+
+        return take(self.command_responses), take(self.servo_responses)
+
     def save_to_csv(self, output_dir: str = 'output'):
-        os.makedirs(output_dir, exist_ok=True)
+        if self.stream_writer is not None:
+            # Earlier chunks are already on disk; only the remainder needs writing
+            self.stream_writer.close()
+            return
 
-        def process_responses(responses):
-            data = [asdict(r) for r in responses]
-            for item in data:
-                item['command_id'] = f"0x{item['command_id']:X}"
-            return data
+        os.makedirs(output_dir, exist_ok=True)
 
         # Save command responses
         for module_id, responses in self.command_responses.items():
-            df = pd.DataFrame(process_responses(responses))
+            df = responses_to_dataframe(module_id, responses.view())
             filename = os.path.join(output_dir, f'{self.start_time}_command_{module_id}.csv')
             df.to_csv(filename, index=False)
             print(f"Saved command responses for module {module_id} to {filename}")
 
         # Save servo responses
         for module_id, responses in self.servo_responses.items():
-            df = pd.DataFrame(process_responses(responses))
+            df = responses_to_dataframe(module_id, responses.view())
             filename = os.path.join(output_dir, f'{self.start_time}_servo_responses_{module_id}.csv')
             df.to_csv(filename, index=False)
             print(f"Saved servo responses for module {module_id} to {filename}")
 
+    def save_columnar(self, output_dir: str = 'output', fmt: str = 'parquet',
+                      compression: Optional[str] = DEFAULT_COMPRESSION) -> List[str]:
+        """
+        Save the records as compressed typed columns, one file per module, using the CSV file names.
+
+        :param output_dir: Directory to write into
+        :param fmt: 'parquet', 'arrow' or 'npy' (used automatically when pyarrow is missing)
+        :param compression: Codec for parquet/arrow files
+        :return: Paths of the written files
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        fmt = resolve_format(fmt)  # Report a missing pyarrow once, not once per file
+        paths = []
+        for kind, buffers in (('command', self.command_responses), ('servo_responses', self.servo_responses)):
+            for module_id, responses in buffers.items():
+                path_base = os.path.join(output_dir, f'{self.start_time}_{kind}_{module_id}')
+                path = write_columnar(path_base, responses.view(), module_id, fmt, compression)
+                print(f"Saved {kind} for module {module_id} to {path}")
+                paths.append(path)
+        return paths
+
     def clear_responses(self):
         self.command_responses.clear()
-        self.servo_responses.clear()
\ No newline at end of file
+        self.servo_responses.clear()
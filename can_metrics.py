@@ -0,0 +1,266 @@
+import json
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+REPORT_INTERVAL = 1.0  # Seconds between summary lines
+# Bucket upper bounds in seconds, 1 us to 10 s
+TIME_BUCKETS = tuple(m * 10.0 ** e for e in range(-6, 1) for m in (1, 2, 5)) + (10.0,)
+SIZE_BUCKETS = tuple(2 ** i for i in range(13))  # 1 to 4096
+
+Labels = Tuple[str, ...]
+
+def format_labels(names: Sequence[str], values: Labels, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    """
+    Base class of the metrics. Updates are plain attribute/dict updates without locks; each
+    metric is expected to be updated from one thread only, readers may see a slightly stale value.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """Yield (name with suffix, formatted labels, value)."""
+        raise NotImplementedError
+
+    def snapshot(self):
+        raise NotImplementedError
+
+class Counter(Metric):
+    """
+    Counter with optional labels.
+
+    With a key_labels function, values are keyed by a raw key (e.g. an arbitration ID) and
+    turned into label values only when the metrics are collected, which keeps inc() cheap.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 key_labels: Optional[Callable[[object], Labels]] = None):
+        super().__init__(name, help, labelnames)
+        self.key_labels = key_labels
+        self.values: Dict[object, float] = {}
+
+    def inc(self, amount: float = 1, key=()):
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def _labelled(self) -> List[Tuple[Labels, float]]:
+        items = sorted(self.values.items())
+        if self.key_labels is None:
+            return items
+        return [(self.key_labels(key), value) for key, value in items]
+
+    def samples(self):
+        for labels, value in self._labelled():
+            yield self.name, format_labels(self.labelnames, labels), value
+
+    def snapshot(self):
+        if not self.labelnames:
+            return self.values.get((), 0)
+        return {','.join(map(str, labels)): value for labels, value in self._labelled()}
+
+class Gauge(Metric):
+    """A value that is set, or read from a function when the metrics are collected."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help)
+        self.function = function
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def get(self) -> float:
+        if self.function is None:
+            return self.value
+        try:
+            return self.function() or 0
+        except Exception:
+            return float('nan')
+
+    def samples(self):
+        yield self.name, '', self.get()
+
+    def snapshot(self):
+        return self.get()
+
+class Histogram(Metric):
+    """Fixed-bucket histogram; observe() is one bisect and two additions."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = TIME_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket', format_labels((), (), f'le="{"+Inf" if bound == float("inf") else bound}"'), cumulative
+        yield f'{self.name}_sum', '', self.sum
+        yield f'{self.name}_count', '', self.count
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99)}
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def _add(self, metric: Metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = (),
+                key_labels: Optional[Callable[[object], Labels]] = None) -> Counter:
+        return self._add(Counter(name, help, labelnames, key_labels))
+
+    def gauge(self, name: str, help: str, function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._add(Gauge(name, help, function))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = TIME_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in list(self.metrics.items())}
+
+def serve_metrics(registry: MetricsRegistry, port: int = METRICS_PORT, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """
+    Serve /metrics (Prometheus text) and /metrics.json from a daemon thread.
+
+    :return: The server; call shutdown() to stop it
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = registry.render_prometheus().encode(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(registry.snapshot()).encode(), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    print(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+class Reporter:
+    """
+    Print a summary line and append a JSON line every interval seconds.
+
+    poll() is meant to be called from the receive loop; between reports it costs one clock read.
+    """
+
+    def __init__(self, registry: MetricsRegistry, summary: Callable[[float], str],
+                 interval: float = REPORT_INTERVAL, json_path: Optional[str] = None):
+        """
+        :param summary: Returns the summary line, given the seconds since the last report
+        :param json_path: File to append one JSON snapshot per interval to
+        """
+        self.registry = registry
+        self.summary = summary
+        self.interval = interval
+        self.json_file = open(json_path, 'a') if json_path else None
+        self.last_report = time.monotonic()
+
+    def poll(self):
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.report(now)
+
+    def report(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.last_report
+        self.last_report = now
+        print(f"[{time.strftime('%H:%M:%S')}] {self.summary(elapsed)}")
+        if self.json_file:
+            self.json_file.write(json.dumps({'time': time.time(), **self.registry.snapshot()}) + '\n')
+            self.json_file.flush()
+
+    def close(self):
+        if self.json_file:
+            self.json_file.close()
+            self.json_file = None
+
+class RateTracker:
+    """Turn a monotonically increasing total into a per-second rate between calls."""
+
+    def __init__(self, read: Callable[[], float]):
+        self.read = read
+        self.last = read()
+
+    def rate(self, elapsed: float) -> float:
+        value = self.read()
+        rate = (value - self.last) / elapsed if elapsed > 0 else 0.0
+        self.last = value
+        return rate
+
+def format_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return '-'
+    if value == float('inf'):
+        return '>10s'
+    return f'{value * 1e6:.0f}us' if value < 1e-3 else f'{value * 1e3:.1f}ms' if value < 1 else f'{value:.1f}s'
+
+def id_labels(arbitration_id: int) -> Labels:
+    return (f'0x{arbitration_id:03X}',)
@@ -0,0 +1,401 @@
+import os
+import time
+import signal
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from candump_log import format_candump_line
+from can_receiver import BatchReceiver, MAX_BATCH, RCVBUF_SIZE
+from can_metrics import MetricsRegistry, Reporter, RateTracker, serve_metrics, REPORT_INTERVAL
+
+# Multi-channel settings
+CAN_CHANNELS = 'can0,can1,can2'
+RING_CAPACITY = 1 << 18  # Frames buffered per channel between its worker and the merger
+POLL_TIMEOUT = 0.05  # Seconds a worker waits for frames before it advances its watermark
+MERGE_INTERVAL = 0.01  # Seconds the merger sleeps when no channel had new frames
+MAX_DATA = 64
+OUTPUT_DIR = 'can_output'
+
+# Frame flags column
+FLAG_FD = 1
+FLAG_EXTENDED = 2
+
+# Worker states
+STARTING, RUNNING, FINISHED, FAILED = range(4)
+
+# Per-channel counters shared by the worker (writer) and the merger (reader). Each field is
+# written by one process only; read_index by the merger, everything else by the worker.
+HEADER_DTYPE = np.dtype([
+    ('write_index', '<u8'),
+    ('read_index', '<u8'),
+    ('frames', '<u8'),
+    ('error_frames', '<u8'),
+    ('ring_drops', '<u8'),
+    ('kernel_drops', '<i8'),  # -1 if SO_RXQ_OVFL is not available
+    ('watermark', '<f8'),  # No frame older than this will be written any more
+    ('state', '<u8'),
+], align=True)
+HEADER_SIZE = 64
+# Column name -> (dtype, values per frame), in memory order
+COLUMNS = (
+    ('timestamp', np.dtype('<f8'), 1),
+    ('arbitration_id', np.dtype('<u4'), 1),
+    ('length', np.dtype('u1'), 1),
+    ('flags', np.dtype('u1'), 1),
+    ('data', np.dtype('u1'), MAX_DATA),
+)
+
+class SharedColumnRing:
+    """
+    Single-producer, single-consumer ring of frames in shared memory, stored as columns.
+
+    The write and read indices only grow; row i lives at i % capacity. The worker writes
+    the rows of a batch before it advances write_index and then the watermark, so a reader
+    that reads the watermark first never sees it cover rows it has not got yet.
+    A full ring drops the newest frames (counted in ring_drops) rather than blocking capture.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int, owner: bool):
+        self.shm = shm
+        self.capacity = capacity
+        self.owner = owner
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        self.columns: Dict[str, np.ndarray] = {}
+        offset = HEADER_SIZE
+        for name, dtype, width in COLUMNS:
+            shape = (capacity, width) if width > 1 else (capacity,)
+            self.columns[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            offset += capacity * width * dtype.itemsize
+
+    @staticmethod
+    def nbytes(capacity: int) -> int:
+        return HEADER_SIZE + sum(capacity * width * dtype.itemsize for _, dtype, width in COLUMNS)
+
+    @classmethod
+    def create(cls, capacity: int = RING_CAPACITY) -> 'SharedColumnRing':
+        ring = cls(shared_memory.SharedMemory(create=True, size=cls.nbytes(capacity)), capacity, owner=True)
+        ring.header[()] = (0, 0, 0, 0, 0, -1, -np.inf, STARTING)
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, capacity: int) -> 'SharedColumnRing':
+        return cls(shared_memory.SharedMemory(name=name), capacity, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def pending(self) -> int:
+        if self.header is None:
+            return 0
+        return int(self.header['write_index'] - self.header['read_index'])
+
+    def write(self, frames: List) -> int:
+        """
+        Append a batch of frames (candump_log.Frame or can.Message). Called by the worker only.
+
+        :return: Number of frames written; the rest did not fit and were dropped
+        """
+        header = self.header
+        write_index = int(header['write_index'])
+        free = self.capacity - (write_index - int(header['read_index']))
+        if len(frames) > free:
+            header['ring_drops'] += len(frames) - free
+            frames = frames[:free]
+        count = len(frames)
+        if not count:
+            return 0
+        positions = (write_index + np.arange(count)) % self.capacity
+        columns = self.columns
+        columns['timestamp'][positions] = [frame.timestamp for frame in frames]
+        columns['arbitration_id'][positions] = [frame.arbitration_id for frame in frames]
+        columns['length'][positions] = [len(frame.data) for frame in frames]
+        columns['flags'][positions] = [frame.is_fd * FLAG_FD | frame.is_extended_id * FLAG_EXTENDED
+                                       for frame in frames]
+        data = b''.join(bytes(frame.data).ljust(MAX_DATA, b'\0') for frame in frames)
+        columns['data'][positions] = np.frombuffer(data, dtype=np.uint8).reshape(count, MAX_DATA)
+        header['write_index'] = write_index + count
+        return count
+
+    def read(self) -> Dict[str, np.ndarray]:
+        """Copy out every row written since the last read and release them. Called by the merger only."""
+        header = self.header
+        read_index = int(header['read_index'])
+        count = int(header['write_index']) - read_index
+        positions = (read_index + np.arange(count)) % self.capacity
+        rows = {name: column[positions] for name, column in self.columns.items()}
+        header['read_index'] = read_index + count
+        return rows
+
+    def close(self):
+        # Views into the buffer must be released before the mapping can be closed
+        self.header = None
+        self.columns = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def open_channel(channel: str, interface: str = 'socketcan'):
+    if interface == 'socketcan':
+        from canfd_handler import setup_can_interface
+        return setup_can_interface(channel)
+    import can
+    return can.Bus(interface=interface, channel=channel, fd=True)
+
+def capture_worker(channel: str, interface: str, ring_name: str, capacity: int, core: Optional[int],
+                   stop: multiprocessing.Event, max_batch: int = MAX_BATCH, rcvbuf: Optional[int] = RCVBUF_SIZE):
+    """
+    Receive one channel into its shared ring until stop is set. Runs in its own process.
+
+    Timestamps are the kernel RX timestamps (CLOCK_REALTIME) of BatchReceiver, so the
+    channels share one timebase without any clock exchange between the processes.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl+C and sets stop
+    if core is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {core})
+        except OSError as e:
+            print(f"[{channel}] Could not pin to core {core}: {e}")
+    ring = SharedColumnRing.attach(ring_name, capacity)
+    header = ring.header
+    bus = None
+    try:
+        bus = open_channel(channel, interface)
+        if bus is None:
+            header['state'] = FAILED
+            return
+        receiver = BatchReceiver(bus, max_batch=max_batch, rcvbuf=rcvbuf)
+        stats = receiver.stats
+        header['state'] = RUNNING
+        while not stop.is_set():
+            started = time.time()
+            frames = receiver.recv_batch(POLL_TIMEOUT)
+            if frames:
+                ring.write(frames)
+                # Frames still queued in the socket are newer than the last one read
+                watermark = frames[-1].timestamp
+            else:
+                # The socket stayed empty, so every frame received before the call has been read
+                watermark = started
+            header['frames'] = stats.frames
+            header['error_frames'] = stats.error_frames
+            header['kernel_drops'] = -1 if stats.kernel_drops is None else stats.kernel_drops
+            header['watermark'] = max(float(header['watermark']), watermark)
+        header['state'] = FINISHED
+    except Exception as e:
+        print(f"[{channel}] Error receiving CAN messages: {e}")
+        header['state'] = FAILED
+    finally:
+        header = None
+        if bus is not None:
+            bus.shutdown()
+        ring.close()
+
+class ChannelMerger:
+    """
+    Merge the rings of several channels into one time-ordered stream.
+
+    Rows are held back until every live channel's watermark has passed them; a finished or
+    failed channel no longer holds the others back.
+    """
+
+    def __init__(self, rings: List[SharedColumnRing]):
+        self.rings = rings
+        self.pending: List[List[Dict[str, np.ndarray]]] = [[] for _ in rings]
+        self.held = [0] * len(rings)
+        self.merged = 0
+
+    def backlog(self) -> int:
+        """Rows read from the rings but not yet released in order."""
+        return sum(self.held)
+
+    def poll(self, final: bool = False) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Collect new rows and return those that are now in order, with a 'channel' column
+        holding the ring index, or None if there are none.
+
+        :param final: Release everything (the workers have stopped)
+        """
+        limit = np.inf
+        for index, ring in enumerate(self.rings):
+            header = ring.header
+            watermark = float(header['watermark'])  # Before the rows, see SharedColumnRing
+            if header['state'] == RUNNING:
+                limit = min(limit, watermark)
+            rows = ring.read()
+            if len(rows['timestamp']):
+                self.pending[index].append(rows)
+                self.held[index] += len(rows['timestamp'])
+        if final:
+            limit = np.inf
+
+        ready = []
+        for index, chunks in enumerate(self.pending):
+            if not chunks:
+                continue
+            rows = chunks[0] if len(chunks) == 1 else {name: np.concatenate([chunk[name] for chunk in chunks])
+                                                       for name in chunks[0]}
+            split = np.searchsorted(rows['timestamp'], limit, side='right')
+            if split:
+                ready.append({**{name: column[:split] for name, column in rows.items()},
+                              'channel': np.full(split, index, dtype=np.uint8)})
+            self.pending[index] = [{name: column[split:] for name, column in rows.items()}] if split < len(rows['timestamp']) else []
+            self.held[index] -= split
+        if not ready:
+            return None
+        merged = {name: np.concatenate([rows[name] for rows in ready]) for name in ready[0]}
+        order = np.argsort(merged['timestamp'], kind='stable')
+        self.merged += len(order)
+        return {name: column[order] for name, column in merged.items()}
+
+def write_candump(output, rows: Dict[str, np.ndarray], channels: List[str]):
+    """Append merged rows to a text file as `candump -L` lines."""
+    lines = []
+    for timestamp, channel, arbitration_id, length, flags, data in zip(
+            rows['timestamp'].tolist(), rows['channel'].tolist(), rows['arbitration_id'].tolist(),
+            rows['length'].tolist(), rows['flags'].tolist(), rows['data']):
+        lines.append(format_candump_line(timestamp, channels[channel], arbitration_id, data[:length].tobytes(),
+                                         bool(flags & FLAG_FD), bool(flags & FLAG_EXTENDED)))
+    output.write('\n'.join(lines) + '\n')
+
+class MultiChannelCapture:
+    """Start one capture process per channel and merge their rings in the calling process."""
+
+    def __init__(self, channels: List[str], interface: str = 'socketcan', cores: Optional[List[int]] = None,
+                 capacity: int = RING_CAPACITY, max_batch: int = MAX_BATCH, rcvbuf: Optional[int] = RCVBUF_SIZE):
+        """
+        :param cores: Core per channel; by default the channels get consecutive cores after core 0,
+                      which is left to the merger (no pinning on a single-core machine)
+        """
+        self.channels = channels
+        if cores is None:
+            count = os.cpu_count() or 1
+            cores = [1 + index % (count - 1) for index in range(len(channels))] if count > 1 else [None] * len(channels)
+        self.stop_event = multiprocessing.Event()
+        self.rings = [SharedColumnRing.create(capacity) for _ in channels]
+        self.merger = ChannelMerger(self.rings)
+        self.processes = [
+            multiprocessing.Process(target=capture_worker, name=f'capture-{channel}', daemon=True,
+                                    args=(channel, interface, ring.name, capacity, core, self.stop_event,
+                                          max_batch, rcvbuf))
+            for channel, ring, core in zip(channels, self.rings, cores)]
+        self.cores = cores
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def alive(self) -> bool:
+        return any(ring.header['state'] in (STARTING, RUNNING) for ring in self.rings)
+
+    def stop(self):
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def close(self):
+        for ring in self.rings:
+            ring.close()
+
+    def register_metrics(self, registry: MetricsRegistry):
+        for channel, ring in zip(self.channels, self.rings):
+            # Gauges look the header up on every read, the ring's views must not outlive close()
+            prefix = f'can_{channel}'
+            registry.gauge(f'{prefix}_frames_received', f'Frames received on {channel}', lambda r=ring: int(r.header['frames']))
+            registry.gauge(f'{prefix}_kernel_drops', f'Frames dropped by the kernel on {channel}',
+                           lambda r=ring: max(int(r.header['kernel_drops']), 0))
+            registry.gauge(f'{prefix}_ring_drops', f'Frames dropped because the {channel} ring was full',
+                           lambda r=ring: int(r.header['ring_drops']))
+            registry.gauge(f'{prefix}_ring_fill', f'Frames waiting in the {channel} ring', ring.pending)
+        registry.gauge('can_merged_frames', 'Frames written to the merged log', lambda: self.merger.merged)
+        registry.gauge('can_merge_backlog', 'Frames held back until every channel has passed them',
+                       self.merger.backlog)
+
+    def summary(self, rates: List[RateTracker], merged_rate: RateTracker, elapsed: float) -> str:
+        parts = []
+        for channel, ring, rate in zip(self.channels, self.rings, rates):
+            header = ring.header
+            kernel_drops = int(header['kernel_drops'])
+            state = {STARTING: ' (starting)', FAILED: ' (failed)', FINISHED: ' (stopped)'}.get(int(header['state']), '')
+            parts.append(f"{channel}{state} {rate.rate(elapsed):.0f}/s, kernel drops "
+                         f"{'n/a' if kernel_drops < 0 else kernel_drops}, ring drops {int(header['ring_drops'])}, "
+                         f"ring {100 * ring.pending() / ring.capacity:.0f}%")
+        parts.append(f"merged {merged_rate.rate(elapsed):.0f}/s, held {self.merger.backlog()}")
+        return ' | '.join(parts)
+
+def parse_cores(value: Optional[str]) -> Optional[List[int]]:
+    if not value:
+        return None
+    return [int(core) for core in value.split(',')]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Capture several CAN interfaces in parallel worker processes and '
+                                                 'write one merged, time-ordered candump -L log.')
+    parser.add_argument('--channels', default=CAN_CHANNELS, help='Comma separated, e.g. can0,can1,can2')
+    parser.add_argument('--interface', default='socketcan', help='python-can interface of the channels')
+    parser.add_argument('--cores', default=None, help='Comma separated core per channel (default: 1, 2, ...)')
+    parser.add_argument('--duration', type=float, default=None, help='Seconds to capture (default: until Ctrl+C)')
+    parser.add_argument('--output', default=None, help='Merged log (default: can_output/<start>_merged.log)')
+    parser.add_argument('--ring-capacity', type=int, default=RING_CAPACITY, help='Frames buffered per channel')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='Frames drained per socket read')
+    parser.add_argument('--rcvbuf', type=int, default=RCVBUF_SIZE, help='Kernel socket receive buffer in bytes')
+    parser.add_argument('--report-interval', type=float, default=REPORT_INTERVAL, help='Seconds between summary lines')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics')
+    args = parser.parse_args(argv)
+
+    channels = [channel.strip() for channel in args.channels.split(',') if channel.strip()]
+    cores = parse_cores(args.cores)
+    if cores is not None and len(cores) != len(channels):
+        parser.error('--cores needs one core per channel')
+    output_path = args.output
+    if output_path is None:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        output_path = os.path.join(OUTPUT_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_merged.log")
+
+    capture = MultiChannelCapture(channels, args.interface, cores, args.ring_capacity, args.max_batch, args.rcvbuf)
+    registry = MetricsRegistry()
+    capture.register_metrics(registry)
+    rates = [RateTracker(lambda r=ring: int(r.header['frames'])) for ring in capture.rings]
+    merged_rate = RateTracker(lambda: capture.merger.merged)
+    reporter = Reporter(registry, lambda elapsed: capture.summary(rates, merged_rate, elapsed), args.report_interval)
+    server = serve_metrics(registry, args.metrics_port) if args.metrics_port is not None else None
+
+    output = open(output_path, 'w')
+    print(f"Capturing {', '.join(channels)} on cores {capture.cores} into {output_path}")
+    capture.start()
+    try:
+        start_time = time.monotonic()
+        while args.duration is None or time.monotonic() - start_time < args.duration:
+            rows = capture.merger.poll()
+            if rows is not None:
+                write_candump(output, rows, channels)
+            else:
+                if not capture.alive():
+                    print("All capture processes have stopped")
+                    break
+                time.sleep(MERGE_INTERVAL)
+            reporter.poll()
+    except KeyboardInterrupt:
+        print("\nProgram terminated by user.")
+    finally:
+        capture.stop()
+        rows = capture.merger.poll(final=True)
+        if rows is not None:
+            write_candump(output, rows, channels)
+        output.close()
+        reporter.report()
+        reporter.close()
+        if server:
+            server.shutdown()
+        print(f"Wrote {capture.merger.merged} frames to {output_path}")
+        capture.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import time
+import errno
+import select
+import socket
+import struct
+from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, List, Optional
+
+from candump_log import Frame
+
+if TYPE_CHECKING:
+    import can
+
+# Receive settings
+MAX_BATCH = 1024  # Frames drained per recv_batch() call
+RCVBUF_SIZE = 4 * 1024 * 1024  # Requested kernel socket buffer (bytes)
+
+# Linux socket options not exported by the socket module
+SO_TIMESTAMPNS = 35
+SO_TIMESTAMPING = 37
+SO_RXQ_OVFL = 40
+SO_RCVBUFFORCE = 33
+SOF_TIMESTAMPING_RX_HARDWARE = 1 << 2
+SOF_TIMESTAMPING_RX_SOFTWARE = 1 << 3
+SOF_TIMESTAMPING_SOFTWARE = 1 << 4
+SOF_TIMESTAMPING_RAW_HARDWARE = 1 << 6
+
+# struct canfd_frame; a classic struct can_frame is the first 16 bytes of the same layout
+CANFD_FRAME_STRUCT = struct.Struct('=IBB2x64s')
+CAN_MTU = 16
+CANFD_MTU = CANFD_FRAME_STRUCT.size
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_SFF_MASK = 0x7FF
+TIMESPEC_STRUCT = struct.Struct('@ll')
+OVERFLOW_STRUCT = struct.Struct('@I')
+# Room for every control message a frame can carry: SO_TIMESTAMPNS (python-can enables it on
+# every socket), SO_TIMESTAMPING and SO_RXQ_OVFL
+ANCILLARY_SIZE = (socket.CMSG_SPACE(TIMESPEC_STRUCT.size) + socket.CMSG_SPACE(3 * TIMESPEC_STRUCT.size)
+                  + socket.CMSG_SPACE(OVERFLOW_STRUCT.size))
+MSG_CTRUNC = getattr(socket, 'MSG_CTRUNC', 0x8)
+
+@dataclass
+class ReceiveStats:
+    frames: int = 0
+    batches: int = 0
+    largest_batch: int = 0
+    error_frames: int = 0
+    kernel_drops: Optional[int] = None  # Frames dropped by the kernel (SO_RXQ_OVFL); None if unsupported
+    rcvbuf_bytes: Optional[int] = None  # Socket buffer size granted by the kernel
+    timestamp_source: str = 'python-can'  # Configured source: 'hardware requested', 'kernel' or 'python-can'
+    hardware_timestamps: int = 0  # Frames that actually carried a hardware RX timestamp
+    kernel_timestamps: int = 0  # Frames stamped by the kernel in software
+    local_timestamps: int = 0  # Frames without a kernel timestamp, stamped with time.time() on receipt
+    truncated_control: int = 0  # Frames whose control messages the kernel truncated (MSG_CTRUNC)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+def parse_can_frame(buffer: bytes, length: int, timestamp: float, channel: str) -> Optional[Frame]:
+    """
+    Decode a struct can_frame/canfd_frame received from a raw CAN socket.
+
+    :return: The frame, or None for error frames
+    """
+    can_id, dlc, flags, data = CANFD_FRAME_STRUCT.unpack_from(buffer.ljust(CANFD_MTU, b'\0'))
+    if can_id & CAN_ERR_FLAG:
+        return None
+    is_extended_id = bool(can_id & CAN_EFF_FLAG)
+    arbitration_id = can_id & (CAN_EFF_MASK if is_extended_id else CAN_SFF_MASK)
+    data = b'' if can_id & CAN_RTR_FLAG else data[:dlc]
+    return Frame(timestamp, channel, arbitration_id, data, length == CANFD_MTU, is_extended_id)
+
+class BatchReceiver:
+    """
+    Drain many frames per call from a bus created by setup_can_interface().
+
+    On SocketCAN the raw socket is read directly with recvmsg(): the socket buffer is
+    enlarged, frames carry the kernel (or, if requested and supported, hardware) RX
+    timestamp, and the SO_RXQ_OVFL counter reports how many frames the kernel dropped
+    because the buffer was full. Frames are returned as candump_log.Frame tuples.
+
+    Any other python-can bus (e.g. interface='virtual') falls back to draining bus.recv()
+    and returns can.Message objects; kernel_drops then stays None.
+    """
+
+    def __init__(self, bus: 'can.BusABC', max_batch: int = MAX_BATCH, rcvbuf: Optional[int] = RCVBUF_SIZE,
+                 hardware_timestamps: bool = False):
+        self.bus = bus
+        self.max_batch = max_batch
+        self.stats = ReceiveStats()
+        self.channel = getattr(bus, 'channel', None) or 'can0'
+        self.socket = getattr(bus, 'socket', None)
+        if not (isinstance(self.socket, socket.socket) and self.socket.family == getattr(socket, 'AF_CAN', None)):
+            self.socket = None
+        if self.socket is not None:
+            self._configure_socket(rcvbuf, hardware_timestamps)
+
+    def _configure_socket(self, rcvbuf: Optional[int], hardware_timestamps: bool):
+        sock = self.socket
+        if rcvbuf:
+            try:
+                # SO_RCVBUFFORCE ignores net.core.rmem_max but needs CAP_NET_ADMIN
+                sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, rcvbuf)
+            except OSError:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.stats.rcvbuf_bytes = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            self.stats.kernel_drops = 0
+        except OSError as e:
+            print(f"SO_RXQ_OVFL not available, kernel drops are not counted: {e}")
+
+        self.stats.timestamp_source = 'kernel'
+        if hardware_timestamps:
+            flags = (SOF_TIMESTAMPING_RX_HARDWARE | SOF_TIMESTAMPING_RAW_HARDWARE
+                     | SOF_TIMESTAMPING_RX_SOFTWARE | SOF_TIMESTAMPING_SOFTWARE)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPING, flags)
+                # The adapter may still deliver zero hardware timestamps; see hardware_timestamps
+                self.stats.timestamp_source = 'hardware requested'
+            except OSError as e:
+                print(f"Hardware timestamps not available, using kernel timestamps: {e}")
+        # SO_TIMESTAMPING carries the software timestamp as well, so SO_TIMESTAMPNS is only needed without it
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, int(self.stats.timestamp_source == 'kernel'))
+
+    def recv_batch(self, timeout: float = 1.0) -> List:
+        """
+        Wait up to timeout for the first frame, then return it with every frame already queued,
+        up to max_batch. Returns an empty list on timeout.
+        """
+        if self.socket is None:
+            frames = self._recv_bus(timeout)
+        else:
+            frames = self._recv_socket(timeout)
+        if frames:
+            self.stats.frames += len(frames)
+            self.stats.batches += 1
+            self.stats.largest_batch = max(self.stats.largest_batch, len(frames))
+        return frames
+
+    def _recv_bus(self, timeout: float) -> List:
+        frames = []
+        message = self.bus.recv(timeout)
+        while message is not None:
+            if message.is_error_frame:
+                self.stats.error_frames += 1
+            else:
+                frames.append(message)
+            if len(frames) >= self.max_batch:
+                break
+            message = self.bus.recv(0)
+        return frames
+
+    def _recv_socket(self, timeout: float) -> List:
+        sock = self.socket
+        readable, _, _ = select.select([sock], [], [], timeout)
+        if not readable:
+            return []
+        frames = []
+        hardware_timestamps = kernel_timestamps = local_timestamps = truncated = 0
+        timespec_size = TIMESPEC_STRUCT.size
+        while len(frames) < self.max_batch:
+            try:
+                data, ancdata, flags, _ = sock.recvmsg(CANFD_MTU, ANCILLARY_SIZE, socket.MSG_DONTWAIT)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if flags & MSG_CTRUNC:
+                truncated += 1
+            # Exactly one timestamp per frame: hardware, else the kernel's software timestamp
+            hardware = software = None
+            for level, kind, value in ancdata:
+                if level != socket.SOL_SOCKET:
+                    continue
+                if kind == SO_TIMESTAMPNS:
+                    if software is None and len(value) >= timespec_size:
+                        software = TIMESPEC_STRUCT.unpack_from(value)
+                elif kind == SO_TIMESTAMPING:
+                    # Software, legacy and raw hardware timestamps; a truncated payload keeps what is complete
+                    if len(value) >= timespec_size and any(TIMESPEC_STRUCT.unpack_from(value, 0)):
+                        software = TIMESPEC_STRUCT.unpack_from(value, 0)
+                    if len(value) >= 3 * timespec_size:
+                        raw = TIMESPEC_STRUCT.unpack_from(value, 2 * timespec_size)
+                        if any(raw):
+                            hardware = raw
+                elif kind == SO_RXQ_OVFL and len(value) >= OVERFLOW_STRUCT.size:
+                    # Cumulative count since the socket was opened, only sent once it is non-zero
+                    self.stats.kernel_drops = OVERFLOW_STRUCT.unpack_from(value)[0]
+            if hardware is not None:
+                timestamp = hardware[0] + hardware[1] * 1e-9
+                hardware_timestamps += 1
+            elif software is not None:
+                timestamp = software[0] + software[1] * 1e-9
+                kernel_timestamps += 1
+            else:
+                timestamp = time.time()
+                local_timestamps += 1
+            frame = parse_can_frame(data, len(data), timestamp, self.channel)
+            if frame is None:
+                self.stats.error_frames += 1
+            else:
+                frames.append(frame)
+        self.stats.hardware_timestamps += hardware_timestamps
+        self.stats.kernel_timestamps += kernel_timestamps
+        self.stats.local_timestamps += local_timestamps
+        self.stats.truncated_control += truncated
+        return frames
+
+    def timestamps_used(self) -> str:
+        """Describe the timestamps the received frames actually carried, e.g. 'hardware' or 'kernel 12, hardware 3'."""
+        stats = self.stats
+        if self.socket is None:
+            return stats.timestamp_source
+        counts = [(name, count) for name, count in (('hardware', stats.hardware_timestamps),
+                                                    ('kernel', stats.kernel_timestamps),
+                                                    ('local clock', stats.local_timestamps)) if count]
+        if not counts:
+            return f"{stats.timestamp_source} (no frames)"
+        used = counts[0][0] if len(counts) == 1 else ', '.join(f"{name} {count}" for name, count in counts)
+        if stats.timestamp_source == 'hardware requested' and not stats.hardware_timestamps:
+            used += ' (hardware requested, none received)'
+        return used
+
+    def print_stats(self):
+        stats = self.stats
+        drops = 'n/a' if stats.kernel_drops is None else stats.kernel_drops
+        print(f"Received {stats.frames} frames in {stats.batches} batches (largest {stats.largest_batch}), "
+              f"kernel drops: {drops}, error frames: {stats.error_frames}, "
+              f"rcvbuf: {stats.rcvbuf_bytes}, timestamps: {self.timestamps_used()}"
+              + (f", truncated control data: {stats.truncated_control}" if stats.truncated_control else ""))
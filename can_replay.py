@@ -0,0 +1,184 @@
+import os
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List
+
+from candump_log import read_candump_log, format_candump_line, read_chunks, CHUNK_SIZE
+from can_message_processor import CANMessageProcessor, COMMAND, SERVO
+from can_columnar_io import COLUMNAR_FORMATS
+
+# Arbitration ID groups routed into CANMessageProcessor (same as can_log)
+COMMAND_ID_BASE = COMMAND.base_id
+CONTROL_RESPONSE_ID_BASE = SERVO.base_id
+ID_BASE_MASK = SERVO.mask
+
+BATCH_SIZE = 10000  # Frames decoded per batch
+CANDUMP_EXTENSIONS = ('.log', '.txt', '.candump')
+LOG_EXTENSIONS = CANDUMP_EXTENSIONS + ('.asc', '.blf', '.trc', '.csv', '.mf4')
+ANALYZERS = ('frequency', 'compare', 'latency', 'deadline')
+
+def iter_log_frames(path: str) -> Iterator:
+    """
+    Yield the frames of a recorded log in file order, with their logged timestamps.
+
+    `candump -L` text logs are parsed directly into candump_log.Frame tuples; other formats
+    (ASC, BLF, ...) are read with python-can's LogReader and yield can.Message objects.
+    """
+    if path.lower().endswith(CANDUMP_EXTENSIONS):
+        yield from read_candump_log(path)
+    else:
+        import can
+        yield from can.LogReader(path)
+
+def iter_log_lines(path: str) -> Iterator[str]:
+    """Yield a recorded log as `candump -L` lines, the input format of the stdin analyzers."""
+    if path.lower().endswith(CANDUMP_EXTENSIONS):
+        with open(path, 'r') as f:
+            yield from f
+        return
+    import can
+    for message in can.LogReader(path):
+        if message.is_error_frame:
+            continue
+        yield format_candump_line(message.timestamp, message.channel or 'can0', message.arbitration_id,
+                                  message.data, message.is_fd, message.is_extended_id,
+                                  fd_flags=int(message.bitrate_switch) | int(message.error_state_indicator) << 1)
+
+def iter_log_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a recorded log as byte chunks of `candump -L` text, ending with b''."""
+    if path.lower().endswith(CANDUMP_EXTENSIONS):
+        with open(path, 'rb') as f:
+            yield from read_chunks(f, chunk_size)
+        return
+    lines = []
+    for line in iter_log_lines(path):
+        lines.append(line)
+        if len(lines) >= BATCH_SIZE:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+    yield b''
+
+def replay_to_processor(path: str, processor: CANMessageProcessor, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Feed a recorded log through a CANMessageProcessor as fast as possible using the batch decoders.
+
+    :param path: Log file to read
+    :param processor: Processor receiving the command and servo frames
+    :param batch_size: Number of frames decoded per batch
+    :return: Number of frames read
+    """
+    commands = []
+    servos = []
+    count = 0
+    for frame in iter_log_frames(path):
+        count += 1
+        command_id = frame.arbitration_id & ID_BASE_MASK
+        if command_id == COMMAND_ID_BASE:
+            commands.append(frame)
+            if len(commands) >= batch_size:
+                processor.process_command_batch(commands)
+                commands = []
+        elif command_id == CONTROL_RESPONSE_ID_BASE:
+            servos.append(frame)
+            if len(servos) >= batch_size:
+                processor.process_servo_batch(servos)
+                servos = []
+    if commands:
+        processor.process_command_batch(commands)
+    if servos:
+        processor.process_servo_batch(servos)
+    return count
+
+def convert_log(path: str, output_dir: str, fmt: str = 'csv') -> str:
+    """Convert one log into per-module files (or one indexed block log) named after the log. Runs in a worker process."""
+    if fmt == 'indexed':
+        from can_indexed_log import index_recorded_log, LOG_EXTENSION
+        os.makedirs(output_dir, exist_ok=True)
+        log_path = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + LOG_EXTENSION)
+        count = index_recorded_log(path, log_path)
+        return f"{path}: {count} frames -> {log_path}"
+    processor = CANMessageProcessor()
+    processor.start_time = os.path.splitext(os.path.basename(path))[0]
+    count = replay_to_processor(path, processor)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if fmt == 'csv':
+            processor.save_to_csv(output_dir)
+        else:
+            processor.save_columnar(output_dir, fmt)
+    return f"{path}: {count} frames"
+
+def run_analyzer(analyzer: str, path: str):
+    if analyzer == 'frequency':
+        from can_frequency import calculate_average_interval
+        calculate_average_interval(iter_log_chunks(path))
+    elif analyzer == 'latency':
+        from can_latency import track_latency
+        track_latency(iter_log_frames(path))
+    elif analyzer == 'deadline':
+        from can_deadline import detect_deadline_misses
+        detect_deadline_misses(iter_log_chunks(path))
+    else:
+        # Imported here so that worker processes only load the analyzer they run
+        from can_message_comparison import compare_messages
+        compare_messages(iter_log_chunks(path))
+
+def analyze_log(path: str, output_dir: str, analyzer: str) -> str:
+    """Run a stdin analyzer over one log using its logged timestamps; output goes to a text file."""
+    os.makedirs(output_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(path))[0]
+    output_path = os.path.join(output_dir, f'{name}_{analyzer}.txt')
+    with open(output_path, 'w') as f, contextlib.redirect_stdout(f):
+        run_analyzer(analyzer, path)
+    return f"{path}: {output_path}"
+
+def find_logs(path: str) -> List[str]:
+    if os.path.isfile(path):
+        return [path]
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if name.lower().endswith(LOG_EXTENSIONS))
+
+def process_logs(paths: List[str], output_dir: str, task: str, fmt: str = 'csv', jobs: int = None):
+    """
+    Convert or analyze several logs concurrently, one worker process per log.
+
+    :param paths: Log files
+    :param output_dir: Directory for the results
+    :param task: 'convert' or one of ANALYZERS
+    :param fmt: Output format for 'convert'
+    :param jobs: Number of worker processes (defaults to the CPU count)
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        if task == 'convert':
+            futures = [executor.submit(convert_log, path, output_dir, fmt) for path in paths]
+        else:
+            futures = [executor.submit(analyze_log, path, output_dir, task) for path in paths]
+        for future in futures:
+            try:
+                print(future.result())
+            except Exception as e:
+                print(f"Error processing log: {e}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay recorded CAN logs (candump -L, ASC, BLF) offline.')
+    parser.add_argument('task', choices=('convert',) + ANALYZERS)
+    parser.add_argument('path', help='Log file or directory of logs')
+    parser.add_argument('--output-dir', default='can_output')
+    parser.add_argument('--format', choices=('csv', 'indexed') + COLUMNAR_FORMATS, default='csv')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    paths = find_logs(args.path)
+    if not paths:
+        print(f"No logs found in {args.path}")
+        return
+    if len(paths) == 1 and args.task in ANALYZERS:
+        # A single log is analyzed in-process and printed like the live tools
+        run_analyzer(args.task, paths[0])
+        return
+    process_logs(paths, args.output_dir, args.task, args.format, args.jobs)
+
+if __name__ == "__main__":
+    main()
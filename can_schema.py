@@ -0,0 +1,326 @@
+import os
+import json
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Schema used by every tool unless CAN_SCHEMA points to another file
+SCHEMA_PATH = os.environ.get('CAN_SCHEMA', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'can_schema.json'))
+STANDARD_ID_MASK = 0x7FF
+EXTENDED_ID_MASK = 0x1FFFFFFF
+MAX_TABLE_IDS = 1 << 16  # Larger ID ranges are matched by mask instead of being expanded into the table
+
+# Field type -> struct format character; the type names are also valid NumPy dtype codes
+FIELD_FORMATS = {
+    'i1': 'b', 'u1': 'B', 'i2': 'h', 'u2': 'H', 'i4': 'i', 'u4': 'I', 'i8': 'q', 'u8': 'Q', 'f4': 'f', 'f8': 'd',
+}
+BYTE_ORDERS = {'little': '<', 'big': '>'}
+
+def parse_int(value) -> int:
+    """Accept 0x-prefixed strings as well as numbers (JSON has no hex literals)."""
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+@dataclass
+class Field:
+    name: str
+    offset: int
+    type: str
+    scale: float = 1.0
+    unit: str = ''
+
+    @property
+    def size(self) -> int:
+        return struct.calcsize(FIELD_FORMATS[self.type])
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> 'Field':
+        if spec['type'] not in FIELD_FORMATS:
+            raise ValueError(f"Unknown type '{spec['type']}' of field '{spec['name']}', expected one of {list(FIELD_FORMATS)}")
+        return cls(spec['name'], int(spec['offset']), spec['type'], float(spec.get('scale', 1.0)), spec.get('unit', ''))
+
+class MessageType:
+    """
+    The payload layout of an ID range, or of one multiplexor value within it.
+
+    The fields are compiled once into a struct.Struct (single frames) and a NumPy dtype
+    (batches) that skip the bytes between fields. A message with variants is only a
+    dispatcher: the multiplexor field selects the variant that holds the fields.
+    """
+
+    def __init__(self, name: str, base_id: int, mask: int, fields: List[Field], length: Optional[int] = None,
+                 exact_length: bool = False, byte_order: str = '<', multiplexor: Optional[Field] = None,
+                 multiplexor_value: Optional[int] = None):
+        """
+        :param length: Nominal payload length, used when packing; defaults to the bytes the fields span
+        :param exact_length: Only accept payloads of exactly length bytes (otherwise at least the field span)
+        :param multiplexor: Field selecting the variant; for a variant, the field it was selected by
+        :param multiplexor_value: Value of the multiplexor selecting this variant
+        """
+        self.name = name
+        self.base_id = base_id
+        self.mask = mask
+        self.fields = sorted(fields, key=lambda field: field.offset)
+        self.names = tuple(field.name for field in self.fields)
+        self.byte_order = byte_order
+        self.struct = struct.Struct(byte_order + self._format(self.fields))
+        self.size = self.struct.size
+        self.length = length if length is not None else self.size
+        self.exact_length = exact_length
+        self.min_length = self.length if exact_length else self.size
+        self.multiplexor = multiplexor
+        self.multiplexor_struct = struct.Struct(byte_order + FIELD_FORMATS[multiplexor.type]) if multiplexor else None
+        self.multiplexor_value = multiplexor_value
+        self.variants: Dict[int, MessageType] = {}
+        self._dtype = None
+
+    @staticmethod
+    def _format(fields: List[Field]) -> str:
+        format = ''
+        position = 0
+        for field in fields:
+            if field.offset < position:
+                raise ValueError(f"Field '{field.name}' overlaps the previous field")
+            format += 'x' * (field.offset - position) + FIELD_FORMATS[field.type]
+            position = field.offset + field.size
+        return format
+
+    def __repr__(self) -> str:
+        return f"MessageType({self.name!r}, 0x{self.base_id:X}/0x{self.mask:X})"
+
+    @property
+    def module_mask(self) -> int:
+        """Bits of the arbitration ID that are not fixed by the mask (the module ID)."""
+        return ~self.mask & (EXTENDED_ID_MASK if self.base_id > STANDARD_ID_MASK else STANDARD_ID_MASK)
+
+    def matches(self, arbitration_id: int) -> bool:
+        return arbitration_id & self.mask == self.base_id
+
+    def module_id(self, arbitration_id: int) -> int:
+        return arbitration_id & self.module_mask
+
+    def arbitration_id(self, module_id: int) -> int:
+        return self.base_id | module_id
+
+    def ids(self) -> Iterator[int]:
+        """Yield every arbitration ID the message covers."""
+        free = self.module_mask
+        module_id = free
+        while True:
+            yield self.base_id | module_id
+            if module_id == 0:
+                break
+            module_id = (module_id - 1) & free
+
+    def id_count(self) -> int:
+        return 1 << bin(self.module_mask).count('1')
+
+    def field(self, name: str) -> Field:
+        return self.fields[self.index(name)]
+
+    def index(self, name: str) -> int:
+        """Position of a field in the tuples returned by unpack()."""
+        return self.names.index(name)
+
+    def accepts(self, data: bytes) -> bool:
+        return len(data) == self.length if self.exact_length else len(data) >= self.size
+
+    def unpack(self, data: bytes) -> tuple:
+        return self.struct.unpack_from(data)
+
+    def pack(self, *values) -> bytes:
+        """Build a payload of length bytes, setting the multiplexor of a variant."""
+        payload = bytearray(max(self.length, self.size))
+        self.struct.pack_into(payload, 0, *values)
+        if self.multiplexor is not None and self.multiplexor_value is not None:
+            self.multiplexor_struct.pack_into(payload, self.multiplexor.offset, self.multiplexor_value)
+        return bytes(payload)
+
+    @property
+    def dtype(self):
+        """NumPy structured dtype with the same layout as the struct, for np.frombuffer on joined payloads."""
+        if self._dtype is None:
+            import numpy as np
+            self._dtype = np.dtype({
+                'names': list(self.names),
+                'formats': [self.byte_order + field.type for field in self.fields],
+                'offsets': [field.offset for field in self.fields],
+                'itemsize': self.size,
+            })
+        return self._dtype
+
+class Schema:
+    def __init__(self, messages: List[MessageType]):
+        self.messages = messages
+        self.by_name: Dict[str, MessageType] = {}
+        for message in messages:
+            self.by_name[message.name] = message
+            for variant in message.variants.values():
+                self.by_name[variant.name] = variant
+
+    def message(self, name: str) -> MessageType:
+        try:
+            return self.by_name[name]
+        except KeyError:
+            raise KeyError(f"Message '{name}' is not in the schema, expected one of {list(self.by_name)}") from None
+
+    def match(self, arbitration_id: int) -> Optional[MessageType]:
+        """First message whose ID and mask match, without the dispatch table."""
+        for message in self.messages:
+            if message.matches(arbitration_id):
+                return message
+        return None
+
+def load_schema(path: str = SCHEMA_PATH) -> Schema:
+    """
+    Load a JSON schema of the form
+    {"byte_order": "little", "messages": [{"name", "id", "mask", "length", "exact_length",
+     "fields": [{"name", "offset", "type", "scale", "unit"}], "multiplexor": {field},
+     "variants": {"<value>": {"name", "length", "exact_length", "fields"}}}]}
+    """
+    with open(path, 'r') as f:
+        spec = json.load(f)
+    default_order = BYTE_ORDERS[spec.get('byte_order', 'little')]
+    messages = []
+    for entry in spec['messages']:
+        byte_order = BYTE_ORDERS[entry['byte_order']] if 'byte_order' in entry else default_order
+        base_id = parse_int(entry['id'])
+        mask = parse_int(entry.get('mask', EXTENDED_ID_MASK if base_id > STANDARD_ID_MASK else STANDARD_ID_MASK))
+        multiplexor = Field.from_dict(entry['multiplexor']) if 'multiplexor' in entry else None
+        message = MessageType(entry['name'], base_id, mask, [Field.from_dict(field) for field in entry.get('fields', [])],
+                              entry.get('length'), entry.get('exact_length', False), byte_order, multiplexor)
+        for value, variant in entry.get('variants', {}).items():
+            value = parse_int(value)
+            message.variants[value] = MessageType(
+                variant.get('name', f"{entry['name']}_{value}"), base_id, mask,
+                [Field.from_dict(field) for field in variant.get('fields', [])],
+                variant.get('length', entry.get('length')), variant.get('exact_length', entry.get('exact_length', False)),
+                byte_order, multiplexor, value)
+        messages.append(message)
+    return Schema(messages)
+
+class SchemaDecoder:
+    """
+    Dispatch table from arbitration ID to compiled message type.
+
+    ID ranges are expanded into a dict, so decoding a frame is one lookup and one
+    unpack_from (plus the multiplexor for multiplexed messages).
+    """
+
+    def __init__(self, schema: Schema):
+        self.schema = schema
+        self.table: Dict[int, MessageType] = {}
+        self.ranges: List[MessageType] = []  # Too many IDs to expand, matched by mask
+        # Earlier messages take precedence, as in Schema.match()
+        for message in reversed(schema.messages):
+            if message.id_count() <= MAX_TABLE_IDS:
+                for arbitration_id in message.ids():
+                    self.table[arbitration_id] = message
+            else:
+                self.ranges.insert(0, message)
+
+    def lookup(self, arbitration_id: int) -> Optional[MessageType]:
+        message = self.table.get(arbitration_id)
+        if message is None and self.ranges:
+            for candidate in self.ranges:
+                if candidate.matches(arbitration_id):
+                    return candidate
+        return message
+
+    def decode(self, arbitration_id: int, data: bytes) -> Optional[Tuple[MessageType, tuple]]:
+        """
+        :return: (message type, field values in MessageType.names order), or None for an
+                 unknown ID, multiplexor value or payload length
+        """
+        message = self.table.get(arbitration_id)
+        if message is None:
+            message = self.lookup(arbitration_id) if self.ranges else None
+            if message is None:
+                return None
+        if message.variants:
+            offset = message.multiplexor.offset
+            if len(data) <= offset:
+                return None
+            message = message.variants.get(message.multiplexor_struct.unpack_from(data, offset)[0])
+            if message is None:
+                return None
+        length = len(data)
+        if length < message.min_length or (message.exact_length and length != message.length):
+            return None
+        return message, message.struct.unpack_from(data)
+
+    def decode_batch(self, frames: Iterable) -> Dict[str, Tuple]:
+        """
+        Decode frames grouped by message type with one np.frombuffer per type.
+
+        :param frames: Objects with arbitration_id, timestamp and data (can.Message, candump_log.Frame)
+        :return: Message name -> (arbitration_ids, timestamps, rows with MessageType.dtype)
+        """
+        import numpy as np
+        groups: Dict[MessageType, Tuple[list, list, list]] = {}
+        for frame in frames:
+            data = frame.data
+            message = self.table.get(frame.arbitration_id)
+            if message is None:
+                message = self.lookup(frame.arbitration_id) if self.ranges else None
+                if message is None:
+                    continue
+            if message.variants:
+                offset = message.multiplexor.offset
+                if len(data) <= offset:
+                    continue
+                message = message.variants.get(message.multiplexor_struct.unpack_from(data, offset)[0])
+                if message is None:
+                    continue
+            length = len(data)
+            if length < message.min_length or (message.exact_length and length != message.length):
+                continue
+            group = groups.get(message)
+            if group is None:
+                group = groups[message] = ([], [], [])
+            group[0].append(frame.arbitration_id)
+            group[1].append(frame.timestamp)
+            group[2].append(bytes(data[:message.size]))
+        return {message.name: (np.array(ids, dtype=np.uint32), np.array(timestamps, dtype=np.float64),
+                               np.frombuffer(b''.join(payloads), dtype=message.dtype, count=len(ids)))
+                for message, (ids, timestamps, payloads) in groups.items()}
+
+_default_schema: Optional[Schema] = None
+_default_decoder: Optional[SchemaDecoder] = None
+
+def default_schema() -> Schema:
+    """The schema at SCHEMA_PATH, loaded once per process."""
+    global _default_schema
+    if _default_schema is None:
+        _default_schema = load_schema(SCHEMA_PATH)
+    return _default_schema
+
+def default_decoder() -> SchemaDecoder:
+    global _default_decoder
+    if _default_decoder is None:
+        _default_decoder = SchemaDecoder(default_schema())
+    return _default_decoder
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Show the message layouts of a CAN schema.')
+    parser.add_argument('schema', nargs='?', default=SCHEMA_PATH)
+    args = parser.parse_args(argv)
+    schema = load_schema(args.schema)
+    for message in schema.messages:
+        layouts = [message] + list(message.variants.values())
+        print(f"{message.name}: ID 0x{message.base_id:X} mask 0x{message.mask:X} ({message.id_count()} IDs)")
+        if message.multiplexor is not None:
+            print(f"  multiplexor {message.multiplexor.name} at byte {message.multiplexor.offset}")
+        for layout in layouts:
+            if layout is not message:
+                print(f"  variant 0x{layout.multiplexor_value:X}: {layout.name}")
+            for field in layout.fields:
+                unit = f" [{field.unit}]" if field.unit else ''
+                scale = f" x{field.scale:g}" if field.scale != 1.0 else ''
+                print(f"    {field.offset:>3} {field.type} {field.name}{scale}{unit}")
+            if layout.fields:
+                print(f"    struct '{layout.struct.format}', {layout.min_length}"
+                      f"{'' if layout.exact_length else '+'} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from can_message_processor import CANMessageProcessor, responses_to_dataframe
+
+# Default flush/rotation settings
+FLUSH_FRAMES = 5000  # Flush after this many received frames
+FLUSH_INTERVAL = 1.0  # ... or after this many seconds
+MAX_QUEUED_FRAMES = 1_000_000  # Frames waiting for the writer thread; older chunks are dropped beyond this
+
+Chunk = Tuple[Dict[int, np.ndarray], Dict[int, np.ndarray]]
+
+def chunk_frames(chunk: Chunk) -> int:
+    return sum(len(rows) for rows in chunk[0].values()) + sum(len(rows) for rows in chunk[1].values())
+
+class StreamingCSVWriter:
+    """
+    Write a CANMessageProcessor's records to per-module CSV files from a background thread.
+
+    The receive loop calls poll() once per frame. When enough frames or time have accumulated,
+    poll() drains the processor's column buffers (a memory copy) and hands the chunk to the
+    writer thread through a queue, so the receive loop never waits on disk I/O. The queue is
+    bounded by max_queued_frames: when the writer falls that far behind, the oldest queued
+    chunks are dropped (counted in dropped_frames) so that the newest records are kept.
+    An unexpected error stops the writing: it is kept in error, the remaining chunks are
+    counted as dropped and close() raises it again.
+    Files are rotated when they exceed max_file_bytes or are older than max_file_seconds.
+
+    With threaded=False no thread is started and the caller writes drained chunks itself
+    with write_chunk(), e.g. from an executor. An optional summary (can_aggregate.SummaryLog)
+    receives every chunk as well and is closed with the writer.
+    """
+
+    def __init__(self, processor: CANMessageProcessor, output_dir: str = 'output',
+                 flush_frames: int = FLUSH_FRAMES, flush_interval: float = FLUSH_INTERVAL,
+                 max_file_bytes: Optional[int] = None, max_file_seconds: Optional[float] = None,
+                 max_queued_frames: int = MAX_QUEUED_FRAMES, threaded: bool = True, metrics=None, summary=None):
+        self.processor = processor
+        self.output_dir = output_dir
+        self.flush_frames = flush_frames
+        self.flush_interval = flush_interval
+        self.max_file_bytes = max_file_bytes
+        self.max_file_seconds = max_file_seconds
+        self.max_queued_frames = max_queued_frames
+        self.summary = summary
+
+        self.frames_since_flush = 0
+        self.last_flush_time = time.monotonic()
+        self.dropped_frames = 0
+        self.written_frames = 0
+        self.error: Optional[BaseException] = None  # Set by the writer thread when it stops on an error
+
+        # (kind, module_id) -> (path, part number, opened at)
+        self.files: Dict[Tuple[str, int], Tuple[str, int, float]] = {}
+        self.queue: Deque[Optional[Chunk]] = deque()  # None stops the writer thread
+        self.queued_frames = 0
+        self.queue_changed = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='csv-writer', daemon=True) if threaded else None
+        self.closed = False
+
+        # Optional can_metrics.MetricsRegistry
+        self.write_seconds = None
+        if metrics is not None:
+            self.write_seconds = metrics.histogram('can_write_seconds', 'Time to append one chunk to the CSV files')
+            metrics.gauge('can_writer_queued_frames', 'Frames waiting for the writer thread',
+                          lambda: self.queued_frames)
+            metrics.gauge('can_writer_dropped_frames', 'Oldest queued frames dropped because the writer was behind',
+                          lambda: self.dropped_frames)
+            metrics.gauge('can_written_frames', 'Records written to CSV', lambda: self.written_frames)
+
+        os.makedirs(output_dir, exist_ok=True)
+        processor.stream_writer = self
+        if self.thread:
+            self.thread.start()
+
+    def poll(self, frames: int = 1):
+        """Count received frames and hand a chunk to the writer thread when a flush is due."""
+        self.frames_since_flush += frames
+        if (self.frames_since_flush >= self.flush_frames
+                or time.monotonic() - self.last_flush_time >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Queue the buffered records without blocking, dropping the oldest queued chunks if the writer is behind."""
+        self.frames_since_flush = 0
+        self.last_flush_time = time.monotonic()
+        chunk = self.processor.drain()
+        if chunk[0] or chunk[1]:
+            self._put(chunk)
+
+    def _put(self, chunk: Optional[Chunk], drop: bool = True):
+        frames = chunk_frames(chunk) if chunk is not None else 0
+        with self.queue_changed:
+            while drop and self.queue and self.queued_frames + frames > self.max_queued_frames:
+                oldest = self.queue.popleft()
+                dropped = chunk_frames(oldest)
+                self.queued_frames -= dropped
+                self.dropped_frames += dropped
+            self.queue.append(chunk)
+            self.queued_frames += frames
+            self.queue_changed.notify()
+
+    def close(self):
+        """Write the remaining records, stop the writer thread and raise the error it stopped on, if any."""
+        if self.closed:
+            return
+        self.closed = True
+        chunk = self.processor.drain()
+        if self.thread is None:
+            self.write_chunk(chunk)
+        else:
+            if chunk[0] or chunk[1]:
+                self._put(chunk, drop=False)
+            self._put(None, drop=False)
+            self.thread.join()
+        self.processor.stream_writer = None
+        print(f"Wrote {self.written_frames} records to '{self.output_dir}'")
+        if self.dropped_frames:
+            print(f"Dropped {self.dropped_frames} records because the writer was behind")
+        if self.summary is not None:
+            self.summary.close()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            with self.queue_changed:
+                while not self.queue:
+                    self.queue_changed.wait()
+                chunk = self.queue.popleft()
+                if chunk is not None:
+                    self.queued_frames -= chunk_frames(chunk)
+            if chunk is None:
+                break
+            if self.error is None:
+                try:
+                    self.write_chunk(chunk)
+                except Exception as e:
+                    # Keep consuming the queue so that close() does not wait on a dead thread
+                    self.error = e
+                    print(f"CSV writer stopped: {e!r}")
+            if self.error is not None:
+                with self.queue_changed:
+                    self.dropped_frames += chunk_frames(chunk)
+
+    def write_chunk(self, chunk: Chunk):
+        """Append one chunk returned by CANMessageProcessor.drain() to the CSV files."""
+        command_chunks, servo_chunks = chunk
+        start = time.perf_counter()
+        try:
+            for module_id, rows in command_chunks.items():
+                self._write('command', module_id, rows)
+            for module_id, rows in servo_chunks.items():
+                self._write('servo_responses', module_id, rows)
+            if self.summary is not None:
+                self.summary.write_chunk(chunk)
+        except OSError as e:
+            print(f"Error writing CSV chunk: {e}")
+        if self.write_seconds is not None:
+            self.write_seconds.observe(time.perf_counter() - start)
+
+    def _path(self, kind: str, module_id: int) -> str:
+        key = (kind, module_id)
+        now = time.monotonic()
+        if key in self.files:
+            path, part, opened_at = self.files[key]
+            too_big = self.max_file_bytes is not None and os.path.getsize(path) >= self.max_file_bytes
+            too_old = self.max_file_seconds is not None and now - opened_at >= self.max_file_seconds
+            if not (too_big or too_old):
+                return path
+            part += 1
+        else:
+            part = 0
+        suffix = f'_{part:03d}' if part else ''
+        path = os.path.join(self.output_dir, f'{self.processor.start_time}_{kind}_{module_id}{suffix}.csv')
+        self.files[key] = (path, part, now)
+        return path
+
+    def _write(self, kind: str, module_id: int, rows: np.ndarray):
+        path = self._path(kind, module_id)
+        df = responses_to_dataframe(module_id, rows)
+        df.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+        self.written_frames += len(rows)
@@ -0,0 +1,332 @@
+import os
+import math
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from can_indexed_log import IndexedLogReader, index_recorded_log, LOG_EXTENSION
+from can_message_processor import COMMAND
+
+# Tracking analysis settings
+WINDOW = 1.0  # Seconds per reported window
+CHUNK_SECONDS = 60.0  # Seconds of one module's records held in memory at a time
+MAX_COMMAND_AGE = 0.05  # Seconds; servo samples without a newer command are not compared
+STEP_THRESHOLD = 1.0  # Degrees; a command change at least this large starts a step
+SETTLE_FRACTION = 0.02  # Settling band as a fraction of the step size ...
+SETTLE_MIN = 0.05  # ... but at least this many degrees
+COMMAND_SCALE = COMMAND.field('value').scale  # Raw command value to degrees
+OUTPUT_DIR = 'tracking_output'
+
+# One row per window and module
+WINDOW_DTYPE = np.dtype([
+    ('window_start', '<f8'),
+    ('samples', '<i8'),
+    ('unmatched', '<i8'),  # Servo samples without a command within MAX_COMMAND_AGE
+    ('mean_error', '<f8'),
+    ('rms_error', '<f8'),
+    ('max_abs_error', '<f8'),
+    ('steps', '<i8'),  # Steps starting in the window
+    ('settled_steps', '<i8'),
+    ('mean_settling_time', '<f8'),
+    ('max_settling_time', '<f8'),
+    ('max_overshoot_pct', '<f8'),
+])
+
+@dataclass
+class TrackingConfig:
+    window: float = WINDOW
+    chunk_seconds: float = CHUNK_SECONDS
+    max_command_age: float = MAX_COMMAND_AGE
+    step_threshold: float = STEP_THRESHOLD
+    settle_fraction: float = SETTLE_FRACTION
+    settle_min: float = SETTLE_MIN
+    command_scale: float = COMMAND_SCALE
+    position_scale: float = COMMAND_SCALE  # The servo position uses the command's units
+
+class WindowAccumulator:
+    """Per-window sums, mergeable across chunks; only a few numbers are kept per window."""
+
+    def __init__(self):
+        # Window index -> [samples, unmatched, sum, sum of squares, max |error|,
+        #                  steps, settled steps, settling time sum, max settling time, max overshoot]
+        self.windows: Dict[int, list] = {}
+
+    def _window(self, index: int) -> list:
+        window = self.windows.get(index)
+        if window is None:
+            window = self.windows[index] = [0, 0, 0.0, 0.0, 0.0, 0, 0, 0.0, 0.0, 0.0]
+        return window
+
+    def add_errors(self, window_ids: np.ndarray, errors: np.ndarray, matched: np.ndarray):
+        ids, inverse = np.unique(window_ids, return_inverse=True)
+        counts = np.bincount(inverse, weights=matched, minlength=len(ids))
+        totals = np.bincount(inverse, minlength=len(ids))
+        errors = np.where(matched, errors, 0.0)
+        sums = np.bincount(inverse, weights=errors, minlength=len(ids))
+        squares = np.bincount(inverse, weights=errors * errors, minlength=len(ids))
+        peaks = np.zeros(len(ids))
+        np.maximum.at(peaks, inverse, np.abs(errors))
+        for index, count, total, total_sum, square, peak in zip(ids.tolist(), counts.tolist(), totals.tolist(),
+                                                                sums.tolist(), squares.tolist(), peaks.tolist()):
+            window = self._window(index)
+            window[0] += int(count)
+            window[1] += total - int(count)
+            window[2] += total_sum
+            window[3] += square
+            window[4] = max(window[4], peak)
+
+    def add_step(self, index: int, settling_time: Optional[float], overshoot_pct: float):
+        window = self._window(index)
+        window[5] += 1
+        if settling_time is not None:
+            window[6] += 1
+            window[7] += settling_time
+            window[8] = max(window[8], settling_time)
+        window[9] = max(window[9], overshoot_pct)
+
+    def rows(self, window: float) -> np.ndarray:
+        rows = np.zeros(len(self.windows), dtype=WINDOW_DTYPE)
+        for row, index in zip(rows, sorted(self.windows)):
+            samples, unmatched, total, square, peak, steps, settled, settling, max_settling, overshoot = self.windows[index]
+            row['window_start'] = index * window
+            row['samples'] = samples
+            row['unmatched'] = unmatched
+            row['mean_error'] = total / samples if samples else math.nan
+            row['rms_error'] = math.sqrt(square / samples) if samples else math.nan
+            row['max_abs_error'] = peak if samples else math.nan
+            row['steps'] = steps
+            row['settled_steps'] = settled
+            row['mean_settling_time'] = settling / settled if settled else math.nan
+            row['max_settling_time'] = max_settling if settled else math.nan
+            row['max_overshoot_pct'] = overshoot if steps else math.nan
+        return rows
+
+class StepTracker:
+    """
+    Overshoot and settling time of command steps, carried across chunks.
+
+    A step starts when the command changes by at least the threshold. Until the next step,
+    overshoot is the largest excursion of the position past the current command in the step
+    direction, and the settling time is the time from the step to the last sample outside
+    the settling band. A step whose last sample is still outside the band has not settled.
+    """
+
+    def __init__(self, config: TrackingConfig, accumulator: WindowAccumulator):
+        self.config = config
+        self.accumulator = accumulator
+        self.active = None  # [start, direction, size, band, peak, last outside, last sample time]
+
+    def start(self, timestamp: float, previous: float, target: float):
+        self.finish()
+        size = abs(target - previous)
+        band = max(self.config.settle_fraction * size, self.config.settle_min)
+        self.active = [timestamp, 1.0 if target > previous else -1.0, size, band, 0.0, timestamp, None]
+
+    def update(self, timestamps: np.ndarray, positions: np.ndarray, commands: np.ndarray):
+        """Add the matched samples that belong to the active step."""
+        step = self.active
+        if step is None or not len(timestamps):
+            return
+        deviation = positions - commands
+        step[4] = max(step[4], float((step[1] * deviation).max()))
+        outside = np.abs(deviation) > step[3]
+        if outside.any():
+            step[5] = max(step[5], float(timestamps[outside][-1]))
+        step[6] = float(timestamps[-1])
+
+    def finish(self):
+        step = self.active
+        self.active = None
+        if step is None or step[6] is None:
+            return
+        start, _, size, _, peak, last_outside, last_sample = step
+        settling_time = last_outside - start if last_outside < last_sample else None
+        self.accumulator.add_step(int(start // self.config.window), settling_time, 100.0 * max(peak, 0.0) / size)
+
+def analyze_module(log_path: str, module_id: int, config: TrackingConfig) -> Tuple[int, dict, np.ndarray]:
+    """
+    Stream one module's command and servo records and compute its tracking metrics.
+
+    Commands and servo samples are read chunk_seconds at a time from the indexed log and
+    joined as-of: every servo sample is compared with the latest command at or before it.
+    The last command of a chunk is carried into the next one, so results do not depend on
+    the chunk size. Runs in a worker process.
+
+    :return: (module_id, summary, WINDOW_DTYPE rows)
+    """
+    accumulator = WindowAccumulator()
+    steps = StepTracker(config, accumulator)
+    last_command: Optional[Tuple[float, float]] = None  # (timestamp, degrees)
+    with IndexedLogReader(log_path) as reader:
+        first, last = reader.time_range()
+        if math.isnan(first):
+            return module_id, {}, accumulator.rows(config.window)
+        # Chunks start on window boundaries, so a window is never split between chunks
+        span = max(1, round(config.chunk_seconds / config.window)) * config.window
+        chunk_start = math.floor(first / config.window) * config.window
+        while chunk_start <= last:
+            chunk_end = chunk_start + span
+            commands = reader.command(module_id, chunk_start, chunk_end)
+            servos = reader.servo(module_id, chunk_start, chunk_end)
+            # query() includes both ends; the end belongs to the next chunk
+            commands = commands[commands['timestamp'] < chunk_end]
+            servos = servos[servos['timestamp'] < chunk_end]
+            commands = commands[np.argsort(commands['timestamp'], kind='stable')]
+            servos = servos[np.argsort(servos['timestamp'], kind='stable')]
+
+            command_times = commands['timestamp']
+            command_values = commands['value'] * config.command_scale
+            if last_command is not None:
+                command_times = np.concatenate(([last_command[0]], command_times))
+                command_values = np.concatenate(([last_command[1]], command_values))
+
+            servo_times = servos['timestamp']
+            positions = servos['position'] * config.position_scale
+            # As-of join: latest command at or before each servo sample
+            if len(command_times):
+                matches = np.searchsorted(command_times, servo_times, side='right') - 1
+                latest = np.maximum(matches, 0)
+                targets = command_values[latest]
+                matched = (matches >= 0) & (servo_times - command_times[latest] <= config.max_command_age)
+            else:
+                targets = np.zeros(len(servo_times))
+                matched = np.zeros(len(servo_times), dtype=bool)
+            errors = np.where(matched, targets - positions, 0.0)
+            accumulator.add_errors(np.floor(servo_times / config.window).astype(np.int64), errors, matched)
+
+            # Steps: the first element is the carried command, which was compared in the previous chunk
+            first_new = 1 if last_command is not None else 0
+            changes = np.abs(np.diff(command_values)) >= config.step_threshold
+            step_indices = np.flatnonzero(changes) + 1
+            step_indices = step_indices[step_indices >= first_new]
+            boundaries = np.searchsorted(servo_times, command_times[step_indices], side='left')
+            segment_start = 0
+            for step_index, boundary in zip(step_indices.tolist(), boundaries.tolist()):
+                segment = slice(segment_start, boundary)
+                valid = matched[segment]
+                steps.update(servo_times[segment][valid], positions[segment][valid], targets[segment][valid])
+                steps.start(float(command_times[step_index]), float(command_values[step_index - 1]),
+                            float(command_values[step_index]))
+                segment_start = boundary
+            segment = slice(segment_start, len(servo_times))
+            valid = matched[segment]
+            steps.update(servo_times[segment][valid], positions[segment][valid], targets[segment][valid])
+
+            if len(command_times):
+                last_command = (float(command_times[-1]), float(command_values[-1]))
+            chunk_start = chunk_end
+    steps.finish()
+    rows = accumulator.rows(config.window)
+    return module_id, summarize(rows), rows
+
+def summarize(rows: np.ndarray) -> dict:
+    """Whole-log metrics of one module from its window rows."""
+    samples = int(rows['samples'].sum())
+    has_samples = rows['samples'] > 0
+    settled = rows['settled_steps']
+    summary = {
+        'samples': samples,
+        'unmatched': int(rows['unmatched'].sum()),
+        'rms_error': math.sqrt(float((rows['rms_error'][has_samples] ** 2 * rows['samples'][has_samples]).sum()) / samples)
+                     if samples else math.nan,
+        'max_abs_error': float(np.nanmax(rows['max_abs_error'])) if samples else math.nan,
+        'steps': int(rows['steps'].sum()),
+        'settled_steps': int(settled.sum()),
+        'mean_settling_time': float((np.nan_to_num(rows['mean_settling_time']) * settled).sum() / settled.sum())
+                              if settled.sum() else math.nan,
+        'max_settling_time': float(np.nanmax(rows['max_settling_time'])) if settled.sum() else math.nan,
+        'max_overshoot_pct': float(np.nanmax(rows['max_overshoot_pct'])) if rows['steps'].sum() else math.nan,
+    }
+    return summary
+
+def prepare_log(path: str, output_dir: str) -> str:
+    """Return an indexed block log for path, converting a recorded candump/ASC/BLF log first."""
+    if path.endswith(LOG_EXTENSION):
+        return path
+    os.makedirs(output_dir, exist_ok=True)
+    log_path = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + LOG_EXTENSION)
+    if not os.path.exists(log_path) or os.path.getmtime(log_path) < os.path.getmtime(path):
+        print(f"Indexing {path} -> {log_path}")
+        index_recorded_log(path, log_path)
+    return log_path
+
+def analyze_log(log_path: str, config: TrackingConfig, modules: Optional[List[int]] = None,
+                jobs: Optional[int] = None) -> Dict[int, Tuple[dict, np.ndarray]]:
+    """
+    Analyze the modules of an indexed log in parallel, one worker process per module.
+
+    :return: module_id -> (summary, window rows)
+    """
+    if modules is None:
+        with IndexedLogReader(log_path) as reader:
+            modules = reader.modules('servo')
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(analyze_module, log_path, module_id, config) for module_id in modules]
+        for future in futures:
+            try:
+                module_id, summary, rows = future.result()
+                results[module_id] = (summary, rows)
+            except Exception as e:
+                print(f"Error analyzing module: {e}")
+    return results
+
+def format_metric(value: float, unit: str = '', factor: float = 1.0, digits: int = 4) -> str:
+    return '-' if math.isnan(value) else f"{value * factor:.{digits}f}{unit}"
+
+def print_summary(results: Dict[int, Tuple[dict, np.ndarray]]):
+    print(f"{'Module':>6} | {'Samples':>9} | {'Unmatched':>9} | {'RMS err':>9} | {'Max err':>9} | {'Steps':>6} | "
+          f"{'Settled':>7} | {'Settle avg':>10} | {'Settle max':>10} | {'Overshoot':>9}")
+    print("-" * 114)
+    for module_id, (summary, _) in sorted(results.items()):
+        if not summary:
+            continue
+        print(f"{module_id:>6} | {summary['samples']:>9} | {summary['unmatched']:>9} | "
+              f"{format_metric(summary['rms_error']):>9} | {format_metric(summary['max_abs_error']):>9} | "
+              f"{summary['steps']:>6} | {summary['settled_steps']:>7} | "
+              f"{format_metric(summary['mean_settling_time'], 'ms', 1e3, 1):>10} | "
+              f"{format_metric(summary['max_settling_time'], 'ms', 1e3, 1):>10} | "
+              f"{format_metric(summary['max_overshoot_pct'], '%', digits=1):>9}")
+
+def save_results(results: Dict[int, Tuple[dict, np.ndarray]], output_dir: str, name: str):
+    import pandas as pd
+    os.makedirs(output_dir, exist_ok=True)
+    for module_id, (_, rows) in results.items():
+        path = os.path.join(output_dir, f'{name}_tracking_{module_id}.csv')
+        pd.DataFrame({field: rows[field] for field in WINDOW_DTYPE.names}).to_csv(path, index=False)
+    summary_path = os.path.join(output_dir, f'{name}_tracking_summary.csv')
+    pd.DataFrame([{'module_id': module_id, **summary} for module_id, (summary, _) in sorted(results.items())
+                  if summary]).to_csv(summary_path, index=False)
+    print(f"Saved window metrics and summary to '{output_dir}'")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tracking error (command vs. servo position) per module over '
+                                                 'recorded logs, out of core and in parallel.')
+    parser.add_argument('path', help=f'Indexed log ({LOG_EXTENSION}) or recorded candump/ASC/BLF log')
+    parser.add_argument('--modules', default=None, help='Comma separated module IDs (default: all)')
+    parser.add_argument('--window', type=float, default=WINDOW, help='Seconds per window')
+    parser.add_argument('--chunk-seconds', type=float, default=CHUNK_SECONDS, help='Seconds held in memory per module')
+    parser.add_argument('--max-command-age', type=float, default=MAX_COMMAND_AGE, help='Seconds')
+    parser.add_argument('--step-threshold', type=float, default=STEP_THRESHOLD, help='Degrees')
+    parser.add_argument('--settle-fraction', type=float, default=SETTLE_FRACTION)
+    parser.add_argument('--settle-min', type=float, default=SETTLE_MIN, help='Degrees')
+    parser.add_argument('--position-scale', type=float, default=COMMAND_SCALE, help='Raw servo position to degrees')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    args = parser.parse_args(argv)
+
+    config = TrackingConfig(window=args.window, chunk_seconds=args.chunk_seconds,
+                            max_command_age=args.max_command_age, step_threshold=args.step_threshold,
+                            settle_fraction=args.settle_fraction, settle_min=args.settle_min,
+                            position_scale=args.position_scale)
+    modules = [int(module) for module in args.modules.split(',')] if args.modules else None
+    log_path = prepare_log(args.path, args.output_dir)
+    results = analyze_log(log_path, config, modules, args.jobs)
+    print_summary(results)
+    save_results(results, args.output_dir, os.path.splitext(os.path.basename(log_path))[0])
+
+if __name__ == "__main__":
+    main()
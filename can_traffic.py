@@ -0,0 +1,208 @@
+import sys
+import math
+import time
+import heapq
+import random
+import argparse
+from dataclasses import dataclass, asdict
+from typing import Iterator
+
+from candump_log import Frame, format_candump_line
+from can_schema import default_schema
+
+# Payload layouts and arbitration IDs of the robot bus, from the shared message schema
+SCHEMA = default_schema()
+COMMAND = SCHEMA.message('command')
+SERVO = SCHEMA.message('servo')
+POSITION = SCHEMA.message('position')
+DEBUG = SCHEMA.message('debug')
+ANGLE_CONVERSION_FACTOR = round(1 / COMMAND.field('value').scale)
+BURST_SPACING = 20e-6  # Seconds between back-to-back burst frames (about one FD frame at 5 Mbit/s)
+CHANNEL = 'can0'
+
+@dataclass
+class TrafficConfig:
+    modules: int = 7
+    command_rate: float = 1000.0  # Commands per second per module
+    response_latency: float = 0.0005  # Seconds from command to servo response
+    latency_jitter: float = 0.0002  # Uniform +- jitter on the latency
+    response_loss: float = 0.0  # Probability that a command gets no responses
+    error_rate: float = 0.0  # Probability that a servo response carries an error code
+    position_frames: bool = True  # Also send a 0x10x position frame per command
+    debug_rate: float = 10.0  # 64-byte 0x700 frames per second
+    burst_interval: float = 0.0  # Seconds between bursts of debug frames, 0 to disable
+    burst_size: int = 0  # Back-to-back frames per burst
+    seed: int = 0
+    channel: str = CHANNEL
+
+    def frames_per_second(self) -> float:
+        """Approximate frame rate, used to size benchmarks."""
+        per_command = 1 + (1 - self.response_loss) * (2 if self.position_frames else 1)
+        bursts = self.burst_size / self.burst_interval if self.burst_interval > 0 else 0
+        return self.modules * self.command_rate * per_command + self.debug_rate + bursts
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+def generate_frames(config: TrafficConfig, duration: float, start_time: float = 0.0) -> Iterator[Frame]:
+    """
+    Yield synthetic robot traffic in timestamp order.
+
+    Every module receives a sinusoidal angle command (0x200 + module) at command_rate and
+    answers with a 16-byte servo response (0x500 + module) and a position frame
+    (0x100 + module) after response_latency. Debug frames (0x700) and optional bursts are
+    mixed in.
+    """
+    rng = random.Random(config.seed)
+    period = 1.0 / config.command_rate
+    debug_period = 1.0 / config.debug_rate if config.debug_rate > 0 else math.inf
+    end_time = start_time + duration
+    pending = []  # Heap of (timestamp, sequence, frame)
+    sequence = 0
+    next_debug = start_time
+    next_burst = start_time + config.burst_interval if config.burst_interval > 0 else math.inf
+    debug_payload = bytes(range(DEBUG.length))
+
+    tick = 0
+    tick_time = start_time
+    while tick_time < end_time:
+        next_tick_time = start_time + (tick + 1) * period
+        for module in range(1, config.modules + 1):
+            angle = 45 * math.sin(2 * math.pi * (tick_time - start_time) * (0.2 + 0.05 * module))
+            value = int(angle * ANGLE_CONVERSION_FACTOR)
+            # Commands to the modules are spread evenly over the period
+            timestamp = tick_time + period * (module - 1) / config.modules
+            heapq.heappush(pending, (timestamp, sequence, Frame(
+                timestamp, config.channel, COMMAND.arbitration_id(module), COMMAND.pack(value), True, False)))
+            sequence += 1
+            if rng.random() < config.response_loss:
+                continue
+            latency = max(0.0, config.response_latency + rng.uniform(-1, 1) * config.latency_jitter)
+            position = value - int(value * 0.05)
+            error = 1 if rng.random() < config.error_rate else 0
+            servo = SERVO.pack(rng.randint(-2000, 2000), value - position, position, error)
+            heapq.heappush(pending, (timestamp + latency, sequence, Frame(
+                timestamp + latency, config.channel, SERVO.arbitration_id(module), servo, True, False)))
+            sequence += 1
+            if config.position_frames:
+                position_time = timestamp + latency + BURST_SPACING
+                heapq.heappush(pending, (position_time, sequence, Frame(
+                    position_time, config.channel, POSITION.arbitration_id(module),
+                    POSITION.pack(position), True, False)))
+                sequence += 1
+
+        while next_debug < next_tick_time:
+            heapq.heappush(pending, (next_debug, sequence, Frame(
+                next_debug, config.channel, DEBUG.base_id, debug_payload, True, False)))
+            sequence += 1
+            next_debug += debug_period
+        while next_burst < next_tick_time:
+            for i in range(config.burst_size):
+                timestamp = next_burst + i * BURST_SPACING
+                heapq.heappush(pending, (timestamp, sequence, Frame(
+                    timestamp, config.channel, DEBUG.base_id, debug_payload, True, False)))
+                sequence += 1
+            next_burst += config.burst_interval
+
+        tick += 1
+        tick_time = next_tick_time
+        while pending and pending[0][0] < tick_time:
+            yield heapq.heappop(pending)[2]
+
+    while pending:
+        frame = heapq.heappop(pending)[2]
+        if frame.timestamp < end_time:
+            yield frame
+
+def generate_candump(config: TrafficConfig, duration: float, start_time: float = 0.0) -> Iterator[str]:
+    """Yield the generated traffic as `candump -L` lines (with newlines)."""
+    for frame in generate_frames(config, duration, start_time):
+        yield format_candump_line(frame.timestamp, frame.channel, frame.arbitration_id, frame.data,
+                                  frame.is_fd, frame.is_extended_id, fd_flags=1) + '\n'
+
+def send_frames(bus, frames: Iterator[Frame], realtime: bool = True) -> int:
+    """
+    Send frames on a python-can bus (virtual, vcan, ...).
+
+    :param realtime: Pace the frames by their timestamps; otherwise send as fast as possible
+    :return: Number of frames sent
+    """
+    import can
+    count = 0
+    wall_start = None
+    first_timestamp = 0.0
+    for frame in frames:
+        if realtime:
+            if wall_start is None:
+                wall_start, first_timestamp = time.perf_counter(), frame.timestamp
+            ahead = (frame.timestamp - first_timestamp) - (time.perf_counter() - wall_start)
+            if ahead > 0.001:
+                time.sleep(ahead)
+        message = can.Message(timestamp=frame.timestamp, arbitration_id=frame.arbitration_id, data=frame.data,
+                              is_fd=frame.is_fd, is_extended_id=frame.is_extended_id, bitrate_switch=frame.is_fd)
+        try:
+            bus.send(message)
+            count += 1
+        except can.CanError as e:
+            print(f"Error sending message: {e}")
+    return count
+
+def open_bus(spec: str):
+    """Open a bus from 'interface:channel', e.g. 'virtual:bench' or 'socketcan:vcan0'."""
+    import can
+    interface, _, channel = spec.partition(':')
+    return can.Bus(interface=interface, channel=channel or CHANNEL, fd=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic robot CAN FD traffic as candump -L text or on a bus.')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of traffic')
+    parser.add_argument('--modules', type=int, default=TrafficConfig.modules)
+    parser.add_argument('--rate', type=float, default=TrafficConfig.command_rate, help='Commands per second per module')
+    parser.add_argument('--latency', type=float, default=TrafficConfig.response_latency, help='Response latency (s)')
+    parser.add_argument('--jitter', type=float, default=TrafficConfig.latency_jitter, help='Latency jitter (s)')
+    parser.add_argument('--loss', type=float, default=TrafficConfig.response_loss, help='Response loss probability')
+    parser.add_argument('--error-rate', type=float, default=TrafficConfig.error_rate)
+    parser.add_argument('--debug-rate', type=float, default=TrafficConfig.debug_rate, help='0x700 frames per second')
+    parser.add_argument('--burst-interval', type=float, default=TrafficConfig.burst_interval, help='Seconds, 0 disables')
+    parser.add_argument('--burst-size', type=int, default=TrafficConfig.burst_size)
+    parser.add_argument('--no-position', action='store_true', help='Do not send 0x10x position frames')
+    parser.add_argument('--seed', type=int, default=TrafficConfig.seed)
+    parser.add_argument('--start-time', type=float, default=None, help='First timestamp (default: now)')
+    parser.add_argument('--output', default='-', help="candump -L output file, '-' for stdout")
+    parser.add_argument('--bus', help="Send on a bus instead, e.g. 'virtual:bench' or 'socketcan:vcan0'")
+    parser.add_argument('--no-realtime', action='store_true', help='With --bus, send as fast as possible')
+    return parser.parse_args(argv)
+
+def config_from_args(args) -> TrafficConfig:
+    return TrafficConfig(modules=args.modules, command_rate=args.rate, response_latency=args.latency,
+                         latency_jitter=args.jitter, response_loss=args.loss, error_rate=args.error_rate,
+                         position_frames=not args.no_position, debug_rate=args.debug_rate,
+                         burst_interval=args.burst_interval, burst_size=args.burst_size, seed=args.seed)
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = config_from_args(args)
+    start_time = time.time() if args.start_time is None else args.start_time
+
+    if args.bus:
+        bus = open_bus(args.bus)
+        try:
+            count = send_frames(bus, generate_frames(config, args.duration, start_time), not args.no_realtime)
+            print(f"Sent {count} frames on {args.bus}")
+        except KeyboardInterrupt:
+            print("\nProgram terminated by user.")
+        finally:
+            bus.shutdown()
+        return
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        output.writelines(generate_candump(config, args.duration, start_time))
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+from collections import namedtuple
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# One frame of a `candump -L` log. Field names match can.Message so frames can be passed
+# wherever only these attributes are read (e.g. CANMessageProcessor.process_*_message).
+Frame = namedtuple('Frame', ['timestamp', 'channel', 'arbitration_id', 'data', 'is_fd', 'is_extended_id'])
+
+CHUNK_SIZE = 1 << 16  # Bytes read from stdin per call
+
+def parse_candump_line(line: str) -> Optional[Frame]:
+    """
+    Parse one `candump -L` line.
+
+    Classic frames look like '(ts) can0 123#DEADBEEF', CAN FD frames like '(ts) can0 123##1DEADBEEF'
+    where the digit after '##' holds the FD flags. Remote frames carry no data.
+
+    :param line: A line of candump log output
+    :return: The parsed frame, or None if the line is not a frame
+    """
+    parts = line.split()
+    if len(parts) < 3 or not parts[0].startswith('('):
+        return None
+    try:
+        timestamp = float(parts[0][1:-1])
+        frame = parts[2]
+        separator = frame.index('#')
+        arbitration_id = int(frame[:separator], 16)
+        if frame[separator + 1:separator + 2] == '#':
+            is_fd = True
+            data = bytes.fromhex(frame[separator + 3:])
+        else:
+            is_fd = False
+            payload = frame[separator + 1:]
+            data = b'' if payload.startswith('R') else bytes.fromhex(payload)
+    except ValueError:
+        return None
+    return Frame(timestamp, parts[1], arbitration_id, data, is_fd, separator > 3)
+
+def format_candump_line(timestamp: float, channel: str, arbitration_id: int, data: bytes,
+                        is_fd: bool = False, is_extended_id: bool = False, fd_flags: int = 0) -> str:
+    """Format a frame as a `candump -L` line (without the trailing newline)."""
+    can_id = f'{arbitration_id:08X}' if is_extended_id else f'{arbitration_id:03X}'
+    separator = f'##{fd_flags:X}' if is_fd else '#'
+    return f'({timestamp:.6f}) {channel} {can_id}{separator}{bytes(data).hex().upper()}'
+
+def read_candump_log(path: str) -> Iterator[Frame]:
+    """Yield the frames of a `candump -L` log file."""
+    with open(path, 'r') as f:
+        yield from parse_candump_lines(f)
+
+def parse_candump_lines(lines: Iterable[str]) -> Iterator[Frame]:
+    for line in lines:
+        frame = parse_candump_line(line)
+        if frame is not None:
+            yield frame
+
+def parse_frame_header(line: bytes) -> Optional[Tuple[float, int]]:
+    """Return (timestamp, arbitration_id) of a `candump -L` line such as b'(1436509052.249713) can0 123#11'."""
+    try:
+        timestamp_field, _, frame = line.split(b' ', 3)[:3]
+        return float(timestamp_field[1:-1]), int(frame[:frame.index(b'#')], 16)
+    except ValueError:
+        return None
+
+def read_chunks(stream, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yield whatever is available on a binary stream, up to chunk_size bytes per read.
+
+    The last chunk is always b'' so that consumers can flush a final line without a newline.
+    """
+    read = getattr(stream, 'read1', stream.read)
+    while True:
+        chunk = read(chunk_size)
+        yield chunk
+        if not chunk:
+            return
+
+def iter_line_batches(chunks: Iterable[bytes]) -> Iterator[List[bytes]]:
+    """Split byte chunks into lists of complete lines, carrying partial lines over to the next chunk."""
+    remainder = b''
+    for chunk in chunks:
+        lines = (remainder + chunk).split(b'\n')
+        remainder = lines.pop()
+        if not chunk and remainder:
+            lines.append(remainder)
+            remainder = b''
+        yield lines
+
+def iter_line_blocks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Re-cut byte chunks into blocks that end on a line boundary."""
+    remainder = b''
+    for chunk in chunks:
+        block = remainder + chunk
+        if not chunk:
+            if block:
+                yield block
+            return
+        end = block.rfind(b'\n') + 1
+        remainder = block[end:]
+        if end:
+            yield block[:end]
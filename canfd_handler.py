@@ -1,5 +1,4 @@
-import can
-import time
+import argparse
 
 def setup_can_interface(channel='can0', bitrate=1000000, data_bitrate=5000000):
     """
@@ -10,6 +9,7 @@ def setup_can_interface(channel='can0', bitrate=1000000, data_bitrate=5000000):
     :param data_bitrate: The CAN FD data bitrate
     :return: Configured CAN bus object
     """
+    import can
     try:
         bus = can.interface.Bus(channel=channel, 
                                 interface='socketcan',
@@ -30,6 +30,7 @@ def send_canfd_message(bus, arbitration_id, data):
     :param arbitration_id: The CAN arbitration ID
     :param data: The data to send (up to 64 bytes for CANFD)
     """
+    import can
     message = can.Message(arbitration_id=arbitration_id, 
                           data=data,
                           is_extended_id=False,
@@ -62,13 +63,27 @@ def receive_canfd_messages(bus, timeout=1.0):
             print(f"Data: {message.data}")
             print("----")
 
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print every CAN FD message received on an interface.')
+    parser.add_argument('--channel', default='can0')
+    parser.add_argument('--bitrate', type=int, default=1000000)
+    parser.add_argument('--data-bitrate', type=int, default=5000000)
+    args = parser.parse_args(argv)
+
     # Setup the CAN interface
-    canfd_bus = setup_can_interface()
+    canfd_bus = setup_can_interface(args.channel, args.bitrate, args.data_bitrate)
     
     if canfd_bus:
         # Example: Send a CANFD message
         # send_canfd_message(canfd_bus, arbitration_id=0x123, data=[0x11, 0x22, 0x33, 0x44, 0x55, 0x66, 0x77, 0x88] * 8)  # 64 bytes of data
         
         # Start receiving messages
-        receive_canfd_messages(canfd_bus)
\ No newline at end of file
+        try:
+            receive_canfd_messages(canfd_bus)
+        except KeyboardInterrupt:
+            print("\nProgram terminated by user.")
+        finally:
+            canfd_bus.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,311 @@
-import can
-import struct
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-from collections import defaultdict, deque
+import numpy as np
+from collections import defaultdict
+import sys
+import time
 import threading
 import signal
-import time
+import argparse
 import colorsys
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+from can_receiver import BatchReceiver
+from can_schema import default_schema, default_decoder
 
 # Configuration
 CAN_CHANNEL = 'can0'
 CAN_BITRATE = 1_000_000  # 1Mbps
 CAN_DATA_BITRATE = 5_000_000  # 5Mbps
 TIME_WINDOW = 10  # Time window to display (in seconds)
-ANGLE_CONVERSION_FACTOR = 10000  # Factor to convert raw value to angle
-COMMAND_ID_RANGE_START = 0x201  # Hexadecimal 201
-COMMAND_ID_RANGE_END = 0x2FF  # Hexadecimal 2FF
-POSITION_ID_RANGE_START = 0x101  # Hexadecimal 101
-POSITION_ID_RANGE_END = 0x1FF  # Hexadecimal 1FF
+# Plotted messages and their angle fields, from the shared message schema (can_schema.json)
+SCHEMA = default_schema()
+COMMAND = SCHEMA.message('command')
+POSITION = SCHEMA.message('position')
+ANGLE_FIELDS = {  # Message type -> (field index, scale to degrees)
+    COMMAND: (COMMAND.index('value'), COMMAND.field('value').scale),
+    POSITION: (POSITION.index('position'), POSITION.field('position').scale),
+}
+COMMAND_ID_RANGE_START = COMMAND.arbitration_id(1)  # Module 0 is not plotted
+COMMAND_ID_RANGE_END = COMMAND.arbitration_id(COMMAND.module_mask)
+POSITION_ID_RANGE_START = POSITION.arbitration_id(1)
+POSITION_ID_RANGE_END = POSITION.arbitration_id(POSITION.module_mask)
 Y_AXIS_MIN = -90  # Minimum angle for Y-axis
 Y_AXIS_MAX = 90   # Maximum angle for Y-axis
 UPDATE_INTERVAL = 50  # Milliseconds between plot updates
-MAX_DATA_POINTS = 1000  # Maximum number of data points to store (100 per second for 10 seconds)
+MAX_DATA_POINTS = 10000  # Maximum number of data points to store per ID (1000 per second for 10 seconds)
 NUM_SUBPLOTS = 7  # Number of subplots to display
+SHARED_NAME = 'canfd_plot'  # Shared memory segment of the acquisition process
+POLL_TIMEOUT = 0.1  # Seconds the acquisition waits for frames before it checks for stop
+
+# Acquisition states
+STARTING, RUNNING, FINISHED, FAILED = range(4)
 
-def setup_can_interface():
+# Header of the shared angle ring, written by the acquisition process only
+HEADER_DTYPE = np.dtype([
+    ('modules', '<u8'),
+    ('capacity', '<u8'),
+    ('state', '<u8'),
+    ('frames', '<u8'),
+    ('kernel_drops', '<i8'),  # -1 if SO_RXQ_OVFL is not available
+    ('start_time', '<f8'),
+    ('latest', '<f8'),  # Relative time of the latest frame
+], align=True)
+HEADER_SIZE = 64
+
+def setup_can_interface(channel: str = CAN_CHANNEL):
+    import can
     try:
-        bus = can.interface.Bus(channel=CAN_CHANNEL,
+        bus = can.interface.Bus(channel=channel,
                                 interface='socketcan',
                                 fd=True,
                                 bitrate=CAN_BITRATE,
                                 data_bitrate=CAN_DATA_BITRATE)
-        print(f"Successfully configured {CAN_CHANNEL} for CANFD")
+        print(f"Successfully configured {channel} for CANFD")
         print(f"Bitrate: {CAN_BITRATE / 1_000_000}Mbps, Data Bitrate: {CAN_DATA_BITRATE / 1_000_000}Mbps")
         return bus
     except can.CanError as e:
         print(f"Error setting up CAN interface: {e}")
         return None
 
-def parse_int32(data):
-    return struct.unpack('<i', data)[0]  # Assuming little-endian
-
-def value_to_angle(value):
-    return value / ANGLE_CONVERSION_FACTOR
-
 def generate_complementary_colors(n):
     hsv_colors = [(i / n, 0.8, 0.9) for i in range(n)]
     rgb_colors = [colorsys.hsv_to_rgb(*hsv) for hsv in hsv_colors]
     complementary_colors = [colorsys.hsv_to_rgb((h + 0.5) % 1, s, v) for h, s, v in hsv_colors]
     return list(zip(rgb_colors, complementary_colors))
 
+class RingBuffer:
+    """
+    Fixed-size ring of (timestamp, value) samples backed by NumPy arrays.
+
+    Every sample is written twice, at i and i + capacity, so the samples in arrival order
+    are always one contiguous slice and can be searched with searchsorted without copying.
+    """
+
+    def __init__(self, capacity: int = MAX_DATA_POINTS):
+        self.capacity = capacity
+        self.timestamps = np.zeros(2 * capacity)
+        self.values = np.zeros(2 * capacity)
+        self.head = 0  # Next write position
+        self.count = 0
+        self.version = 0  # Incremented on every append
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp: float, value: float):
+        head = self.head
+        self.timestamps[head] = self.timestamps[head + self.capacity] = timestamp
+        self.values[head] = self.values[head + self.capacity] = value
+        self.head = (head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.version += 1
+
+    def last(self, default: float = 0) -> float:
+        return self.values[self.head - 1 + self.capacity] if self.count else default
+
+    def window(self, start_time: float):
+        """Return copies of the samples with timestamp > start_time, oldest first."""
+        start = self.head if self.count == self.capacity else 0
+        timestamps = self.timestamps[start:start + self.count]
+        first = np.searchsorted(timestamps, start_time, side='right')
+        return timestamps[first:].copy(), self.values[start + first:start + self.count].copy()
+
+def decode_angle(decoder, message):
+    """
+    Angle in degrees carried by a command or position frame of a module other than 0.
+
+    :return: The angle, or None for other frames
+    """
+    return decoded_angle(message.arbitration_id, decoder.decode(message.arbitration_id, message.data))
+
+def decoded_angle(arbitration_id: int, decoded):
+    """The angle of a frame already decoded by SchemaDecoder.decode, see decode_angle()."""
+    if decoded is None:
+        return None
+    layout, values = decoded
+    angle_field = ANGLE_FIELDS.get(layout)
+    if angle_field is None or not layout.module_id(arbitration_id):
+        return None
+    index, scale = angle_field
+    return values[index] * scale
+
+def attach_shared_memory(name: str, untrack: bool = True) -> shared_memory.SharedMemory:
+    """
+    Attach to a segment owned by another process without letting this process remove it on exit.
+
+    :param untrack: False for children of the owner, which share its resource tracker
+    """
+    if not untrack:
+        return shared_memory.SharedMemory(name=name)
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # Before 3.13 attaching registers the segment with this process's resource tracker,
+    # which would unlink it when the viewer exits while the acquisition still runs
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+class SharedAngleRing:
+    """
+    Angles of every plotted ID in shared memory: one writer, any number of readers.
+
+    Each series (command and position of a module) is a RingBuffer laid out in the segment,
+    with every sample written at i and i + capacity, a count of samples written so far and a
+    count of samples reserved. The writer reserves a batch, stores it and only then advances
+    the written count; it never waits for readers, so viewers cannot slow down or block
+    capture. A reader copies a window of written samples and then re-reads the reserved
+    count: every sample the writer may have overwritten meanwhile, including a batch still
+    being stored, lies below reserved - capacity and is dropped.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        self.modules = int(self.header['modules'])
+        self.capacity = capacity = int(self.header['capacity'])
+        series = 2 * self.modules
+        self.written = np.ndarray((series,), dtype='<u8', buffer=shm.buf, offset=HEADER_SIZE)
+        self.reserved = np.ndarray((series,), dtype='<u8', buffer=shm.buf, offset=HEADER_SIZE + 8 * series)
+        offset = HEADER_SIZE + 16 * series
+        self.timestamps = np.ndarray((series, 2 * capacity), dtype='<f8', buffer=shm.buf, offset=offset)
+        self.values = np.ndarray((series, 2 * capacity), dtype='<f8', buffer=shm.buf,
+                                 offset=offset + 16 * series * capacity)
+        # Arbitration ID -> series; command and position of module m are 2(m - 1) and 2(m - 1) + 1
+        self.series: Dict[int, int] = {}
+        for module_id in range(1, self.modules + 1):
+            self.series[COMMAND.arbitration_id(module_id)] = 2 * (module_id - 1)
+            self.series[POSITION.arbitration_id(module_id)] = 2 * (module_id - 1) + 1
+
+    @staticmethod
+    def nbytes(modules: int, capacity: int) -> int:
+        return HEADER_SIZE + 2 * modules * (16 + 2 * 2 * capacity * 8)
+
+    @classmethod
+    def create(cls, name: Optional[str] = SHARED_NAME, modules: int = NUM_SUBPLOTS,
+               capacity: int = MAX_DATA_POINTS) -> 'SharedAngleRing':
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.nbytes(modules, capacity))
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        header[()] = (modules, capacity, STARTING, 0, -1, np.nan, 0.0)
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str = SHARED_NAME, untrack: bool = True) -> 'SharedAngleRing':
+        return cls(attach_shared_memory(name, untrack), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write_frames(self, frames: List, decoder) -> int:
+        """
+        Decode a batch of frames and append their angles. Called by the acquisition process only.
+
+        :return: Number of angles written
+        """
+        if not frames:
+            return 0
+        header = self.header
+        start_time = float(header['start_time'])
+        if start_time != start_time:  # NaN until the first frame
+            start_time = frames[0].timestamp
+            header['start_time'] = start_time
+        samples: Dict[int, List] = {}
+        series_of = self.series
+        for frame in frames:
+            series = series_of.get(frame.arbitration_id)
+            if series is None:
+                continue
+            angle = decode_angle(decoder, frame)
+            if angle is not None:
+                samples.setdefault(series, []).append((frame.timestamp - start_time, angle))
+        for series, rows in samples.items():
+            self._append(series, np.array(rows[-self.capacity:]))
+        header['frames'] += len(frames)
+        header['latest'] = frames[-1].timestamp - start_time
+        return sum(map(len, samples.values()))
+
+    def _append(self, series: int, rows: np.ndarray):
+        written = int(self.written[series])
+        # Readers treat everything below reserved - capacity as overwritten from here on
+        self.reserved[series] = written + len(rows)
+        positions = (written + np.arange(len(rows))) % self.capacity
+        for column, values in ((self.timestamps[series], rows[:, 0]), (self.values[series], rows[:, 1])):
+            column[positions] = values
+            column[positions + self.capacity] = values
+        self.written[series] = written + len(rows)
+
+    def version(self, arbitration_id: int) -> Optional[int]:
+        """Samples written so far for an ID, or None if it has none."""
+        series = self.series.get(arbitration_id)
+        if series is None:
+            return None
+        return int(self.written[series]) or None
+
+    def window(self, arbitration_id: int, start_time: float):
+        """Return copies of the samples with timestamp > start_time, oldest first."""
+        series = self.series[arbitration_id]
+        written = int(self.written[series])
+        count = min(written, self.capacity)
+        start = written % self.capacity if written >= self.capacity else 0
+        timestamps = self.timestamps[series, start:start + count].copy()
+        values = self.values[series, start:start + count].copy()
+        # The writer may have overwritten the oldest samples (or be storing a batch over them) while copying
+        overwritten = min(count, max(0, int(self.reserved[series]) - self.capacity - (written - count)))
+        timestamps, values = timestamps[overwritten:], values[overwritten:]
+        first = np.searchsorted(timestamps, start_time, side='right')
+        return timestamps[first:], values[first:]
+
+    def close(self):
+        # Views into the buffer must be released before the mapping can be closed
+        self.header = self.written = self.reserved = self.timestamps = self.values = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def decimate_min_max(timestamps: np.ndarray, values: np.ndarray, max_points: int):
+    """
+    Reduce a series to at most about max_points samples, keeping the minimum and maximum of
+    each bin so that spikes stay visible.
+    """
+    bins = max_points // 2
+    if len(values) <= max_points or bins < 1:
+        return timestamps, values
+    per_bin = len(values) // bins
+    used = bins * per_bin
+    shaped = values[:used].reshape(bins, per_bin)
+    offsets = np.arange(bins) * per_bin
+    keep = np.sort(np.concatenate((offsets + shaped.argmin(axis=1), offsets + shaped.argmax(axis=1))))
+    keep = np.concatenate((keep, np.arange(used, len(values))))
+    return timestamps[keep], values[keep]
+
 class CANPlotter:
-    def __init__(self):
-        self.data = defaultdict(lambda: {'timestamps': deque(maxlen=MAX_DATA_POINTS), 
-                                         'angles': deque(maxlen=MAX_DATA_POINTS)})
+    def __init__(self, num_subplots: int = NUM_SUBPLOTS, capacity: int = MAX_DATA_POINTS):
+        self.num_subplots = num_subplots
+        self.data = defaultdict(lambda: RingBuffer(capacity))
         self.start_time = None
-        self.last_position = {}  # Store the last position for each ID
+        self.decoder = default_decoder()
         self.latest_timestamp = 0  # Store the latest timestamp from CAN messages
 
         # Generate complementary colors for each ID pair
         num_pairs = COMMAND_ID_RANGE_END - COMMAND_ID_RANGE_START + 1
         self.color_pairs = generate_complementary_colors(num_pairs)
 
-        # Set up the plot
-        self.fig, self.axes = plt.subplots(NUM_SUBPLOTS, 1, figsize=(12, 4*NUM_SUBPLOTS), sharex=True)
+        # Set up the plot; matplotlib is imported here so that the module loads without it
+        import matplotlib.pyplot as plt
+        self.plt = plt
+        self.fig, axes = plt.subplots(num_subplots, 1, figsize=(12, 4*num_subplots), sharex=True, squeeze=False)
+        self.axes = axes[:, 0]
         self.fig.suptitle(f'Real-time Angle Values')
         self.scatters = defaultdict(dict)
+        self.drawn = {}  # ID -> (buffer version, latest timestamp, point count) of the last draw
 
         for i, ax in enumerate(self.axes):
             ax.set_ylabel(f'Angle (degrees)\nID {i+1}')
             ax.set_ylim(Y_AXIS_MIN, Y_AXIS_MAX)
+            ax.set_xlim(-TIME_WINDOW, 0)  # Fixed; data is plotted relative to the latest timestamp
             ax.grid(True)
 
             command_id = COMMAND_ID_RANGE_START + i
@@ -85,80 +321,102 @@ class CANPlotter:
         self.running = True
         self.animation = None
 
+    def latest(self) -> float:
+        with self.data_lock:
+            return self.latest_timestamp
+
+    def version(self, arbitration_id: int) -> Optional[int]:
+        """Changes whenever samples of the ID are added; None if it has none."""
+        buffer = self.data.get(arbitration_id)
+        return None if buffer is None else buffer.version
+
+    def window(self, arbitration_id: int, start_time: float):
+        with self.data_lock:
+            return self.data[arbitration_id].window(start_time)
+
     def update_plot(self, frame):
+        latest = self.latest()
+
+        updated_scatters = []
+        for i in range(self.num_subplots):
+            command_id = COMMAND_ID_RANGE_START + i
+            position_id = POSITION_ID_RANGE_START + i
+            ax_scatters = [self.scatters[command_id], self.scatters[position_id]]
+            # Min/max decimation keeps at most about two points per horizontal pixel
+            max_points = 2 * int(self.axes[i].bbox.width)
+
+            changed = False
+            for id in (command_id, position_id):
+                version = self.version(id)
+                if version is None:
+                    continue
+                drawn = self.drawn.get(id)
+                if drawn is not None and drawn[:2] == (version, latest):
+                    continue
+                timestamps, angles = self.window(id, latest - TIME_WINDOW)
+                if drawn is not None and drawn[2] == 0 and len(timestamps) == 0:
+                    self.drawn[id] = (version, latest, 0)
+                    continue
+
+                timestamps, angles = decimate_min_max(timestamps, angles, max_points)
+                self.scatters[id].set_offsets(np.column_stack((timestamps - latest, angles)))
+                self.drawn[id] = (version, latest, len(timestamps))
+                changed = True
+
+            # Blitting restores the whole axes background, so all artists of a changed axes are redrawn
+            if changed:
+                updated_scatters.extend(ax_scatters)
+
+        return updated_scatters
+
+    def handle_message(self, message):
+        """
+        Store the angle carried by one command or position frame.
+
+        :param message: A can.Message or any object with arbitration_id, timestamp and data
+        """
+        self.handle_decoded(message, self.decoder.decode(message.arbitration_id, message.data))
+
+    def handle_decoded(self, message, decoded):
+        """handle_message() for a frame already decoded by SchemaDecoder.decode (e.g. by can_fanout)."""
+        if self.start_time is None:
+            self.start_time = message.timestamp
+
+        relative_time = message.timestamp - self.start_time
+        self.latest_timestamp = relative_time  # Update the latest timestamp
+
+        angle = decoded_angle(message.arbitration_id, decoded)
+        if angle is None:
+            return
+
         with self.data_lock:
-            if not any(self.data.values()):
-                return []
-            
-            updated_scatters = []
-            for i in range(NUM_SUBPLOTS):
-                command_id = COMMAND_ID_RANGE_START + i
-                position_id = POSITION_ID_RANGE_START + i
-
-                for id in [command_id, position_id]:
-                    if id in self.data:
-                        visible_data = [(t - self.latest_timestamp, a) for t, a in zip(self.data[id]['timestamps'], self.data[id]['angles']) if t > self.latest_timestamp - TIME_WINDOW]
-                        if visible_data:
-                            timestamps, angles = zip(*visible_data)
-                            self.scatters[id].set_offsets(list(zip(timestamps, angles)))
-                            updated_scatters.append(self.scatters[id])
-                        else:
-                            self.scatters[id].set_offsets([])
-
-            for ax in self.axes:
-                ax.set_xlim(-TIME_WINDOW, 0)
-
-            return updated_scatters
+            self.data[message.arbitration_id].append(relative_time, angle)
 
     def receive_can_messages(self, bus):
+        import can
+        receiver = BatchReceiver(bus)
         while self.running:
             try:
-                message = bus.recv(0.1)  # Non-blocking receive with timeout
-                if message:
-                    current_time = time.time()
-                    if self.start_time is None:
-                        self.start_time = current_time
-
-                    relative_time = current_time - self.start_time
-                    self.latest_timestamp = relative_time  # Update the latest timestamp
-                    
-                    if COMMAND_ID_RANGE_START <= message.arbitration_id <= COMMAND_ID_RANGE_END:
-                        raw_value = parse_int32(message.data)
-                        angle = value_to_angle(raw_value)
-                        
-                        with self.data_lock:
-                            self.data[message.arbitration_id]['timestamps'].append(relative_time)
-                            self.data[message.arbitration_id]['angles'].append(angle)
-                        
-                        position_id = message.arbitration_id - COMMAND_ID_RANGE_START + POSITION_ID_RANGE_START
-                        position_angle = self.last_position.get(position_id, 0)
-                    
-                    elif POSITION_ID_RANGE_START <= message.arbitration_id <= POSITION_ID_RANGE_END and len(message.data) >= 5:
-                        if message.data[1] == 0x14:
-                            if (message.arbitration_id == 0x107):
-                                print(f"Received message: {message}")
-
-                            raw_value = parse_int32(message.data[2:6])
-                            angle = value_to_angle(raw_value)
-                            
-                            with self.data_lock:
-                                self.data[message.arbitration_id]['timestamps'].append(relative_time)
-                                self.data[message.arbitration_id]['angles'].append(angle)
-                            
-                            self.last_position[message.arbitration_id] = angle
-                            command_id = message.arbitration_id - POSITION_ID_RANGE_START + COMMAND_ID_RANGE_START
-                            command_angle = self.data[command_id]['angles'][-1] if self.data[command_id]['angles'] else 0
-            
-            except can.CanError:
+                for message in receiver.recv_batch(0.1):  # Drains all queued frames, waits up to 0.1s
+                    self.handle_message(message)
+
+            except (can.CanError, OSError):
                 if self.running:
                     print("Error receiving CAN message")
+        receiver.print_stats()
+
+    def show(self):
+        """Run the animation on the calling (main) thread until the window is closed."""
+        from matplotlib.animation import FuncAnimation
+        self.animation = FuncAnimation(self.fig, self.update_plot, interval=UPDATE_INTERVAL, blit=True)
+        self.plt.show()
 
     def run(self, bus):
+        """Receive on a thread of this process and plot; see run_split() for a separate acquisition process."""
         receive_thread = threading.Thread(target=self.receive_can_messages, args=(bus,))
         receive_thread.start()
 
-        self.animation = FuncAnimation(self.fig, self.update_plot, interval=UPDATE_INTERVAL, blit=True)
-        plt.show()
+        self.show()
 
         self.running = False
         receive_thread.join()
@@ -167,23 +425,177 @@ class CANPlotter:
         self.running = False
         if self.animation:
             self.animation.event_source.stop()
-        plt.close('all')
+        self.plt.close('all')
+
+class SharedPlotter(CANPlotter):
+    """Renderer that only reads snapshots of a SharedAngleRing filled by an acquisition process."""
+
+    def __init__(self, ring: SharedAngleRing, num_subplots: int = NUM_SUBPLOTS):
+        self.ring = ring
+        super().__init__(min(num_subplots, ring.modules), capacity=1)
+
+    def latest(self) -> float:
+        return float(self.ring.header['latest'])
+
+    def version(self, arbitration_id: int) -> Optional[int]:
+        return self.ring.version(arbitration_id)
+
+    def window(self, arbitration_id: int, start_time: float):
+        return self.ring.window(arbitration_id, start_time)
+
+    def handle_decoded(self, message, decoded):
+        raise TypeError("SharedPlotter only displays the angles written by the acquisition process")
+
+def acquire(bus, ring: SharedAngleRing, stop) -> None:
+    """Receive into the shared ring until stop is set; nothing here waits for the viewers."""
+    import can
+    receiver = BatchReceiver(bus)
+    decoder = default_decoder()
+    header = ring.header
+    header['state'] = RUNNING
+    while not stop.is_set():
+        try:
+            ring.write_frames(receiver.recv_batch(POLL_TIMEOUT), decoder)
+        except (can.CanError, OSError):
+            if not stop.is_set():
+                print("Error receiving CAN message")
+        header['kernel_drops'] = -1 if receiver.stats.kernel_drops is None else receiver.stats.kernel_drops
+    header['state'] = FINISHED
+    receiver.print_stats()
+
+def acquisition_process(channel: str, ring_name: str, stop) -> None:
+    """Entry point of the acquisition process started by run_split()."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The renderer handles Ctrl+C and sets stop
+    ring = SharedAngleRing.attach(ring_name, untrack=False)
+    bus = None
+    try:
+        bus = setup_can_interface(channel)
+        if bus is None:
+            ring.header['state'] = FAILED
+            return
+        acquire(bus, ring, stop)
+    except Exception as e:
+        print(f"Error receiving CAN messages: {e}")
+        ring.header['state'] = FAILED
+    finally:
+        if bus is not None:
+            bus.shutdown()
+        ring.close()
+
+def wait_for_acquisition(ring: SharedAngleRing, process, timeout: float = 10.0) -> bool:
+    deadline = time.time() + timeout
+    while int(ring.header['state']) == STARTING and process.is_alive() and time.time() < deadline:
+        time.sleep(0.05)
+    return int(ring.header['state']) == RUNNING
+
+def run_split(channel: str, num_subplots: int = NUM_SUBPLOTS, name: str = SHARED_NAME):
+    """
+    Receive in a separate acquisition process and render in this one.
+
+    The processes share only the angle ring, so redraws and window drags cannot stall the
+    socket reads; more viewers can attach to the ring with --attach while this one runs.
+    """
+    global plotter
+    ring = SharedAngleRing.create(name, max(num_subplots, NUM_SUBPLOTS))
+    stop = multiprocessing.Event()
+    process = multiprocessing.Process(target=acquisition_process, args=(channel, ring.name, stop),
+                                      name='acquisition')
+    process.start()
+    try:
+        if not wait_for_acquisition(ring, process):
+            print("Acquisition process did not start")
+            return
+        print(f"Acquisition running, attach more viewers with: canfd_plot.py --attach {ring.name}")
+        plotter = SharedPlotter(ring, num_subplots)
+        plotter.show()
+    finally:
+        stop.set()
+        process.join()
+        plotter = None
+        ring.close()
+
+def run_acquisition(channel: str, modules: int = NUM_SUBPLOTS, name: str = SHARED_NAME):
+    """Receive into a named ring without a window, for viewers started with --attach."""
+    ring = SharedAngleRing.create(name, modules)
+    bus = setup_can_interface(channel)
+    if bus is None:
+        ring.close()
+        return
+    stop = threading.Event()
+    print(f"Acquisition running, attach viewers with: canfd_plot.py --attach {ring.name}")
+    try:
+        acquire(bus, ring, stop)
+    except KeyboardInterrupt:
+        stop.set()
+    finally:
+        ring.header['state'] = FINISHED
+        bus.shutdown()
+        ring.close()
+
+def run_viewer(name: str = SHARED_NAME, num_subplots: int = NUM_SUBPLOTS):
+    """Render the ring of a running acquisition until the window is closed."""
+    global plotter
+    try:
+        ring = SharedAngleRing.attach(name)
+    except FileNotFoundError:
+        print(f"No acquisition is running with shared memory '{name}'")
+        return
+    try:
+        plotter = SharedPlotter(ring, num_subplots)
+        plotter.show()
+    finally:
+        plotter = None
+        ring.close()
 
 def signal_handler(signum, frame):
     print("\nCtrl+C pressed. Stopping the program...")
-    if 'plotter' in globals():
+    if globals().get('plotter') is not None:
         plotter.stop()
 
-if __name__ == "__main__":
-    signal.signal(signal.SIGINT, signal_handler)
-    canfd_bus = setup_can_interface()
-    if canfd_bus:
-        plotter = CANPlotter()
+def main(argv=None):
+    global plotter
+    parser = argparse.ArgumentParser(description='Plot command and position angles per module in real time.')
+    parser.add_argument('--channel', default=CAN_CHANNEL)
+    parser.add_argument('--subplots', type=int, default=NUM_SUBPLOTS)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--acquire', action='store_true',
+                      help='Only receive into shared memory, for viewers started with --attach')
+    mode.add_argument('--attach', nargs='?', const=SHARED_NAME, default=None, metavar='NAME',
+                      help='Only display the shared memory of a running acquisition')
+    mode.add_argument('--threaded', action='store_true',
+                      help='Receive on a thread of the viewer process instead of a separate process')
+    parser.add_argument('--name', default=SHARED_NAME, help='Shared memory name of the acquisition')
+    args = parser.parse_args(argv)
+
+    if args.attach:
+        signal.signal(signal.SIGINT, signal_handler)
+        run_viewer(args.attach, args.subplots)
+    elif args.acquire:
+        try:
+            run_acquisition(args.channel, args.subplots, args.name)
+        except FileExistsError:
+            print(f"Shared memory '{args.name}' exists: another acquisition is running or a stale "
+                  f"/dev/shm/{args.name} must be removed")
+    elif args.threaded:
+        signal.signal(signal.SIGINT, signal_handler)
+        canfd_bus = setup_can_interface(args.channel)
+        if canfd_bus:
+            plotter = CANPlotter(args.subplots)
+            try:
+                plotter.run(canfd_bus)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                plotter.stop()
+                canfd_bus.shutdown()
+    else:
+        signal.signal(signal.SIGINT, signal_handler)
         try:
-            plotter.run(canfd_bus)
-        except KeyboardInterrupt:
-            pass
-        finally:
-            plotter.stop()
-            canfd_bus.shutdown()
-    print("Program exited.")
\ No newline at end of file
+            run_split(args.channel, args.subplots, args.name)
+        except FileExistsError:
+            print(f"Shared memory '{args.name}' exists: another acquisition is running or a stale "
+                  f"/dev/shm/{args.name} must be removed")
+    print("Program exited.")
+
+if __name__ == "__main__":
+    main()
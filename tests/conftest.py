@@ -0,0 +1,35 @@
+import os
+import sys
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+INT32 = np.iinfo(np.int32)
+
+@pytest.fixture
+def servo_rows():
+    """Factory of SERVO_DTYPE records at 1 kHz with random field values and error codes."""
+    from can_message_processor import SERVO_DTYPE
+
+    def make(count: int, seed: int = 0, start: float = 1.7e9, jitter: float = 0.0,
+             low: int = INT32.min, high: int = INT32.max, errors=(0, 0, 0, 1, 0xFFFF)) -> np.ndarray:
+        """
+        :param jitter: Standard deviation in seconds added to every timestamp
+        :param low: Smallest field value; the first rows hold low, high, 0 and -1
+        """
+        rng = np.random.default_rng(seed)
+        rows = np.zeros(count, dtype=SERVO_DTYPE)
+        rows['command_id'] = 0x500
+        rows['timestamp'] = start + np.arange(count) * 1e-3
+        if jitter:
+            rows['timestamp'] += rng.normal(0, jitter, count)
+        for name in ('current', 'velocity', 'position'):
+            rows[name] = rng.integers(low, high, count, endpoint=True, dtype=np.int32)
+        extremes = [low, high, 0, -1][:count]
+        rows['current'][:len(extremes)] = extremes
+        rows['error'] = rng.choice(errors, count)
+        return rows
+    return make
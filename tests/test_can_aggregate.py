@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from can_message_processor import SERVO_DTYPE
+from can_aggregate import (aggregate_records, merge_aggregates, SummaryLog, load_summary, to_csv_rows,
+                           format_window, parse_window, FIELDS)
+
+RECORDS = dict(start=100.0005, low=-10000, high=10000)  # Timestamps half a frame off the window boundaries
+
+def assert_aggregates_equal(actual: np.ndarray, expected: np.ndarray):
+    for name in ('module_id', 'window', 'count', 'error_count', 'error_bits'):
+        assert actual[name].tolist() == expected[name].tolist()
+    for field in FIELDS:
+        assert actual[f'{field}_min'].tolist() == expected[f'{field}_min'].tolist()
+        assert actual[f'{field}_max'].tolist() == expected[f'{field}_max'].tolist()
+        np.testing.assert_allclose(actual[f'{field}_mean'], expected[f'{field}_mean'], rtol=1e-12)
+        np.testing.assert_allclose(actual[f'{field}_m2'], expected[f'{field}_m2'], rtol=1e-9)
+
+def test_aggregate_matches_numpy_statistics(servo_rows):
+    rows = servo_rows(500, 1, **RECORDS)
+    aggregates = aggregate_records(3, rows, 0.1)
+    windows = np.floor_divide(rows['timestamp'], 0.1).astype(np.int64)
+    for aggregate in aggregates:
+        selected = rows[windows == aggregate['window']]
+        assert aggregate['count'] == len(selected)
+        assert aggregate['current_min'] == selected['current'].min()
+        assert aggregate['current_mean'] == pytest.approx(selected['current'].mean())
+        assert aggregate['current_m2'] == pytest.approx(selected['current'].var() * len(selected))
+        assert aggregate['error_count'] == np.count_nonzero(selected['error'])
+
+def test_merged_windows_equal_aggregating_the_records(servo_rows):
+    rows = servo_rows(3000, 2, **RECORDS)
+    merged = merge_aggregates(aggregate_records(1, rows, 0.01), ratio=10)
+    assert_aggregates_equal(merged, aggregate_records(1, rows, 0.1))
+
+def test_tiers_equal_direct_aggregation(tmp_path, servo_rows):
+    records = {module_id: servo_rows(4000, module_id, **RECORDS) for module_id in (1, 2, 5)}
+    log = SummaryLog(str(tmp_path), 'run', (0.01, 0.1, 1.0))
+    # Chunks in time order, as drained from a capture, with boundaries that split windows
+    for start in np.arange(100.0, 104.1, 0.337):
+        log.add_records({module_id: rows[(rows['timestamp'] >= start) & (rows['timestamp'] < start + 0.337)]
+                         for module_id, rows in records.items()})
+    log.close()
+    for path, window in zip(log.paths, (0.01, 0.1, 1.0)):
+        loaded, loaded_window = load_summary(path)
+        assert loaded_window == window
+        expected = np.concatenate([aggregate_records(module_id, rows, window) for module_id, rows in records.items()])
+        order = np.lexsort((loaded['window'], loaded['module_id']))
+        csv_rows = to_csv_rows(expected, window)
+        assert loaded['count'][order].tolist() == csv_rows['count'].tolist()
+        assert loaded['module_id'][order].tolist() == csv_rows['module_id'].tolist()
+        assert loaded['window'][order].tolist() == expected['window'].tolist()
+        for field in FIELDS:
+            assert loaded[f'{field}_max'][order].tolist() == expected[f'{field}_max'].tolist()
+            np.testing.assert_allclose(loaded[f'{field}_mean'][order], expected[f'{field}_mean'], rtol=1e-9)
+
+def test_rejects_windows_that_are_not_multiples(tmp_path):
+    with pytest.raises(ValueError):
+        SummaryLog(str(tmp_path), 'run', (0.01, 0.025))
+
+def test_window_labels():
+    assert [format_window(window) for window in (0.01, 0.1, 1.0, 60.0)] == ['10ms', '100ms', '1s', '60s']
+    assert parse_window('10ms') == 0.01 and parse_window('60s') == 60.0
@@ -0,0 +1,30 @@
+import asyncio
+
+import can
+
+from can_async import Consumer, PipelineStats, read_frames
+
+def test_backlog_beyond_the_limit_drops_the_oldest_frames():
+    async def run():
+        reader = can.AsyncBufferedReader()
+        for i in range(100):
+            reader.buffer.put_nowait(can.Message(timestamp=float(i), arbitration_id=0x501, data=b'\0' * 8))
+        reader.buffer.put_nowait(can.Message(timestamp=100.0, is_error_frame=True))
+        reader.buffer.put_nowait(None)
+        consumer = Consumer(queue_size=100)
+        stats = PipelineStats()
+        await read_frames(reader, [consumer], stats, batch_size=10, max_backlog=20)
+        batches = []
+        while not consumer.queue.empty():
+            batches.append(consumer.queue.get_nowait())
+        return stats, batches
+
+    stats, batches = asyncio.run(run())
+    timestamps = [message.timestamp for batch in batches for message in batch]
+    # The first batch was taken before the backlog was checked. The 92 entries behind it (90 frames,
+    # the error frame and the sentinel) are cut to max_backlog, dropping the 72 oldest frames
+    assert timestamps == [float(i) for i in range(10)] + [float(i) for i in range(82, 100)]
+    assert stats.frames == 28
+    assert stats.dropped_frames == 72
+    assert stats.error_frames == 1
+    assert stats.batches == len(batches)
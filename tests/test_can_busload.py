@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from can_busload import frame_bits, frame_seconds
+
+def bits(length, is_fd=False, is_extended=False, brs=False):
+    nominal, fast = frame_bits(np.array([length]), np.array([is_fd]), np.array([is_extended]), np.array([brs]))
+    return int(nominal[0]), int(fast[0])
+
+def test_classic_worst_case_matches_known_frame_lengths():
+    # Davis et al.: 135 and 160 bits for 8-byte standard and extended frames, 55 for an empty one
+    assert bits(8) == (135, 0)
+    assert bits(8, is_extended=True) == (160, 0)
+    assert bits(0) == (55, 0)
+
+def test_fd_lengths_round_up_to_the_next_dlc():
+    assert bits(13, is_fd=True, brs=True) == bits(16, is_fd=True, brs=True)
+    assert bits(17, is_fd=True, brs=True) == bits(20, is_fd=True, brs=True)
+
+def test_brs_moves_the_data_phase_to_the_data_rate():
+    nominal_brs, fast_brs = bits(16, is_fd=True, brs=True)
+    nominal, fast = bits(16, is_fd=True)
+    assert fast == 0 and fast_brs > 0
+    assert nominal == nominal_brs + fast_brs
+    seconds = frame_seconds([16], [True], [False], [True], bitrate=1e6, data_bitrate=5e6)[0]
+    assert seconds == pytest.approx(nominal_brs / 1e6 + fast_brs / 5e6)
+
+def run_analyzer(timestamps, **kwargs):
+    from can_busload import BusLoadAnalyzer
+    periods = []
+    analyzer = BusLoadAnalyzer(on_period=periods.append, **kwargs)
+    count = len(timestamps)
+    analyzer.add(np.asarray(timestamps, dtype=np.float64), np.full(count, 0x501), np.full(count, 16),
+                 np.ones(count, bool), np.zeros(count, bool))
+    analyzer.finish()
+    return analyzer, periods
+
+def test_periods_start_at_their_boundary_and_count_idle_windows():
+    timestamps = 1.9 + np.arange(100) * 1e-3  # 1 kHz only in [1.9, 2.0)
+    analyzer, periods = run_analyzer(np.append(timestamps, 2.5))
+    busy = frame_seconds([16], [True], [False], [True])[0]
+    first, second = periods
+    assert first.start == pytest.approx(1.0)
+    assert first.duration == pytest.approx(1.0)
+    assert first.frames == 100
+    assert first.load == pytest.approx(100 * busy)
+    assert first.peak == pytest.approx(100 * busy / 0.1)  # 10 frames in each 10 ms window
+    assert second.start == pytest.approx(2.0)
+    assert second.duration == pytest.approx(0.51)  # Up to the end of the last window
+    assert second.frames == 1
+
+def test_frames_on_a_boundary_open_the_next_window():
+    analyzer, periods = run_analyzer([2.5, 3.0, 47.0])
+    assert [round(period.start, 6) for period in periods] == [2.0, 3.0, 47.0]
+    assert [period.frames for period in periods] == [1, 1, 1]
+    assert periods[-1].duration == pytest.approx(0.01)
+    assert analyzer.window_loads.count == 4700 - 250 + 1  # Every window from 2.50 s to 47.00 s
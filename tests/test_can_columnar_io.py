@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+
+import can_columnar_io
+from can_columnar_io import load_columnar, write_columnar
+from candump_log import Frame
+from can_message_processor import CANMessageProcessor, SERVO_DTYPE, SERVO_STRUCT
+
+def servo_rows(count: int) -> np.ndarray:
+    rows = np.zeros(count, dtype=SERVO_DTYPE)
+    for name in SERVO_DTYPE.names:
+        rows[name] = np.arange(count) * 3 - count
+    return rows
+
+def test_npy_round_trip_has_the_module_id_column(tmp_path):
+    rows = servo_rows(100)
+    path = write_columnar(os.path.join(tmp_path, 'servo_7'), rows, 7, 'npy')
+    assert path.endswith('.npy')
+    columns = load_columnar(path)
+    assert list(columns) == list(SERVO_DTYPE.names) + ['module_id']
+    for name in SERVO_DTYPE.names:
+        np.testing.assert_array_equal(columns[name], rows[name])
+    np.testing.assert_array_equal(columns['module_id'], np.full(100, 7))
+
+def test_missing_pyarrow_is_reported_once_per_save(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(can_columnar_io, '_pyarrow', lambda: (None, None))
+    processor = CANMessageProcessor()
+    processor.process_servo_batch([Frame(i * 0.001, 'can0', 0x500 | (1 + i % 3), SERVO_STRUCT.pack(i, 0, 0, 0), True, False)
+                                   for i in range(30)])
+    paths = processor.save_columnar(str(tmp_path), 'parquet')
+    assert len(paths) == 3 and all(path.endswith('.npy') for path in paths)
+    assert capsys.readouterr().out.count('pyarrow is not installed') == 1
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+from can_message_processor import COMMAND_DTYPE, SERVO_DTYPE
+from can_compact_log import (CompactLogWriter, read_compact_log, iter_compact_log, zigzag, unzigzag,
+                             encode_varints, decode_varints, encode_delta, decode_delta, encode_delta_of_delta,
+                             decode_delta_of_delta, encode_run_length, decode_run_length, CODECS)
+
+INT32 = np.iinfo(np.int32)
+INT64 = np.iinfo(np.int64)
+SPECIAL_TIMESTAMPS = [0.0, -0.0, 1e300, -1e300, np.inf, -np.inf, np.nan, 5e-324, 1.7e9, -1.0, 1.7e9 + 1e-6]
+
+def test_zigzag_round_trips_extreme_values():
+    values = np.array([0, -1, 1, INT64.min, INT64.max, INT64.min + 1, INT64.max - 1], dtype=np.int64)
+    codes = zigzag(values)
+    assert codes[:3].tolist() == [0, 1, 2]
+    assert unzigzag(codes).tobytes() == values.tobytes()
+
+def test_varints_round_trip_every_length():
+    values = np.array([0, 1, 127, 128, 16383, 16384, 2**32 - 1, 2**56, 2**63, 2**64 - 1], dtype=np.uint64)
+    encoded = encode_varints(values)
+    assert len(encode_varints(np.array([127], dtype=np.uint64))) == 1
+    assert len(encode_varints(np.array([2**64 - 1], dtype=np.uint64))) == 10
+    assert decode_varints(encoded).tobytes() == values.tobytes()
+    assert encode_varints(np.empty(0, dtype=np.uint64)) == b''
+    assert len(decode_varints(b'')) == 0
+
+@pytest.mark.parametrize('dtype', ['<i4', '<u2'])
+def test_delta_and_run_length_round_trip_extremes(dtype):
+    info = np.iinfo(dtype)
+    values = np.array([info.min, info.max, info.min, 0, 0, 0, info.max, info.max, 1], dtype=dtype)
+    assert decode_delta(encode_delta(values), np.dtype(dtype)).tobytes() == values.tobytes()
+    assert decode_run_length(encode_run_length(values), np.dtype(dtype)).tobytes() == values.tobytes()
+    empty = np.empty(0, dtype=dtype)
+    assert decode_run_length(encode_run_length(empty), np.dtype(dtype)).tobytes() == b''
+
+def test_delta_of_delta_keeps_the_exact_timestamp_bits():
+    values = np.array(SPECIAL_TIMESTAMPS, dtype=np.float64)
+    decoded = decode_delta_of_delta(encode_delta_of_delta(values), np.dtype('<f8'))
+    assert decoded.tobytes() == values.tobytes()
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_log_round_trips_bytes_across_blocks(tmp_path, codec, servo_rows):
+    path = str(tmp_path / f'run_{codec}.cdl')
+    servo = servo_rows(5000, jitter=2e-5)
+    servo['timestamp'][100:100 + len(SPECIAL_TIMESTAMPS)] = SPECIAL_TIMESTAMPS
+    command = np.zeros(3000, dtype=COMMAND_DTYPE)
+    command['command_id'] = 0x200
+    command['timestamp'] = 1.7e9 + np.arange(3000) * 1e-3
+    command['value'] = np.resize(np.array([INT32.min, INT32.max, 0, -1], dtype=np.int32), 3000)
+
+    writer = CompactLogWriter(path, codec, block_rows=1024)
+    for chunk in range(8):  # Chunks that do not line up with the blocks
+        writer.append('servo_responses', 3, servo[chunk * 700:(chunk + 1) * 700])
+        writer.append('command', 3, command[chunk * 420:(chunk + 1) * 420])
+    writer.append('servo', 7, servo[:1])
+    writer.close()
+
+    logged = read_compact_log(path)
+    assert set(logged) == {('servo', 3), ('command', 3), ('servo', 7)}
+    assert logged[('servo', 3)].tobytes() == servo.tobytes()
+    assert logged[('command', 3)].tobytes() == command.tobytes()
+    assert logged[('servo', 7)].tobytes() == servo[:1].tobytes()
+
+def test_truncated_last_block_keeps_the_complete_blocks(tmp_path, servo_rows):
+    path = str(tmp_path / 'run.cdl')
+    servo = servo_rows(3000, jitter=2e-5)
+    writer = CompactLogWriter(path, block_rows=1000)
+    for start in range(0, 3000, 1000):
+        writer.append('servo', 1, servo[start:start + 1000])
+    writer.close()
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 10)
+    rows = np.concatenate([rows for _, _, rows in iter_compact_log(path)])
+    assert rows.tobytes() == servo[:len(rows)].tobytes()
+    assert len(rows) == 2000
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.cdl'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        list(iter_compact_log(str(path)))
@@ -0,0 +1,37 @@
+from can_deadline import DeadlineTracker, detect_deadline_misses
+
+def feed(tracker: DeadlineTracker, timestamps, arbitration_id: int = 0x501):
+    for timestamp in timestamps:
+        tracker.update(arbitration_id, timestamp)
+    return tracker.end_period()[arbitration_id]
+
+def test_regular_frames_have_no_misses():
+    stats = feed(DeadlineTracker(), [i * 0.001 for i in range(1000)])
+    assert stats.misses == stats.lost == 0
+    assert abs(stats.period - 0.001) < 1e-9
+
+def test_dropped_frames_are_counted_as_lost():
+    dropped = {100, 101, 102, 500, 800}
+    events = []
+    tracker = DeadlineTracker(on_event=events.append)
+    stats = feed(tracker, [i * 0.001 for i in range(1000) if i not in dropped])
+    assert stats.lost == len(dropped)
+    assert stats.gaps == 3
+    assert [event['lost'] for event in events] == [3, 1, 1]
+    assert abs(stats.period - 0.001) < 1e-6  # Misses do not stretch the learned period
+
+def test_late_frame_without_loss():
+    timestamps = [i * 0.001 for i in range(100)]
+    timestamps[50] += 0.0003  # 1.3 ms interval: late, but no whole period missing
+    stats = feed(DeadlineTracker(tolerance=0.2), timestamps)
+    assert stats.misses == 1 and stats.gaps == 0
+
+def test_nothing_is_checked_during_warmup():
+    stats = feed(DeadlineTracker(warmup=20), [0.0, 0.001, 0.010, 0.011])
+    assert stats.misses == 0
+
+def test_candump_input(capsys):
+    lines = ''.join(f"({1000 + i * 0.001:.6f}) can0 501##1{'00' * 16}\n" for i in range(3000) if i != 1500)
+    tracker = detect_deadline_misses([lines.encode()])
+    assert tracker.total[0x501].lost == 1
+    assert '501' in capsys.readouterr().out
@@ -0,0 +1,45 @@
+from candump_log import Frame
+from can_fanout import AnalyzerPlugin, ComparisonPlugin, FanOut, FrequencyPlugin
+from can_schema import default_schema
+
+SCHEMA = default_schema()
+
+class RecordingPlugin(AnalyzerPlugin):
+    name = 'recording'
+
+    def __init__(self, decodes: bool):
+        self.decodes = decodes
+        self.batches = []
+
+    def handle(self, frames, decoded):
+        self.batches.append((frames, decoded))
+
+def test_comparison_plugin_prints_last_window_on_close(capsys):
+    plugin = ComparisonPlugin(window_size=1.0)
+    plugin.handle([Frame(1000 + i * 0.01, 'can0', arbitration_id, b'\0' * 8, True, False)
+                   for i in range(300) for arbitration_id in (0x201, 0x501)], None)
+    plugin.close()
+    labels = [line.split('|')[0].strip() for line in capsys.readouterr().out.splitlines() if line[:1].isdigit()]
+    assert labels == ['1000.000', '1001.000', '1002.000']
+
+def test_frames_are_decoded_once_for_the_plugins_that_use_them():
+    servo = SCHEMA.message('servo')
+    frames = [Frame(i * 0.001, 'can0', servo.arbitration_id(1), servo.pack(i, 0, 0, 0), True, False) for i in range(10)]
+    frames.append(Frame(0.5, 'can0', 0x7FF, b'\0', False, False))
+    fanout = FanOut(batch_size=100)
+    decoding, plain = fanout.register(RecordingPlugin(True)), fanout.register(RecordingPlugin(False))
+    for frame in frames:
+        fanout.dispatch(frame)
+    fanout.close()
+    (batch, decoded), = decoding.batches
+    assert batch == frames
+    assert [values[0] for _, values in decoded[:10]] == list(range(10))
+    assert all(message is servo for message, _ in decoded[:10]) and decoded[10] is None
+    assert plain.batches == [(frames, None)]
+
+def test_periodic_plugin_reports_every_period_and_the_last_one(capsys):
+    plugin = FrequencyPlugin(report_period=1.0)
+    plugin.handle([Frame(10 + i * 0.01, 'can0', 0x501, b'\0', False, False) for i in range(250)], None)
+    plugin.close()
+    rows = [line.split('|')[0].strip() for line in capsys.readouterr().out.splitlines() if '| 501' in line]
+    assert rows == ['10', '11', '12', 'total']
@@ -0,0 +1,61 @@
+import json
+import os
+
+from candump_log import Frame, parse_candump_lines
+from can_flight_recorder import FlightRecorder, ServoErrorTrigger, iter_batches
+from can_schema import default_schema
+
+SERVO = default_schema().message('servo')
+
+def servo_frames(duration: float, errors=(), rate: int = 100, error_modules=None):
+    """One servo response every 1/rate s from module 1; frames at the given times carry an error."""
+    error_modules = {round(t * rate): module_id for t, module_id in (error_modules or {}).items()}
+    error_modules.update((round(t * rate), 1) for t in errors)
+    return [Frame(i / rate, 'can0', SERVO.arbitration_id(error_modules.get(i, 1)),
+                  SERVO.pack(0, 0, 0, 1 if i in error_modules else 0), True, False)
+            for i in range(round(duration * rate))]
+
+def record(tmp_path, frames, **kwargs):
+    recorder = FlightRecorder(str(tmp_path), [ServoErrorTrigger()], **kwargs)
+    for batch in iter_batches(frames, 64):
+        recorder.handle(batch)
+    recorder.close()
+    with open(os.path.join(tmp_path, f'{recorder.run_name}_events.jsonl')) as f:
+        events = [json.loads(line) for line in f]
+    logs = []
+    for event in events:
+        with open(os.path.join(tmp_path, event['file'])) as f:
+            logs.append([frame.timestamp for frame in parse_candump_lines(f)])
+    return recorder, events, logs
+
+def test_event_covers_the_pre_and_post_window(tmp_path):
+    _, events, logs = record(tmp_path, servo_frames(30, errors=[12.0]), pre_seconds=2, post_seconds=3)
+    assert len(events) == 1
+    assert events[0]['trigger_time'] == 12.0
+    assert events[0]['frames'] == len(logs[0]) == 501
+    assert (logs[0][0], logs[0][-1]) == (10.0, 15.0)
+    assert logs[0] == sorted(logs[0])
+    assert not events[0]['truncated'] and events[0]['dropped'] == 0
+
+def test_triggers_inside_an_event_extend_it(tmp_path):
+    # A persisting fault within post_seconds does not re-trigger, another reason extends the event
+    frames = servo_frames(30, errors=[5.0, 6.0, 20.0], error_modules={7.5: 2})
+    _, events, logs = record(tmp_path, frames, pre_seconds=1, post_seconds=3)
+    assert [event['trigger_time'] for event in events] == [5.0, 20.0]
+    assert events[0]['reasons'] == {'servo_error_0x501': 1, 'servo_error_0x502': 1}
+    assert (logs[0][0], logs[0][-1]) == (4.0, 10.5)
+    assert (logs[1][0], logs[1][-1]) == (19.0, 23.0)
+
+def test_short_ring_marks_the_event_truncated(tmp_path):
+    _, events, logs = record(tmp_path, servo_frames(10, errors=[5.0]), pre_seconds=2, post_seconds=1, max_frames=100)
+    assert events[0]['truncated']
+    assert logs[0][0] > 3.0
+
+def test_frames_beyond_the_writer_queue_are_dropped(tmp_path):
+    recorder, events, logs = record(tmp_path, servo_frames(10, errors=[5.0]), pre_seconds=2, post_seconds=1,
+                                    max_pending_frames=100)
+    # The 201 pre-trigger frames exceed the queue at once; the following small batches fit
+    assert events[0]['dropped'] >= 201
+    assert recorder.dropped_frames == events[0]['dropped']
+    assert events[0]['frames'] == len(logs[0])
+    assert events[0]['frames'] + events[0]['dropped'] == 301
@@ -0,0 +1,19 @@
+from can_frequency import ReportPeriods, calculate_average_interval
+
+def candump(frames):
+    return ''.join(f"({timestamp:.6f}) can0 {arbitration_id:03X}#00\n" for timestamp, arbitration_id in frames).encode()
+
+def test_last_partial_period_is_printed(capsys):
+    frames = [(10 + i * 0.01, 0x501) for i in range(250)]  # 10.0 .. 12.49 s: two full periods and a partial one
+    tracker = calculate_average_interval([candump(frames)], report_period=1.0)
+    rows = [line.split('|')[0].strip() for line in capsys.readouterr().out.splitlines() if '| 501' in line]
+    assert rows == ['10', '11', '12', 'total']
+    assert tracker.total[0x501].count == 249
+
+def test_report_periods_are_aligned_and_skip_empty_periods():
+    periods = ReportPeriods(0.5)
+    assert periods.label == 'last'
+    labels = [periods.advance(timestamp) if timestamp >= periods.next_time else None
+              for timestamp in (10.2, 10.4, 10.5, 12.1, 12.2)]
+    assert labels == [None, None, '10.000', '10.500', None]
+    assert periods.label == '12.000'
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from can_message_processor import COMMAND_DTYPE, SERVO_DTYPE
+from can_indexed_log import IndexedLogWriter, IndexedLogReader, INDEX_DTYPE, HEADER_SIZE, index_path
+
+INT32 = np.iinfo(np.int32)
+
+def write_log(path: str, chunks, block_rows: int = 100):
+    writer = IndexedLogWriter(path, block_rows)
+    for kind, module_id, rows in chunks:
+        writer.append(kind, module_id, rows)
+    writer.close()
+    return writer
+
+def test_round_trips_bytes_across_blocks(tmp_path, servo_rows):
+    path = str(tmp_path / 'run.canlog')
+    servo = {module_id: servo_rows(1234, seed=module_id) for module_id in (1, 2)}
+    command = np.zeros(250, dtype=COMMAND_DTYPE)
+    command['command_id'] = 0x200
+    command['timestamp'] = 1.7e9 + np.arange(250) * 4e-3
+    command['value'] = np.resize(np.array([INT32.min, INT32.max, -1, 0], dtype=np.int32), 250)
+    chunks = []
+    for start in range(0, 1234, 333):  # Chunks that do not line up with the blocks
+        for module_id, rows in servo.items():
+            chunks.append(('servo_responses', module_id, rows[start:start + 333]))
+    chunks.append(('command', 2, command))
+    writer = write_log(path, chunks)
+    assert writer.records == 2 * 1234 + 250
+
+    with IndexedLogReader(path) as reader:
+        assert reader.modules('servo') == [1, 2]
+        assert reader.modules('command') == [2]
+        for module_id, rows in servo.items():
+            assert reader.servo(module_id).tobytes() == rows.tobytes()
+            assert reader.query_id(0x500 | module_id).tobytes() == rows.tobytes()
+        assert reader.command(2).tobytes() == command.tobytes()
+        assert len(reader.servo(3)) == 0
+
+def test_block_layout_on_disk(tmp_path, servo_rows):
+    path = str(tmp_path / 'run.canlog')
+    write_log(path, [('servo', 1, servo_rows(250))])
+    index = np.fromfile(index_path(path), dtype=INDEX_DTYPE, offset=HEADER_SIZE)
+    assert index['rows'].tolist() == [100, 100, 50]
+    assert index['offset'].tolist() == [HEADER_SIZE + i * 100 * SERVO_DTYPE.itemsize for i in range(3)]
+    # The partial last block is padded to the full block size
+    assert (tmp_path / 'run.canlog').stat().st_size == HEADER_SIZE + 3 * 100 * SERVO_DTYPE.itemsize
+
+def test_time_range_queries(tmp_path, servo_rows):
+    path = str(tmp_path / 'run.canlog')
+    rows = servo_rows(1000, start=100.0)
+    write_log(path, [('servo', 1, rows)])
+    with IndexedLogReader(path) as reader:
+        assert reader.time_range() == (100.0, rows['timestamp'][-1])
+        selected = reader.servo(1, 100.15, 100.4495)
+        expected = rows[(rows['timestamp'] >= 100.15) & (rows['timestamp'] <= 100.4495)]
+        assert selected.tobytes() == expected.tobytes()
+        assert len(reader.servo(1, 200.0)) == 0
+
+@pytest.mark.parametrize('timestamps', [[1.0, np.nan, 1e300, 2.0], [np.nan] * 4, [-1e300, 0.0, -0.0, np.inf]])
+def test_special_timestamps_round_trip(tmp_path, timestamps, servo_rows):
+    path = str(tmp_path / 'run.canlog')
+    rows = servo_rows(8)
+    rows['timestamp'][:4] = timestamps
+    write_log(path, [('servo', 1, rows)], block_rows=4)
+    with IndexedLogReader(path) as reader:
+        assert reader.servo(1).tobytes() == rows.tobytes()
+
+def test_appending_reopens_the_log(tmp_path, servo_rows):
+    path = str(tmp_path / 'run.canlog')
+    rows = servo_rows(300)
+    write_log(path, [('servo', 1, rows[:200])])
+    write_log(path, [('servo', 1, rows[200:])])
+    with IndexedLogReader(path) as reader:
+        assert reader.servo(1).tobytes() == rows.tobytes()
+    with pytest.raises(ValueError):
+        IndexedLogWriter(path, block_rows=50)
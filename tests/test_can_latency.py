@@ -0,0 +1,70 @@
+import pytest
+
+from can_latency import LatencyTracker, COMMAND_ID_BASE, SCHEMA
+
+SERVO = SCHEMA.message('servo')
+POSITION = SCHEMA.message('position')
+SERVO_BASE, POSITION_BASE = SERVO.base_id, POSITION.base_id
+COMMAND = SCHEMA.message('command').pack(0)
+SERVO_DATA = SERVO.pack(0, 0, 0, 0)
+POSITION_DATA = POSITION.pack(0)
+
+def test_single_response_stream_is_not_missing_on_the_other():
+    tracker = LatencyTracker()
+    for i in range(100):
+        tracker.update(COMMAND_ID_BASE | 1, i * 0.001, COMMAND)
+        assert tracker.update(SERVO_BASE | 1, i * 0.001 + 0.0002, SERVO_DATA) == pytest.approx(0.2)
+    stats = tracker.end_period()
+    assert set(stats) == {(1, 'servo')}
+    servo = stats[(1, 'servo')]
+    assert servo.latency.count == 100
+    assert servo.missing == servo.unmatched == servo.timeouts == 0
+
+def test_both_response_streams_are_paired():
+    tracker = LatencyTracker()
+    for i in range(10):
+        tracker.update(COMMAND_ID_BASE | 2, i * 0.001, COMMAND)
+        tracker.update(SERVO_BASE | 2, i * 0.001 + 0.0001, SERVO_DATA)
+        tracker.update(POSITION_BASE | 2, i * 0.001 + 0.0003, POSITION_DATA)
+    stats = tracker.end_period()
+    assert stats[(2, 'servo')].latency.count == 10
+    assert stats[(2, 'position')].latency.count == 10
+    assert stats[(2, 'position')].latency.mean == pytest.approx(0.3)
+    assert all(s.missing == 0 and s.unmatched == 0 for s in stats.values())
+
+def test_missing_response_on_an_active_stream():
+    tracker = LatencyTracker()
+    tracker.update(COMMAND_ID_BASE | 3, 0.0, COMMAND)
+    tracker.update(SERVO_BASE | 3, 0.0001, SERVO_DATA)
+    tracker.update(COMMAND_ID_BASE | 3, 0.001, COMMAND)
+    tracker.update(COMMAND_ID_BASE | 3, 0.002, COMMAND)  # The response to the previous command never came
+    tracker.update(SERVO_BASE | 3, 0.0021, SERVO_DATA)
+    stats = tracker.end_period()[(3, 'servo')]
+    assert stats.missing == 1
+    assert stats.latency.count == 2
+
+def test_response_without_command_is_unmatched():
+    tracker = LatencyTracker()
+    assert tracker.update(SERVO_BASE | 4, 0.0, SERVO_DATA) is None
+    assert tracker.end_period()[(4, 'servo')].unmatched == 1
+
+def test_other_feedback_variants_do_not_answer_commands():
+    other = bytearray(POSITION_DATA)
+    other[POSITION.multiplexor.offset] = 0x15
+    tracker = LatencyTracker()
+    tracker.update(COMMAND_ID_BASE | 5, 0.0, COMMAND)
+    assert tracker.update(POSITION_BASE | 5, 0.0001, bytes(other)) is None
+    assert tracker.update(POSITION_BASE | 5, 0.0004, POSITION_DATA) == pytest.approx(0.4)
+    tracker.update(COMMAND_ID_BASE | 5, 0.001, COMMAND)
+    assert tracker.update(POSITION_BASE | 5, 0.0011, bytes(other)) is None  # Does not close the pending command
+    assert tracker.update(POSITION_BASE | 5, 0.0015, POSITION_DATA) == pytest.approx(0.5)
+    stats = tracker.end_period()
+    assert set(stats) == {(5, 'position')}
+    assert stats[(5, 'position')].latency.count == 2
+    assert stats[(5, 'position')].unmatched == stats[(5, 'position')].missing == 0
+
+def test_malformed_response_is_ignored():
+    tracker = LatencyTracker()
+    tracker.update(COMMAND_ID_BASE | 6, 0.0, COMMAND)
+    assert tracker.update(SERVO_BASE | 6, 0.0001, SERVO_DATA[:8]) is None  # Servo frames are exactly 16 bytes
+    assert tracker.update(SERVO_BASE | 6, 0.0002, SERVO_DATA) == pytest.approx(0.2)
@@ -0,0 +1,31 @@
+from can_message_comparison import compare_messages
+
+def candump(seconds: int, start: float = 1000.0) -> bytes:
+    lines = []
+    for i in range(seconds * 100):
+        timestamp = start + i * 0.01
+        lines.append(f"({timestamp:.6f}) can0 201#0000000000000000\n")
+        lines.append(f"({timestamp:.6f}) can0 501#0000000000000000\n")
+    return ''.join(lines).encode()
+
+def window_rows(output: str):
+    return [line.split('|') for line in output.splitlines() if line[:1].isdigit()]
+
+def test_last_window_is_printed(capsys):
+    compare_messages([candump(3)], window_size=1.0)
+    rows = window_rows(capsys.readouterr().out)
+    assert [row[0].strip() for row in rows] == ['1000', '1001', '1002']
+    assert all(int(row[1]) == int(row[2]) == 100 for row in rows)
+
+def test_empty_input_prints_no_window(capsys):
+    compare_messages([b''], window_size=1.0)
+    assert window_rows(capsys.readouterr().out) == []
+
+def test_stray_line_inside_a_block_keeps_the_windows(capsys):
+    lines = candump(3).splitlines(keepends=True)
+    # The stray line sits inside window 1001, where bisect probes first
+    lines.insert(len(lines) // 2, b"candump: interface can0 went down\n")
+    compare_messages([b''.join(lines)], window_size=1.0)
+    rows = window_rows(capsys.readouterr().out)
+    assert [row[0].strip() for row in rows] == ['1000', '1001', '1002']
+    assert all(int(row[1]) == int(row[2]) == 100 for row in rows)
@@ -0,0 +1,50 @@
+import struct
+
+import numpy as np
+
+from candump_log import Frame
+from can_message_processor import CANMessageProcessor, frames_to_arrays, SERVO_STRUCT, COMMAND_STRUCT
+
+def servo_frame(module_id: int, timestamp: float, current: int, data: bytes = None) -> Frame:
+    if data is None:
+        data = SERVO_STRUCT.pack(current, -current, current * 3, current & 0xFFFF)
+    return Frame(timestamp, 'can0', 0x500 | module_id, data, True, False)
+
+def command_frame(module_id: int, timestamp: float, value: int) -> Frame:
+    return Frame(timestamp, 'can0', 0x200 | module_id, COMMAND_STRUCT.pack(value) + b'\0' * 4, True, False)
+
+def test_servo_batch_matches_per_message_decoding():
+    frames = [servo_frame(1 + i % 7, i * 0.001, i - 500) for i in range(1000)]
+    frames[10] = servo_frame(4, 0.010, 0, b'\1' * 8)  # Wrong length: skipped by both paths
+    frames[20] = servo_frame(5, 0.020, 0, b'\1' * 20)
+    single, batch = CANMessageProcessor(), CANMessageProcessor()
+    for frame in frames:
+        single.process_servo_message(frame)
+    batch.process_servo_batch(frames[:500])
+    batch.process_servo_batch(frames[500:])
+    assert sorted(batch.servo_responses) == sorted(single.servo_responses)
+    for module_id, buffer in single.servo_responses.items():
+        assert batch.servo_responses[module_id].view().tobytes() == buffer.view().tobytes()
+
+def test_command_batch_matches_per_message_decoding():
+    frames = [command_frame(1 + i % 3, i * 0.001, (i - 50) * 100000) for i in range(100)]
+    single, batch = CANMessageProcessor(), CANMessageProcessor()
+    for frame in frames:
+        single.process_command_message(frame)
+    decoded = batch.process_command_batch(frames)
+    for module_id, buffer in single.command_responses.items():
+        assert decoded[module_id].tobytes() == buffer.view().tobytes()
+
+def test_frames_to_arrays_drops_short_and_truncates_long_payloads():
+    frames = [(0x201, 1.0, b'\1\2\3\4'), (0x202, 2.0, b'\5\6'), (0x203, 3.0, bytearray(b'\7\10\11\12\13'))]
+    ids, timestamps, payloads = frames_to_arrays(frames, 4)
+    assert ids.tolist() == [0x201, 0x203]
+    assert timestamps.tolist() == [1.0, 3.0]
+    assert payloads == b'\1\2\3\4\7\10\11\12'
+    ids, timestamps, payloads = frames_to_arrays(iter(frames), 4, exact=True)
+    assert ids.tolist() == [0x201] and payloads == b'\1\2\3\4'
+
+def test_frames_to_arrays_empty():
+    ids, timestamps, payloads = frames_to_arrays([], 16)
+    assert len(ids) == len(timestamps) == 0 and payloads == b''
+    assert CANMessageProcessor().process_servo_batch([]) == {}
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from can_metrics import Histogram, MetricsRegistry, Reporter, id_labels
+
+def test_histogram_buckets_include_their_upper_bound():
+    histogram = Histogram('latency', 'test', buckets=(1, 2, 5))
+    for value in (0.5, 1, 1.5, 2, 5, 7):
+        histogram.observe(value)
+    assert histogram.counts == [2, 2, 1, 1]
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(1.0) == float('inf')
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+    assert samples[('latency_bucket', '{le="1"}')] == 2
+    assert samples[('latency_bucket', '{le="5"}')] == 5
+    assert samples[('latency_bucket', '{le="+Inf"}')] == 6
+    assert samples[('latency_sum', '')] == pytest.approx(17.0)
+    assert samples[('latency_count', '')] == 6
+
+def test_empty_histogram_has_no_quantile():
+    assert Histogram('empty', 'test').quantile(0.99) is None
+
+def test_counter_keys_become_labels_when_rendered():
+    registry = MetricsRegistry()
+    counter = registry.counter('frames_total', 'Frames', ('id',), key_labels=id_labels)
+    counter.inc(3, 0x501)
+    counter.inc(2, 0x201)
+    counter.inc(1, 0x501)
+    assert counter.total() == 6
+    text = registry.render_prometheus()
+    assert '# TYPE frames_total counter' in text
+    assert 'frames_total{id="0x201"} 2' in text
+    assert 'frames_total{id="0x501"} 4' in text
+    assert registry.snapshot() == {'frames_total': {'0x201': 2, '0x501': 4}}
+
+def test_reporter_prints_the_summary_and_appends_json(tmp_path, capsys):
+    registry = MetricsRegistry()
+    registry.counter('frames_total', 'Frames').inc(5)
+    registry.gauge('queued', 'Queued frames', lambda: 7)
+    path = tmp_path / 'metrics.jsonl'
+    elapsed = []
+    reporter = Reporter(registry, lambda seconds: elapsed.append(seconds) or 'summary line', interval=3600,
+                        json_path=str(path))
+    reporter.poll()  # Not due yet
+    assert capsys.readouterr().out == ''
+    reporter.report()
+    reporter.report()
+    reporter.close()
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2 and all(line.endswith('] summary line') for line in lines)
+    assert len(elapsed) == 2 and all(seconds >= 0 for seconds in elapsed)
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(record['frames_total'], record['queued']) for record in records] == [(5, 7), (5, 7)]
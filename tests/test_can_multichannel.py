@@ -0,0 +1,67 @@
+import pytest
+
+from candump_log import Frame
+from can_multichannel import SharedColumnRing, ChannelMerger, RUNNING, FINISHED
+
+@pytest.fixture
+def rings():
+    created = []
+
+    def make(count: int, capacity: int = 64):
+        for _ in range(count):
+            ring = SharedColumnRing.create(capacity)
+            ring.header['state'] = RUNNING
+            created.append(ring)
+        return created[-count:]
+    yield make
+    for ring in created:
+        ring.close()
+
+def frames(timestamps, arbitration_id: int = 0x501):
+    return [Frame(timestamp, 'can0', arbitration_id, bytes([index % 256]) * (1 + index % 8), True, False)
+            for index, timestamp in enumerate(timestamps)]
+
+def test_interleaved_channels_are_merged_in_time_order(rings):
+    first, second = rings(2)
+    first.write(frames([i * 0.002 for i in range(20)], 0x501))
+    second.write(frames([i * 0.002 + 0.001 for i in range(20)], 0x502))
+    first.header['watermark'] = second.header['watermark'] = 1.0
+    rows = ChannelMerger([first, second]).poll()
+    assert rows['timestamp'].tolist() == sorted(rows['timestamp'].tolist())
+    assert len(rows['timestamp']) == 40
+    assert rows['channel'].tolist() == [0, 1] * 20
+    assert rows['arbitration_id'].tolist() == [0x501, 0x502] * 20
+    assert rows['length'][:4].tolist() == [1, 1, 2, 2]
+    assert rows['data'][2, :2].tolist() == [1, 1]
+
+def test_stalled_channel_holds_back_the_watermark(rings):
+    first, second = rings(2)
+    merger = ChannelMerger([first, second])
+    first.write(frames([i * 0.01 for i in range(10)]))
+    first.header['watermark'] = 0.09
+    second.write(frames([0.005]))
+    second.header['watermark'] = 0.025  # Stalled: nothing newer than this has been read from its socket
+    rows = merger.poll()
+    assert rows['timestamp'].tolist() == [0.0, 0.005, 0.01, 0.02]
+    assert merger.backlog() == 7
+    assert merger.poll() is None
+    second.header['state'] = FINISHED  # A stopped channel no longer holds the others back
+    rows = merger.poll()
+    assert rows['timestamp'].tolist() == [i * 0.01 for i in range(3, 10)]
+    assert merger.backlog() == 0
+    assert merger.merged == 11
+
+def test_full_ring_drops_the_newest_frames(rings):
+    ring, = rings(1, capacity=8)
+    assert ring.write(frames([i * 0.001 for i in range(12)])) == 8
+    assert int(ring.header['ring_drops']) == 4
+    assert ring.pending() == 8
+    assert ring.read()['timestamp'].tolist() == [i * 0.001 for i in range(8)]
+    # The indices keep growing, so the next rows wrap around the end of the columns
+    assert ring.write(frames([0.1 + i * 0.001 for i in range(6)])) == 6
+    assert ring.write(frames([0.2 + i * 0.001 for i in range(4)])) == 2
+    assert int(ring.header['ring_drops']) == 6
+    rows = ring.read()
+    assert rows['timestamp'].tolist() == [0.1 + i * 0.001 for i in range(6)] + [0.2, 0.201]
+    assert rows['length'].tolist() == [1, 2, 3, 4, 5, 6, 1, 2]
+    assert ring.pending() == 0
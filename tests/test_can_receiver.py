@@ -0,0 +1,89 @@
+import errno
+import socket
+import struct
+
+import can_receiver
+from can_receiver import (BatchReceiver, SO_TIMESTAMPING, SO_TIMESTAMPNS, SO_RXQ_OVFL, TIMESPEC_STRUCT,
+                          OVERFLOW_STRUCT, ANCILLARY_SIZE, MSG_CTRUNC)
+
+class FakeBus:
+    channel = 'can0'
+
+class FakeSocket:
+    """Returns the queued (data, ancdata[, flags]) messages from recvmsg(), then EAGAIN."""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    def recvmsg(self, bufsize, ancbufsize, flags):
+        if not self.messages:
+            raise OSError(errno.EAGAIN, 'no data')
+        data, ancdata, *flags = self.messages.pop(0)
+        return data, ancdata, flags[0] if flags else 0, None
+
+def can_frame(arbitration_id: int) -> bytes:
+    return struct.pack('=IBB2x8s', arbitration_id, 8, 0, b'\0' * 8)
+
+def timestamping(software: float, hardware: float) -> tuple:
+    def timespec(value):
+        return TIMESPEC_STRUCT.pack(int(value), int(round(value % 1 * 1e9)))
+    return socket.SOL_SOCKET, SO_TIMESTAMPING, timespec(software) + timespec(0) + timespec(hardware)
+
+def receiver_for(messages, monkeypatch, source: str) -> BatchReceiver:
+    monkeypatch.setattr(can_receiver.select, 'select', lambda r, w, x, timeout: (r, w, x))
+    receiver = BatchReceiver(FakeBus())
+    receiver.socket = FakeSocket(messages)
+    receiver.stats.timestamp_source = source
+    return receiver
+
+def test_zero_hardware_timestamp_falls_back_and_is_not_reported_as_hardware(monkeypatch):
+    messages = [(can_frame(0x501), [timestamping(100.5, 0)]) for _ in range(3)]
+    receiver = receiver_for(messages, monkeypatch, 'hardware requested')
+    frames = receiver.recv_batch(0)
+    assert [frame.timestamp for frame in frames] == [100.5] * 3
+    assert receiver.stats.hardware_timestamps == 0
+    assert receiver.stats.kernel_timestamps == 3
+    assert receiver.timestamps_used() == 'kernel (hardware requested, none received)'
+
+def test_hardware_timestamps_are_counted(monkeypatch):
+    messages = [(can_frame(0x501), [timestamping(100.5, 7.25)]),
+                (can_frame(0x502), [timestamping(100.6, 0)])]
+    receiver = receiver_for(messages, monkeypatch, 'hardware requested')
+    frames = receiver.recv_batch(0)
+    assert [frame.timestamp for frame in frames] == [7.25, 100.6]
+    assert receiver.timestamps_used() == 'hardware 1, kernel 1'
+
+def test_frames_without_ancillary_data_use_the_local_clock(monkeypatch):
+    nanoseconds = (socket.SOL_SOCKET, SO_TIMESTAMPNS, TIMESPEC_STRUCT.pack(5, 0))
+    receiver = receiver_for([(can_frame(0x201), [nanoseconds]), (can_frame(0x201), [])], monkeypatch, 'kernel')
+    frames = receiver.recv_batch(0)
+    assert frames[0].timestamp == 5.0
+    assert receiver.timestamps_used() == 'kernel 1, local clock 1'
+
+def test_all_control_messages_fit_in_the_buffer():
+    sizes = [socket.CMSG_SPACE(TIMESPEC_STRUCT.size), socket.CMSG_SPACE(3 * TIMESPEC_STRUCT.size),
+             socket.CMSG_SPACE(OVERFLOW_STRUCT.size)]
+    assert ANCILLARY_SIZE >= sum(sizes)
+
+def test_both_timestamp_messages_and_overflow_give_one_timestamp(monkeypatch):
+    nanoseconds = (socket.SOL_SOCKET, SO_TIMESTAMPNS, TIMESPEC_STRUCT.pack(100, 500000000))
+    overflow = (socket.SOL_SOCKET, SO_RXQ_OVFL, OVERFLOW_STRUCT.pack(7))
+    messages = [(can_frame(0x501), [nanoseconds, timestamping(100.5, 7.25), overflow]),
+                (can_frame(0x502), [nanoseconds, timestamping(100.5, 0), overflow])]
+    receiver = receiver_for(messages, monkeypatch, 'hardware requested')
+    frames = receiver.recv_batch(0)
+    assert [frame.timestamp for frame in frames] == [7.25, 100.5]
+    assert receiver.stats.hardware_timestamps == 1
+    assert receiver.stats.kernel_timestamps == 1
+    assert receiver.stats.kernel_drops == 7
+    assert receiver.stats.truncated_control == 0
+
+def test_truncated_control_data_is_counted_and_does_not_raise(monkeypatch):
+    nanoseconds = (socket.SOL_SOCKET, SO_TIMESTAMPNS, TIMESPEC_STRUCT.pack(100, 0))
+    truncated = (socket.SOL_SOCKET, SO_TIMESTAMPING, TIMESPEC_STRUCT.pack(100, 0) + b'\0' * 4)
+    receiver = receiver_for([(can_frame(0x501), [nanoseconds, truncated], MSG_CTRUNC)], monkeypatch,
+                            'hardware requested')
+    frames = receiver.recv_batch(0)
+    assert [frame.timestamp for frame in frames] == [100.0]
+    assert receiver.stats.truncated_control == 1
+    assert receiver.stats.kernel_timestamps == 1
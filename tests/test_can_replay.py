@@ -0,0 +1,38 @@
+from candump_log import format_candump_line, read_candump_log
+from can_message_processor import CANMessageProcessor, COMMAND, SERVO
+from can_replay import replay_to_processor
+
+def write_log(path: str):
+    lines = []
+    for i in range(500):
+        timestamp = 1000 + i * 1e-3
+        module_id = 1 + i % 4
+        lines.append(format_candump_line(timestamp, 'can0', COMMAND.arbitration_id(module_id), COMMAND.pack(i * 7),
+                                         True, False))
+        data = SERVO.pack(i, -i, 3 * i, i % 2)
+        if i % 50 == 0:
+            data = data[:8]  # Short servo payload: dropped by both paths
+        lines.append(format_candump_line(timestamp + 2e-4, 'can0', SERVO.arbitration_id(module_id), data, True, False))
+        lines.append(format_candump_line(timestamp + 3e-4, 'can0', 0x101, bytes(8), True, False))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def test_replay_matches_per_message_processing(tmp_path):
+    path = str(tmp_path / 'run.log')
+    write_log(path)
+    replayed = CANMessageProcessor()
+    assert replay_to_processor(path, replayed, batch_size=37) == 1500
+
+    expected = CANMessageProcessor()
+    for frame in read_candump_log(path):
+        if COMMAND.matches(frame.arbitration_id):
+            expected.process_command_message(frame)
+        elif SERVO.matches(frame.arbitration_id):
+            expected.process_servo_message(frame)
+
+    for kind in ('command_responses', 'servo_responses'):
+        replayed_buffers, expected_buffers = getattr(replayed, kind), getattr(expected, kind)
+        assert sorted(replayed_buffers) == sorted(expected_buffers) == [1, 2, 3, 4]
+        for module_id, buffer in expected_buffers.items():
+            assert replayed_buffers[module_id].view().tobytes() == buffer.view().tobytes()
+    assert sum(len(buffer.view()) for buffer in replayed.servo_responses.values()) == 490
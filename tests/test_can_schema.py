@@ -0,0 +1,71 @@
+import json
+
+from candump_log import Frame
+from can_schema import SchemaDecoder, default_decoder, load_schema
+
+DECODER = default_decoder()
+SCHEMA = DECODER.schema
+POSITION = SCHEMA.message('position')
+SERVO = SCHEMA.message('servo')
+COMMAND = SCHEMA.message('command')
+
+def test_multiplexed_variant_is_selected_by_the_frame_type():
+    data = POSITION.pack(-123456)
+    assert data[POSITION.multiplexor.offset] == 0x14
+    message, values = DECODER.decode(0x103, data)
+    assert message is POSITION
+    assert values == (-123456,)
+    assert message.module_id(0x103) == 3
+
+def test_unknown_variant_id_and_length_return_none():
+    other = bytearray(POSITION.pack(1))
+    other[POSITION.multiplexor.offset] = 0x15
+    assert DECODER.decode(0x103, bytes(other)) is None
+    assert DECODER.decode(0x103, b'\0') is None  # Too short to hold the multiplexor
+    assert DECODER.decode(0x7FF, b'\0' * 8) is None
+    assert DECODER.decode(0x501, SERVO.pack(1, 2, 3, 4)[:8]) is None  # Servo frames are exactly 16 bytes
+
+def test_decode_batch_agrees_with_decode():
+    frames = []
+    for i in range(200):
+        module_id = 1 + i % 7
+        timestamp = i * 1e-3
+        frames.append(Frame(timestamp, 'can0', SERVO.arbitration_id(module_id), SERVO.pack(i, -i, 3 * i, i % 3),
+                            True, False))
+        frames.append(Frame(timestamp, 'can0', COMMAND.arbitration_id(module_id), COMMAND.pack(i * 1000) + b'\0' * 4,
+                            True, False))
+        data = bytearray(POSITION.pack(-i))
+        if i % 5 == 0:
+            data[POSITION.multiplexor.offset] = 0x15  # Unknown variant: skipped by both
+        frames.append(Frame(timestamp, 'can0', POSITION.arbitration_id(module_id), bytes(data), True, False))
+    frames.append(Frame(1.0, 'can0', 0x7FF, b'\0', False, False))
+
+    expected = {}
+    for frame in frames:
+        decoded = DECODER.decode(frame.arbitration_id, frame.data)
+        if decoded is not None:
+            expected.setdefault(decoded[0].name, []).append((frame.arbitration_id, frame.timestamp, decoded[1]))
+    batch = DECODER.decode_batch(frames)
+    assert set(batch) == set(expected) == {'servo', 'command', 'position'}
+    for name, (ids, timestamps, rows) in batch.items():
+        message = SCHEMA.message(name)
+        assert ids.tolist() == [entry[0] for entry in expected[name]]
+        assert timestamps.tolist() == [entry[1] for entry in expected[name]]
+        assert rows.dtype.names == message.names
+        assert rows.tolist() == [entry[2] for entry in expected[name]]
+    assert len(batch['position'][0]) == 160
+
+def test_earlier_messages_take_precedence_over_large_ranges(tmp_path):
+    path = tmp_path / 'schema.json'
+    path.write_text(json.dumps({'messages': [
+        {'name': 'exact', 'id': '0x123', 'fields': [{'name': 'a', 'offset': 0, 'type': 'u1'}]},
+        {'name': 'extended', 'id': '0x10000000', 'mask': '0x10000000',
+         'fields': [{'name': 'b', 'offset': 0, 'type': 'u2'}]},
+    ]}))
+    decoder = SchemaDecoder(load_schema(str(path)))
+    assert decoder.decode(0x123, b'\7')[0].name == 'exact'
+    assert decoder.decode(0x1234567, b'\1\0') is None
+    message, values = decoder.decode(0x11234567, b'\1\2')
+    assert message.name == 'extended' and values == (0x201,)
+    _, _, rows = decoder.decode_batch([Frame(0.0, 'can0', 0x11234567, b'\1\2', False, True)])['extended']
+    assert rows['b'].tolist() == [0x201]
@@ -0,0 +1,78 @@
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from can_message_processor import CANMessageProcessor
+from can_stream_writer import StreamingCSVWriter
+
+class BlockedWriter(StreamingCSVWriter):
+    """Writer whose thread waits for `release` before writing, keeping the records instead of CSV files."""
+
+    def __init__(self, *args, **kwargs):
+        self.release = threading.Event()
+        self.timestamps = []
+        super().__init__(*args, **kwargs)
+
+    def write_chunk(self, chunk):
+        self.release.wait()
+        super().write_chunk(chunk)
+
+    def _write(self, kind, module_id, rows):
+        self.timestamps.extend(rows['timestamp'].tolist())
+        self.written_frames += len(rows)
+
+def add_commands(processor: CANMessageProcessor, start: int, count: int):
+    processor.process_command_batch([(0x201, float(i), b'\0' * 4) for i in range(start, start + count)])
+
+def test_oldest_chunks_are_dropped_when_the_queue_is_full(tmp_path):
+    processor = CANMessageProcessor()
+    writer = BlockedWriter(processor, str(tmp_path), max_queued_frames=250)
+    for chunk in range(10):
+        add_commands(processor, chunk * 100, 100)
+        writer.flush()
+    assert writer.queued_frames <= 250
+    writer.release.set()
+    writer.close()
+    # The first chunk may already be held by the writer thread; everything after it is the newest chunks
+    kept = np.array(writer.timestamps)
+    assert writer.dropped_frames + writer.written_frames == 1000
+    assert writer.dropped_frames >= 700
+    assert kept[-200:].tolist() == list(map(float, range(800, 1000)))
+
+def test_nothing_is_dropped_while_the_writer_keeps_up(tmp_path):
+    processor = CANMessageProcessor()
+    writer = BlockedWriter(processor, str(tmp_path), max_queued_frames=250)
+    writer.release.set()
+    for chunk in range(10):
+        add_commands(processor, chunk * 100, 100)
+        writer.flush()
+        while writer.queued_frames:
+            time.sleep(0.001)
+    writer.close()
+    assert writer.dropped_frames == 0
+    assert writer.timestamps == list(map(float, range(1000)))
+
+class FailingWriter(BlockedWriter):
+    """Writer whose thread fails on the second chunk with an error that is not an OSError."""
+
+    def _write(self, kind, module_id, rows):
+        if self.written_frames:
+            raise ValueError('cannot format records')
+        super()._write(kind, module_id, rows)
+
+def test_writer_error_is_raised_from_close(tmp_path, capsys):
+    processor = CANMessageProcessor()
+    writer = FailingWriter(processor, str(tmp_path))
+    for chunk in range(5):
+        add_commands(processor, chunk * 100, 100)
+        writer.flush()
+    writer.release.set()
+    with pytest.raises(ValueError) as raised:
+        writer.close()
+    assert writer.error is raised.value
+    assert not writer.thread.is_alive()
+    assert writer.written_frames == 100
+    assert writer.dropped_frames == 400
+    assert 'Dropped 400 records' in capsys.readouterr().out
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from can_indexed_log import IndexedLogWriter
+from can_message_processor import COMMAND_DTYPE, SERVO_DTYPE
+from can_tracking import TrackingConfig, analyze_module, COMMAND_SCALE
+
+STEP_TIME = 0.2
+STEP_SIZE = 10.0  # Degrees
+RISE_TIME = 0.05  # Ramp from 0 to the peak
+PEAK = 12.0  # 20% overshoot
+SETTLE_TIME = 0.3  # The position drops onto the target here
+
+def position_at(t: np.ndarray) -> np.ndarray:
+    ramp = np.clip((t - STEP_TIME) / RISE_TIME, 0.0, 1.0) * PEAK
+    return np.where(t >= SETTLE_TIME, STEP_SIZE, ramp)
+
+def write_step_log(path: str):
+    """Commands at 100 Hz until 0.49 s, servo samples at 1 kHz (half a period off) until 0.6 s."""
+    commands = np.zeros(50, dtype=COMMAND_DTYPE)
+    commands['timestamp'] = np.arange(50) * 0.01
+    commands['value'] = np.where(commands['timestamp'] >= STEP_TIME, round(STEP_SIZE / COMMAND_SCALE), 0)
+    servos = np.zeros(600, dtype=SERVO_DTYPE)
+    servos['timestamp'] = np.arange(600) * 1e-3 + 5e-4
+    servos['position'] = np.round(position_at(servos['timestamp']) / COMMAND_SCALE)
+    writer = IndexedLogWriter(path, block_rows=64)
+    writer.append('command', 1, commands)
+    writer.append('servo', 1, servos)
+    writer.close()
+    return servos
+
+@pytest.fixture
+def step_log(tmp_path):
+    path = str(tmp_path / 'step.canlog')
+    return path, write_step_log(path)
+
+def test_step_overshoot_and_settling_time(step_log):
+    path, _ = step_log
+    _, summary, rows = analyze_module(path, 1, TrackingConfig(window=1.0))
+    assert summary['steps'] == summary['settled_steps'] == 1
+    assert summary['max_overshoot_pct'] == pytest.approx(100 * (PEAK - STEP_SIZE) / STEP_SIZE)
+    # The last sample outside the settling band is the last one at the peak, just before SETTLE_TIME
+    assert summary['max_settling_time'] == pytest.approx(SETTLE_TIME - 5e-4 - STEP_TIME)
+    assert len(rows) == 1 and rows['steps'][0] == 1
+
+def test_as_of_join_uses_the_latest_command_within_its_age(step_log):
+    path, servos = step_log
+    _, summary, _ = analyze_module(path, 1, TrackingConfig(window=1.0, max_command_age=0.05))
+    # Commands stop at 0.49 s, so the samples after 0.54 s are too far from one
+    timestamps = servos['timestamp']
+    matched = timestamps - 0.49 <= 0.05
+    assert summary['unmatched'] == np.count_nonzero(~matched) == 60
+    assert summary['samples'] == 540
+    # Before the step the target is 0; right after it the target is already STEP_SIZE
+    targets = np.where(np.floor(timestamps / 0.01) * 0.01 >= STEP_TIME - 1e-9, STEP_SIZE, 0.0)
+    errors = (targets - servos['position'] * COMMAND_SCALE)[matched]
+    assert summary['max_abs_error'] == pytest.approx(np.abs(errors).max())
+    assert summary['rms_error'] == pytest.approx(np.sqrt(np.mean(errors ** 2)))
+
+def test_results_do_not_depend_on_the_chunk_size(step_log):
+    path, _ = step_log
+    _, whole, whole_rows = analyze_module(path, 1, TrackingConfig(window=0.1, chunk_seconds=60))
+    _, chunked, chunked_rows = analyze_module(path, 1, TrackingConfig(window=0.1, chunk_seconds=0.1))
+    assert chunked == pytest.approx(whole, nan_ok=True)
+    for name in chunked_rows.dtype.names:
+        np.testing.assert_allclose(chunked_rows[name], whole_rows[name], equal_nan=True)
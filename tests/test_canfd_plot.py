@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pytest
+
+from canfd_plot import SharedAngleRing
+from can_schema import default_schema
+
+COMMAND_ID = default_schema().message('command').arbitration_id(1)
+
+@pytest.fixture
+def ring():
+    ring = SharedAngleRing.create(f'test_ring_{os.getpid()}', modules=1, capacity=10)
+    yield ring
+    ring.close()
+
+def samples(start: int, count: int) -> np.ndarray:
+    index = np.arange(start, start + count, dtype=np.float64)
+    return np.column_stack((index, index * 10))
+
+def assert_consistent(timestamps: np.ndarray, values: np.ndarray):
+    assert np.all(np.diff(timestamps) > 0)
+    assert values.tolist() == (timestamps * 10).tolist()
+
+def test_window_after_wrap_around(ring):
+    series = ring.series[COMMAND_ID]
+    ring._append(series, samples(0, 7))
+    ring._append(series, samples(7, 9))
+    timestamps, values = ring.window(COMMAND_ID, -1.0)
+    assert timestamps.tolist() == list(map(float, range(6, 16)))
+    assert_consistent(timestamps, values)
+    assert ring.window(COMMAND_ID, 12.5)[0].tolist() == [13.0, 14.0, 15.0]
+    assert ring.version(COMMAND_ID) == 16
+
+def test_read_during_a_batch_drops_the_samples_being_overwritten(ring):
+    series = ring.series[COMMAND_ID]
+    ring._append(series, samples(0, 16))
+    # The writer has reserved a batch of 5 and stored 3 timestamps, no values, when the reader copies
+    ring.reserved[series] = 21
+    positions = np.arange(16, 19) % ring.capacity
+    ring.timestamps[series, positions] = np.arange(16, 19)
+    ring.timestamps[series, positions + ring.capacity] = np.arange(16, 19)
+    timestamps, values = ring.window(COMMAND_ID, -1.0)
+    assert timestamps.tolist() == list(map(float, range(11, 16)))
+    assert_consistent(timestamps, values)
+
+def test_read_during_a_full_capacity_batch_returns_nothing_torn(ring):
+    series = ring.series[COMMAND_ID]
+    ring._append(series, samples(0, 10))
+    ring.reserved[series] = 20
+    ring.timestamps[series, :4] = np.arange(10, 14)
+    timestamps, values = ring.window(COMMAND_ID, -1.0)
+    assert len(timestamps) == len(values) == 0